@@ -1,83 +1,92 @@
-import re
-from datetime import datetime
+import os
+import sys
+from array import array
+from contextlib import closing
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'program file', 'cdi'))
+from pktparse import iter_packet_events, US_PER_SEC
+from streaming import StreamCorrelator, iter_closed
+from latency import summarize, summary_rows, write_summary_tables, percentile_label, DEFAULT_PERCENTILES
+from textenc import detect_encoding, iter_raw_lines
 
 # 定义日志文件路径和输出文件路径
 log_file_path = r"D:\Desktop\日志\38\a5_HTZQ_to_spx_1938_KbdSvrPacket_20240927_12.txt"
 output_file_path = r'D:\Desktop\日志\38\output.txt'
 summary_file_path = r'D:\Desktop\日志\38\汇总统计.txt'
+# 也可在命令行指定: python log_collect.py 日志文件 输出文件 汇总文件
+if len(sys.argv) > 3:
+    log_file_path, output_file_path, summary_file_path = sys.argv[1:4]
+
+# 流式关联的空闲超时（秒，日志时间）：大于 0 时 pktid 空闲超时即统计并释放，内存只与在途请求数相关
+# 为 0 时只在同一 pktid 的下一个 AfterGet 到来或文件结束时统计
+idle_timeout = 0
+
+# 汇总统计输出的耗时分位数
+percentiles = DEFAULT_PERCENTILES
+
+# 日志编码，为空时从文件头、尾和中间几处抽样自动识别
+log_encoding = ''
+
+
+# 每个 AfterGet 与其后、同一 pktid 下一个 AfterGet 之前的 Put/ReplyNull 配成一笔请求，逐笔产出
+# (func, [AfterGet 时间戳], 应答数, 最后一个 Put 时间戳)；pktid 被复用时早先的请求不会配上很久以后的应答，
+# 每个事件都是常数时间处理。第一个 AfterGet 之前的应答为孤立应答，不计入应答量
+correlator = StreamCorrelator(idle_timeout if idle_timeout > 0 else None, pair=True)
+
 
-# 创建一个字典来存储每个 pktid 的所有时间戳
-pktid_times = {}
-
-# 读取日志文件，并使用 GB2312 编码，同时处理可能的编码错误
-with open(log_file_path, 'r', encoding='gb2312', errors='replace') as file:
-    for line in file:
-        # 使用正则表达式匹配日志行中的信息
-        match = re.search(
-            r'(\d{8} \d{2}:\d{2}:\d{2}\.\d{6}) \[WritePacket\]KSvrComm (AfterGet|Put|ReplyNull)\[pktid\((\d+)\)\], func: ?(\d+),.*',
-            line)
-        if match:
-            timestamp_str, operation, pktid_str, func_str = match.groups()
-            # 解析时间戳
-            timestamp = datetime.strptime(timestamp_str, '%Y%m%d %H:%M:%S.%f')
-            pktid = int(pktid_str)
-            func = int(func_str)
-
-            # 如果这个 pktid 还没有被记录过，则初始化一个新的列表
-            if pktid not in pktid_times:
-                pktid_times[pktid] = {'func': func, 'AfterGet': [], 'Put': []}
-
-            # 将当前的时间戳和操作类型添加到对应的 pktid 列表中
-            if operation == 'AfterGet':
-                pktid_times[pktid]['AfterGet'].append(timestamp)
-            elif operation in ['Put', 'ReplyNull']:
-                pktid_times[pktid]['Put'].append(timestamp)
-
-# 创建一个字典来存储每种功能的统计信息
+def iter_pktid_entries(file):
+    for pktid, (func, afterget, put_count, _, _, last_put) in iter_closed(iter_packet_events(file), correlator):
+        yield func, afterget, put_count, last_put
+
+
+# 创建一个字典来存储每种功能的统计信息，耗时按 (功能, 耗时) 追加到两列中，最后统一分组汇总
 func_stats = {}
+latency_funcs = array('q')
+latency_values = array('d')
 
+# 编码兼容 ASCII（GBK/UTF-8 等）时以二进制方式读取日志文件，所需字段均为 ASCII，无需逐行解码；UTF-16 等先转码
 # 遍历所有的 pktid 和它们的时间戳列表
-for pktid, entries in pktid_times.items():
-    afterget_timestamps = entries['AfterGet']
-    put_timestamps = entries['Put']
-    func = entries['func']
-
-    if func not in func_stats:
-        func_stats[func] = {
-            'durations': [],
-            'request_count': 0,
-            'response_count': 0
-        }
-
-    # 增加请求计数
-    func_stats[func]['request_count'] += len(afterget_timestamps)
-    # 增加响应计数
-    func_stats[func]['response_count'] += len(put_timestamps)
-
-    if put_timestamps:
-        # 找到最后一个 Put 时间戳
-        last_put_time = max(put_timestamps)
-
-        # 计算每个 AfterGet 到最后一个 Put 之间的时间差
-        for afterget_time in afterget_timestamps:
-            time_diff = (last_put_time - afterget_time).total_seconds()
-            func_stats[func]['durations'].append(time_diff)
-
-# 汇总统计信息
+with closing(iter_raw_lines(log_file_path, log_encoding or detect_encoding(log_file_path))) as log_lines:
+    for func, afterget_timestamps, put_count, last_put_time in iter_pktid_entries(log_lines):
+        if func not in func_stats:
+            func_stats[func] = {
+                'request_count': 0,
+                'response_count': 0
+            }
+
+        # 增加请求计数
+        func_stats[func]['request_count'] += len(afterget_timestamps)
+        # 增加响应计数
+        func_stats[func]['response_count'] += put_count
+
+        if put_count:
+            # 计算每个 AfterGet 到最后一个 Put 之间的时间差
+            for afterget_time in afterget_timestamps:
+                time_diff = (last_put_time - afterget_time) / US_PER_SEC
+                latency_funcs.append(func)
+                latency_values.append(time_diff)
+
+print(f"请求 {correlator.closed_count} 笔，pktid 复用 {correlator.reused_pktids} 次，孤立应答 {correlator.orphan_replies} 个")
+
+# 汇总统计信息：最大/最小/平均耗时、标准差和分位数
+latency = summarize(np.frombuffer(latency_funcs, dtype=np.int64), np.frombuffer(latency_values, dtype=np.float64), percentiles)
+empty = {'count': 0, 'min': 0, 'max': 0, 'mean': 0, 'std': 0, 'percentiles': [0] * len(percentiles)}
+for func, stats in func_stats.items():
+    stats.update(latency.get(func, empty))
+
 with open(summary_file_path, 'w', encoding='gb2312') as summary_file:
     for func, stats in func_stats.items():
-        durations = stats['durations']
         request_count = stats['request_count']
         response_count = stats['response_count']
+        tail = ''.join(f", {percentile_label(p)}: {value:.6f}s" for p, value in zip(percentiles, stats['percentiles']))
 
-        if durations:
-            max_duration = max(durations)
-            min_duration = min(durations)
-            avg_duration = sum(durations) / len(durations)
-        else:
-            max_duration = min_duration = avg_duration = 0
+        summary_file.write(f"功能: {func}, 最大耗时: {stats['max']:.6f}s, 最小耗时: {stats['min']:.6f}s, 平均耗时: {stats['mean']:.6f}s, "
+                           f"请求量: {request_count}, 应答量: {response_count}, 标准差: {stats['std']:.6f}s{tail}\n")
 
-        summary_file.write(f"功能: {func}, 最大耗时: {max_duration:.6f}s, 最小耗时: {min_duration:.6f}s, 平均耗时: {avg_duration:.6f}s, 请求量: {request_count}, 应答量: {response_count}\n")
+write_summary_tables(os.path.splitext(summary_file_path)[0],
+                     summary_rows(func_stats, percentiles, ('request_count', 'response_count')))
 
 print(f"Results have been saved to {output_file_path}")
 print(f"Summary statistics have been saved to {summary_file_path}")
\ No newline at end of file
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# cdi/basic/AES.py 的吞吐测试：逐条 encrypt_password/decrypt_password 与批量 encrypt_values/decrypt_values（cfb、gcm）的每秒条数，
+# 文件加解密（cfb、gcm）的 MB/s，以及 derive_key 首次与缓存命中的耗时
+# 逐条与批量交替运行 repeat 次、各取最快的一次；批量 cfb（与 encrypt_password 格式相同）的加密或解密
+# 比逐条慢 tolerance 以上时退出码为 1
+# 用法: python aesbench.py [--values 条数] [--value-size 字节] [--repeat 次数] [--tolerance 比例] [--file-mb MB] [--chunk-kb KB] [--json 结果文件]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cdi', 'basic'))
+
+import AES as aes  # noqa: E402
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def bench_values(key, count: int, size: int, repeat: int) -> dict:
+    values = [os.urandom(size // 2).hex()[:size] for _ in range(count)]
+    best = {}
+
+    def record(name, field, elapsed):
+        entry = best.setdefault(name, {})
+        entry[field] = max(entry.get(field, 0), count / elapsed)
+
+    for _ in range(repeat):
+        elapsed, tokens = timed(lambda: [aes.encrypt_password(value, key) for value in values])
+        record('password', 'encrypt_ops_s', elapsed)
+        elapsed, _ = timed(lambda: [aes.decrypt_password(token, key) for token in tokens])
+        record('password', 'decrypt_ops_s', elapsed)
+        for mode in (aes.MODE_CFB, aes.MODE_GCM):
+            elapsed, tokens = timed(aes.encrypt_values, values, key, mode)
+            record(f'values_{mode}', 'encrypt_ops_s', elapsed)
+            elapsed, plain = timed(aes.decrypt_values, tokens, key, mode)
+            record(f'values_{mode}', 'decrypt_ops_s', elapsed)
+            assert plain == values
+    return best
+
+
+# 批量 cfb 比逐条慢 tolerance 以上的项 [(字段, 批量, 逐条)]
+def slower_than_single(results: dict, tolerance: float) -> list:
+    return [(field, results['values_cfb'][field], results['password'][field])
+            for field in ('encrypt_ops_s', 'decrypt_ops_s')
+            if results['values_cfb'][field] < results['password'][field] * (1 - tolerance)]
+
+
+def bench_files(key, size_mb: int, chunk_size: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        plain, encrypted, decrypted = (os.path.join(tmp, name) for name in ('plain', 'enc', 'dec'))
+        with open(plain, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1 << 20))
+        for mode in (aes.MODE_CFB, aes.MODE_GCM):
+            elapsed, total = timed(aes.encrypt_file, plain, encrypted, key, mode, chunk_size)
+            decrypted_s, _ = timed(aes.decrypt_file, encrypted, decrypted, key, chunk_size)
+            results[f'file_{mode}'] = {'encrypt_mb_s': total / 2 ** 20 / elapsed,
+                                       'decrypt_mb_s': total / 2 ** 20 / decrypted_s}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AES 批量接口吞吐测试')
+    parser.add_argument('--values', type=int, default=20000, help='批量加解密的条数')
+    parser.add_argument('--value-size', type=int, default=32, help='每条的字节数')
+    parser.add_argument('--repeat', type=int, default=5, help='逐条与批量交替运行的次数，各取最快的一次')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='批量比逐条慢多少比例以内不算退化')
+    parser.add_argument('--file-mb', type=int, default=64, help='文件加解密的文件大小（MB）')
+    parser.add_argument('--chunk-kb', type=int, default=aes.CHUNK_SIZE >> 10, help='文件读写块大小（KB）')
+    parser.add_argument('--json', default='', help='把结果另存为 JSON')
+    args = parser.parse_args(argv)
+    derive_s, key = timed(aes.derive_key, 'bench-passphrase', b'bench-salt')
+    cached_s, _ = timed(aes.derive_key, 'bench-passphrase', b'bench-salt')
+    results = {'derive_key': {'first_s': derive_s, 'cached_s': cached_s, 'iterations': aes.PBKDF2_ITERATIONS}}
+    results.update(bench_values(key, args.values, args.value_size, args.repeat))
+    results.update(bench_files(key, args.file_mb, args.chunk_kb << 10))
+    print(f"derive_key: 首次 {derive_s * 1000:.1f}ms，缓存 {cached_s * 1e6:.1f}us（{aes.PBKDF2_ITERATIONS} 次迭代）")
+    for name, entry in results.items():
+        if name != 'derive_key':
+            print(f"{name:12} " + '  '.join(f"{field}={value:,.1f}" for field, value in entry.items()))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    slower = slower_than_single(results, args.tolerance)
+    for field, batch, single in slower:
+        print(f"批量 cfb 的 {field} 比逐条慢: {batch:,.1f} < {single:,.1f}", file=sys.stderr)
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# 列式事件存储基准：原 pktid_times/time_diffs 字典路径 vs columnar 向量化路径
+# 每个路径在独立子进程中运行，报告耗时和峰值内存
+# 用法: python bench_columnar.py [事件数，默认 10000000]
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+
+import logassay
+from columnar import EventColumns, correlate
+from pktparse import OP_AFTERGET, OP_PUT, OP_REPLYNULL, US_PER_SEC
+
+FUNCS = np.array([100, 331, 410, 6001, 20], dtype=np.int32)
+
+
+# 生成合成事件：每个请求一个 AfterGet，95% 有 1~3 个回复，按时间排序
+def make_events(count: int) -> EventColumns:
+    rng = np.random.default_rng(20240927)
+    n_req = count // 2
+    recv = np.sort(rng.integers(0, 3600 * US_PER_SEC, n_req)) + int(datetime(2024, 9, 27, 13).timestamp()) * US_PER_SEC
+    pktid = rng.permutation(n_req).astype(np.uint64) + 1
+    func = FUNCS[rng.integers(0, len(FUNCS), n_req)]
+    replies = np.where(rng.random(n_req) < 0.05, 0, rng.integers(1, 4, n_req))
+    parts_ts, parts_pk, parts_fn, parts_op = [recv], [pktid], [func], [np.full(n_req, OP_AFTERGET, np.uint8)]
+    for k in range(1, 4):
+        mask = replies >= k
+        parts_ts.append(recv[mask] + k * rng.integers(100, 20000, mask.sum()))
+        parts_pk.append(pktid[mask])
+        parts_fn.append(func[mask])
+        parts_op.append(np.where(replies[mask] == k, OP_REPLYNULL, OP_PUT).astype(np.uint8))
+    ts = np.concatenate(parts_ts)
+    order = np.argsort(ts, kind='stable')[:count]
+    cols = EventColumns()
+    cols.ts.frombytes(ts[order].tobytes())
+    cols.pktid.frombytes(np.concatenate(parts_pk)[order].tobytes())
+    cols.func.frombytes(np.concatenate(parts_fn)[order].tobytes())
+    cols.op.frombytes(np.concatenate(parts_op)[order].tobytes())
+    return cols
+
+
+# 原实现：pktid_times 中保存 datetime 列表，time_diffs 为字典列表后整体排序
+def run_legacy(cols: EventColumns):
+    epoch = datetime(1970, 1, 1)
+    pktid_times = {}
+    for ts, op, pktid, func in zip(cols.ts, cols.op, cols.pktid, cols.func):
+        timestamp = epoch + timedelta(microseconds=ts)
+        if op == OP_AFTERGET:
+            if pktid not in pktid_times:
+                pktid_times[pktid] = {'func': func, 'AfterGet': [], 'Put': []}
+            pktid_times[pktid]['AfterGet'].append(timestamp)
+        elif pktid in pktid_times:
+            pktid_times[pktid]['Put'].append(timestamp)
+    time_diffs = []
+    func_stats = {}
+    for pktid, entries in pktid_times.items():
+        stats = func_stats.setdefault(entries['func'], {'durations': [], 'request_count': 0, 'response_count': 0})
+        stats['request_count'] += len(entries['AfterGet'])
+        stats['response_count'] += len(entries['Put'])
+        last_put = max(entries['Put']) if entries['Put'] else None
+        for afterget in entries['AfterGet']:
+            duration = (last_put - afterget).total_seconds() if last_put else None
+            if duration is not None:
+                stats['durations'].append(duration)
+            time_diffs.append({'pktid': pktid, 'afterget_time': afterget, 'last_put_time': last_put,
+                               'duration': duration, 'status': '成功' if last_put else '统计失败',
+                               'func': entries['func']})
+    time_diffs.sort(key=lambda x: (x['status'] == '统计失败', -(x['duration'] or 0)))
+    return len(time_diffs)
+
+
+# 列式实现：logassay.py 的向量化关联、排序和按功能分组统计
+def run_columnar(cols: EventColumns):
+    corr = correlate(cols.arrays())
+    row = corr['ag_row']
+    pktids = {'func': corr['func'], 'put_count': corr['reply_count']}
+    requests = {
+        'pktid': corr['pktid'][row],
+        'func': corr['func'][row],
+        'afterget': corr['ag_ts'],
+        'last_put': corr['max_reply'][row],
+        'put_count': corr['reply_count'][row],
+    }
+    order = logassay.sort_requests(requests)
+    logassay.calculate_func_stats(pktids, requests)
+    return len(order)
+
+
+def child(variant: str, count: int):
+    cols = make_events(count)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    requests = run_legacy(cols) if variant == 'legacy' else run_columnar(cols)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{variant:<9} events: {len(cols)}, requests: {requests}, event columns: {cols.nbytes / 2 ** 20:.0f}MB, "
+          f"elapsed: {elapsed:.2f}s, extra peak RSS: {(peak_rss - base_rss) / 1024:.0f}MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        child(sys.argv[2], int(sys.argv[1]))
+    else:
+        count = sys.argv[1] if len(sys.argv) > 1 else '10000000'
+        for variant in ('legacy', 'columnar'):
+            subprocess.run([sys.executable, __file__, count, variant], check=True)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# 逐笔输出基准：原逐行 strftime/f.write 写法 vs 按批格式化、整块编码的写法（含 gzip/zstd 压缩）
+# 每种写法在独立子进程中运行，报告耗时、吞吐量和输出大小
+# 用法: python bench_output.py [请求数，默认 1000000]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cdi'))
+import numpy as np
+
+import logassay
+from pktparse import to_datetime, format_ts, US_PER_SEC
+
+FUNCS = np.array([100, 331, 410, 6001, 20], dtype=np.int32)
+VARIANTS = ('logassay-legacy', 'logassay', 'logassay-gzip', 'logassay-zstd', 'log_asy-legacy', 'log_asy',
+            'log_asy-by_proc')
+
+
+# 生成 logassay 的逐笔请求列：一小时内均匀到达，5% 无应答
+def make_requests(count: int) -> dict:
+    rng = np.random.default_rng(20240927)
+    afterget = np.sort(rng.integers(0, 3600 * US_PER_SEC, count)) + int(datetime(2024, 9, 27, 13).timestamp()) * US_PER_SEC
+    put_count = np.where(rng.random(count) < 0.05, 0, rng.integers(1, 4, count))
+    return {
+        'pktid': rng.permutation(count).astype(np.uint64) + 1,
+        'func': FUNCS[rng.integers(0, len(FUNCS), count)],
+        'afterget': afterget,
+        'last_put': np.where(put_count > 0, afterget + rng.integers(100, 60000, count), -1),
+        'put_count': put_count,
+    }
+
+
+# 原 logassay 写法：逐笔转 datetime，每行两次 strftime
+def write_output_legacy(output_file: str, requests: dict, order):
+    columns = [requests[name][order].tolist() for name in ('pktid', 'func', 'afterget', 'last_put', 'put_count')]
+    with open(output_file, 'w', encoding='gb2312') as cus:
+        for pktid, func, afterget_time, last_put_time, put_count in zip(*columns):
+            afterget = to_datetime(afterget_time)
+            if put_count:
+                last_put = to_datetime(last_put_time)
+                cus.write(
+                    f"func: {func}, pktid: {pktid}, AfterGet: {afterget.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, "
+                    f"Last Put: {last_put.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, "
+                    f"Duration: {(last_put_time - afterget_time) / US_PER_SEC} seconds, 状态: 成功\n")
+            else:
+                cus.write(
+                    f"func: {func}, pktid: {pktid}, AfterGet: {afterget.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, "
+                    f"Last Put: 无, Duration: 无, 状态: 统计失败\n")
+
+
+# log_asy 的请求字典（与 build_request 相同的字段）
+def make_request_dicts(requests: dict) -> dict:
+    columns = [requests[name].tolist() for name in ('pktid', 'func', 'afterget', 'last_put', 'put_count')]
+    reqs = {}
+    for pktid, func, recv, last, count in zip(*columns):
+        req = {'func': str(func), 'recv_time': format_ts(recv), 'reply_count': count, 'success': count > 0,
+               'pktid': str(pktid), 'recv_us': recv, 'proc_time': (last - recv) / US_PER_SEC if count else 0,
+               'output_time': 0.0}
+        if count:
+            req['first_reply'] = req['last_reply'] = format_ts(last)
+        reqs[req['pktid']] = req
+    return reqs
+
+
+# 原 log_asy 写法：文本模式逐行 f.write
+def write_requests_legacy(requests: dict, out_dir_path: str, format_request):
+    with open(os.path.join(out_dir_path, 'requests.txt'), 'w', encoding='gb2312') as f:
+        for req in requests.values():
+            f.write(format_request(req))
+
+
+def child(variant: str, count: int):
+    requests = make_requests(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        if variant.startswith('log_asy'):
+            import log_asy
+            reqs = make_request_dicts(requests)
+            start = time.perf_counter()
+            if variant == 'log_asy-legacy':
+                write_requests_legacy(reqs, tmp, log_asy.format_request)
+            else:
+                # 原写法按日志顺序输出，对应 by_time = true；by_proc 为按耗时排序后的输出
+                log_asy.write_requests(reqs, tmp, by_time=variant == 'log_asy')
+        else:
+            order = logassay.sort_requests(requests)
+            output_file = os.path.join(tmp, 'output.txt')
+            start = time.perf_counter()
+            if variant == 'logassay-legacy':
+                write_output_legacy(output_file, requests, order)
+            else:
+                logassay.write_output(output_file, requests, order, variant.partition('-')[2])
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+    print(f"{variant:<16} requests: {count}, elapsed: {elapsed:.2f}s, {count / elapsed / 1e6:.2f}M lines/s, "
+          f"output: {size / 2 ** 20:.1f}MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        child(sys.argv[2], int(sys.argv[1]))
+    else:
+        count = sys.argv[1] if len(sys.argv) > 1 else '1000000'
+        for variant in VARIANTS:
+            subprocess.run([sys.executable, __file__, count, variant], check=True)
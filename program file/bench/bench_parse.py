@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# 解析基准：原 re.search + strptime 路径 vs pktparse 字节级快速路径，输出每秒处理行数
+# 用法: python bench_parse.py [行数] [匹配行占比]
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cdi'))
+from pktparse import iter_packet_events
+
+LEGACY_PATTERN = r'(\d{8} \d{2}:\d{2}:\d{2}\.\d{6}) \[WritePacket\]KSvrComm (AfterGet|Put|ReplyNull)\[pktid\((\d+)\)\], func: ?(\d+),.*'
+
+
+# 生成内存中的样例日志行（gb2312 编码的字节）
+def make_lines(count, hit_ratio):
+    rng = random.Random(20240927)
+    ops = ('AfterGet', 'Put', 'Put', 'ReplyNull')
+    lines = []
+    for i in range(count):
+        sec, us = divmod(i * 137, 1000000)
+        ts = f"20240927 13:{sec // 60 % 60:02d}:{sec % 60:02d}.{us:06d}"
+        if rng.random() < hit_ratio:
+            text = (f"{ts} [WritePacket]KSvrComm {rng.choice(ops)}[pktid({rng.randrange(1, 10 ** 6)})], "
+                    f"func: {rng.choice((100, 331, 410, 6001))}, 委托应答 len=128\n")
+        else:
+            text = f"{ts} [KbdSvr]收到心跳, conn={rng.randrange(64)}\n"
+        lines.append(text.encode('gb2312'))
+    return lines
+
+
+def legacy_parse(lines):
+    count = 0
+    for raw in lines:
+        line = raw.decode('gb2312', errors='replace')
+        match = re.search(LEGACY_PATTERN, line)
+        if match:
+            timestamp_str, operation, pktid_str, func_str = match.groups()
+            datetime.strptime(timestamp_str, '%Y%m%d %H:%M:%S.%f')
+            int(pktid_str)
+            int(func_str)
+            count += 1
+    return count
+
+
+def fast_parse(lines):
+    count = 0
+    for _ in iter_packet_events(lines):
+        count += 1
+    return count
+
+
+def run(name, func, lines):
+    start = time.perf_counter()
+    matched = func(lines)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} matched: {matched}, elapsed: {elapsed:.3f}s, lines/sec: {len(lines) / elapsed:,.0f}")
+    return elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    hit_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    lines = make_lines(count, hit_ratio)
+    legacy = run('legacy', legacy_parse, lines)
+    fast = run('pktparse', fast_parse, lines)
+    print(f"speedup: {legacy / fast:.1f}x")
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# cdi/cli.py 的冷启动测试：每次在新的解释器进程中运行，取多次的中位数
+#   cli.py --help                    只有 argparse，不导入分析模块
+#   cli.py --check <子命令>           导入该子命令的模块并读取、校验配置，不运行
+#   eager                            一次导入全部工具模块（以及 openai、Crypto），对照按需导入省下的时间
+# 另用 python -X importtime 列出每个子命令累计耗时最多的几个顶层导入
+# 用法: python coldstart.py [--runs 7] [--top 5] [--json 结果文件]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROGRAM_DIR = os.path.dirname(BENCH_DIR)
+CDI_DIR = os.path.join(PROGRAM_DIR, 'cdi')
+CLI = os.path.join(CDI_DIR, 'cli.py')
+# --check 时不读取真实配置的子命令需要的参数
+COMMAND_ARGS = {'triage': ['-'], 'scan-errors': [], 'assay': []}
+EAGER = (f"import sys; sys.path[:0] = [{CDI_DIR!r}, {PROGRAM_DIR!r}]; "
+         "import log_asy, logassay, findCodingError, Ds_apiuse, collector, chardet, openai, httpx, Crypto.Cipher.AES")
+
+
+def commands() -> list:
+    sys.path.insert(0, CDI_DIR)
+    from cli import COMMANDS
+    return list(COMMANDS)
+
+
+def time_process(argv: list, runs: int) -> dict:
+    samples = []
+    code = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        code = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        samples.append(time.perf_counter() - started)
+    return {'median_ms': statistics.median(samples) * 1000, 'min_ms': min(samples) * 1000, 'exit_code': code}
+
+
+# -X importtime 的输出中累计耗时最多的顶层导入 [(模块, 毫秒)]
+def top_imports(argv: list, top: int) -> list:
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + argv, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # 顶层导入的模块名前只有一个空格
+        if cumulative.strip().isdigit() and not name[1:].startswith(' '):
+            entries.append((name.strip(), int(cumulative) / 1000))
+    return sorted(entries, key=lambda entry: -entry[1])[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='cli.py 冷启动耗时')
+    parser.add_argument('--runs', type=int, default=7, help='每项运行次数')
+    parser.add_argument('--top', type=int, default=5, help='列出的最耗时导入数')
+    parser.add_argument('--json', default='', help='把结果另存为 JSON')
+    args = parser.parse_args(argv)
+    results = {'python': time_process([sys.executable, '-c', 'pass'], args.runs),
+               'help': time_process([sys.executable, CLI, '--help'], args.runs)}
+    for command in commands():
+        check = [CLI, '--check', command] + COMMAND_ARGS.get(command, [])
+        results[command] = dict(time_process([sys.executable] + check, args.runs),
+                                top_imports=top_imports(check, args.top))
+    results['eager'] = time_process([sys.executable, '-c', EAGER], args.runs)
+    for name, entry in results.items():
+        imports = ', '.join(f"{module} {ms:.0f}ms" for module, ms in entry.get('top_imports', []))
+        status = '' if entry['exit_code'] == 0 else f"  (退出码 {entry['exit_code']})"
+        print(f"{name:12} 中位数 {entry['median_ms']:7.1f}ms  最小 {entry['min_ms']:7.1f}ms{status}"
+              + (f"  [{imports}]" if imports else ''))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# 基准测试套件：用 loggen.py 生成（并按参数缓存）合成日志，在独立子进程中
+#   e2e:    端到端运行 log_collect.py、logassay.py、log_asy.py（临时配置，输出写到临时目录）
+#   stages: 按阶段分别计时：读取（按行读入内存）、解析、关联、汇总、写出
+# 报告耗时、CPU 时间、吞吐量（行/秒、MB/秒）和峰值 RSS；可保存为基线，之后的运行与基线比较，
+# 耗时或峰值 RSS 增幅超过阈值时列为退化并以退出码 1 结束
+# 仓库中的 baseline.json 带有 small、medium 场景的基线，记录了测得基线的机器和 Python 版本；换了机器时先用 --save-baseline
+# 在本机重新保存基线再比较，否则比较结果只反映机器差异（与基线机器不同时会提示）
+# 用法: python harness.py [--scenario small|medium|large] [--tools log_collect,logassay,log_asy] [--mode e2e,stages]
+#                         [--repeat 次数] [--baseline 基线文件] [--save-baseline] [--threshold 0.1] [--json 结果文件]
+import argparse
+import configparser
+import hashlib
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROGRAM_DIR = os.path.dirname(BENCH_DIR)
+CDI_DIR = os.path.join(PROGRAM_DIR, 'cdi')
+ROOT_DIR = os.path.dirname(PROGRAM_DIR)
+sys.path.insert(0, CDI_DIR)
+sys.path.insert(0, PROGRAM_DIR)
+
+from loggen import LogGenerator
+
+# 场景 -> LogGenerator 参数
+SCENARIOS = {
+    'small': {'duration': 120, 'rate': 200},
+    'medium': {'duration': 600, 'rate': 500},
+    'large': {'duration': 3600, 'rate': 1000},
+    'reuse': {'duration': 600, 'rate': 500, 'pktid_space': 5000},
+}
+TOOLS = ('log_collect', 'logassay', 'log_asy')
+MODES = ('e2e', 'stages')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_THRESHOLD = 0.1
+
+
+# 本机信息，随结果保存，用于判断基线是否在同一台机器上测得
+def machine_info() -> dict:
+    return {'node': platform.node(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+
+# 生成或复用缓存的日志，返回 (日志路径, 生成统计)；缓存文件名包含参数摘要
+def scenario_log(name: str, data_dir: str) -> tuple:
+    params = SCENARIOS[name]
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+    log_path = os.path.join(data_dir, f"{name}_{digest}_KbdSvrPacket.txt")
+    truth_path = log_path + '.json'
+    if os.path.exists(log_path) and os.path.exists(truth_path):
+        with open(truth_path, 'r', encoding='utf-8') as f:
+            return log_path, json.load(f)
+    os.makedirs(data_dir, exist_ok=True)
+    print(f"生成场景 {name} 的日志: {log_path}")
+    truth = LogGenerator(**params).write(log_path)
+    with open(truth_path, 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False)
+    return log_path, truth
+
+
+def _usage() -> tuple:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss 在 Linux 上为 KB，在 macOS 上为字节
+    rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / 2 ** 20
+    return usage.ru_utime + usage.ru_stime, rss
+
+
+# 以 __main__ 运行脚本，脚本以 sys.exit(0) 正常结束时继续
+def _run_script(path: str):
+    try:
+        runpy.run_path(path, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (0, None):
+            raise
+
+
+# 端到端运行一个工具（子进程内），返回 {elapsed, cpu, peak_rss_mb}
+def run_e2e(tool: str, log_path: str, work_dir: str) -> dict:
+    out_dir = os.path.join(work_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    start, cpu_start = time.perf_counter(), _usage()[0]
+    if tool == 'log_collect':
+        sys.argv = ['log_collect.py', log_path, os.path.join(out_dir, 'output.txt'), os.path.join(out_dir, 'sum.txt')]
+        _run_script(os.path.join(ROOT_DIR, 'log_collect.py'))
+    elif tool == 'logassay':
+        with open(os.path.join(work_dir, 'LogAssay.ini'), 'w', encoding='utf-8') as f:
+            f.write(f"[Paths]\nlog_file = {log_path}\noutput_file = {os.path.join(out_dir, 'output.txt')}\n"
+                    f"summary_file = {os.path.join(out_dir, 'summary.txt')}\n"
+                    f"[TimeRange]\nstart_time =\nend_time =\n[Encoding]\nauto_detect = true\n")
+        os.chdir(work_dir)
+        sys.argv = ['logassay.py']
+        _run_script(os.path.join(PROGRAM_DIR, 'logassay.py'))
+    else:
+        # 复制仓库的配置，只改日志和输出路径，配置文件路径作为参数传给 log_asy
+        config = configparser.ConfigParser()
+        config.read(os.path.join(PROGRAM_DIR, 'config', 'config.ini'), encoding='utf-8')
+        config.set('Paths', 'log_path', log_path)
+        config.set('Paths', 'out_dir', out_dir)
+        config_path = os.path.join(work_dir, 'config.ini')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            config.write(f)
+        os.chdir(work_dir)
+        sys.argv = ['log_asy.py', config_path]
+        _run_script(os.path.join(CDI_DIR, 'log_asy.py'))
+    elapsed = time.perf_counter() - start
+    cpu, rss = _usage()
+    return {'elapsed': elapsed, 'cpu': cpu - cpu_start, 'peak_rss_mb': rss}
+
+
+# log_collect.py 的请求配对（脚本在模块级运行，无法导入，此处用同样的 StreamCorrelator 配置）
+def _collect_correlate(events) -> list:
+    from streaming import StreamCorrelator, iter_closed
+    return [entry for _, entry in iter_closed(events, StreamCorrelator(None, pair=True))]
+
+
+# 各工具的关联、汇总、写出阶段：每个阶段接收上一阶段的结果，返回本阶段的结果
+def tool_stages(tool: str, out_dir: str) -> list:
+    import numpy as np
+    from latency import summarize, summary_rows, write_summary_tables, DEFAULT_PERCENTILES
+    from pktparse import US_PER_SEC
+
+    if tool == 'log_collect':
+        def aggregate(entries):
+            funcs, values, counts = [], [], {}
+            for func, afterget, put_count, _, _, last_put in entries:
+                count = counts.setdefault(func, {'request_count': 0, 'response_count': 0})
+                count['request_count'] += len(afterget)
+                count['response_count'] += put_count
+                if put_count:
+                    for afterget_time in afterget:
+                        funcs.append(func)
+                        values.append((last_put - afterget_time) / US_PER_SEC)
+            stats = summarize(np.array(funcs, dtype=np.int64), np.array(values, dtype=np.float64), DEFAULT_PERCENTILES)
+            for func, count in counts.items():
+                count.update(stats.get(func, {'count': 0, 'min': 0, 'max': 0, 'mean': 0, 'std': 0,
+                                              'percentiles': [0] * len(DEFAULT_PERCENTILES)}))
+            return counts
+
+        def write(counts):
+            write_summary_tables(os.path.join(out_dir, 'sum'),
+                                 summary_rows(counts, DEFAULT_PERCENTILES, ('request_count', 'response_count')))
+
+        return [('correlate', _collect_correlate), ('aggregate', aggregate), ('write', write)]
+
+    if tool == 'logassay':
+        import logassay
+        from columnar import EventColumns, pair_requests
+
+        def correlate_events(events):
+            cols = EventColumns()
+            cols.extend(events)
+            return logassay.paired_columns(pair_requests(cols.arrays()))
+
+        def aggregate(columns):
+            pktids, requests = columns
+            return requests, logassay.calculate_func_stats(pktids, requests)
+
+        def write(result):
+            requests, func_stats = result
+            logassay.write_output(os.path.join(out_dir, 'output.txt'), requests, logassay.sort_requests(requests))
+            logassay.write_summary(os.path.join(out_dir, 'summary.txt'), func_stats)
+
+        return [('correlate', correlate_events), ('aggregate', aggregate), ('write', write)]
+
+    import log_asy
+    settings = log_asy.read_config()
+    from chunked import merge_partials
+
+    # scan_lines 逐行解析并关联，解析无法单独拆出，此阶段的耗时包含一次解析
+    def correlate_lines(lines):
+        state = merge_partials([log_asy.scan_lines(lines)])[0]
+        return {str(pktid): log_asy.build_request(pktid, entry) for pktid, entry in state.items()}
+
+    def aggregate(requests):
+        summary = log_asy.new_summary()
+        for req in requests.values():
+            log_asy.add_to_summary(summary, req)
+        intervals = log_asy.new_intervals(settings['widths'])
+        reqs = requests.values()
+        log_asy.add_interval_columns(intervals, {
+            'recv_time': np.fromiter((req['recv_us'] for req in reqs), dtype=np.int64, count=len(reqs)),
+            'proc_time': np.fromiter((req['proc_time'] for req in reqs), dtype=np.float64, count=len(reqs)),
+            'reply_count': np.fromiter((req['reply_count'] for req in reqs), dtype=np.int64, count=len(reqs)),
+        })
+        return requests, summary, intervals
+
+    def write(result):
+        requests, summary, intervals = result
+        log_asy.write_requests(requests, out_dir, settings['by_time'])
+        log_asy.write_requests_per_function(requests, out_dir, settings['by_time'])
+        log_asy.write_summary(summary, out_dir)
+        log_asy.write_intervals(intervals, out_dir)
+
+    return [('correlate', correlate_lines), ('aggregate', aggregate), ('write', write)]
+
+
+# 分阶段运行一个工具（子进程内），返回 {阶段: {elapsed, cpu, peak_rss_mb}}
+def run_stages(tool: str, log_path: str, work_dir: str) -> dict:
+    from pktparse import iter_packet_events
+    from textenc import detect_encoding, iter_raw_lines
+
+    out_dir = os.path.join(work_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    stages = tool_stages(tool, out_dir)
+    encoding = detect_encoding(log_path)
+    results = {}
+
+    def timed(name, func, arg):
+        start, cpu_start = time.perf_counter(), _usage()[0]
+        value = func(arg)
+        cpu, rss = _usage()
+        results[name] = {'elapsed': time.perf_counter() - start, 'cpu': cpu - cpu_start, 'peak_rss_mb': rss}
+        return value
+
+    lines = timed('read', lambda path: list(iter_raw_lines(path, encoding)), log_path)
+    events = timed('parse', lambda lines: list(iter_packet_events(lines)), lines)
+    # log_asy 的关联阶段直接处理原始行，其他工具处理解析出的事件
+    value = lines if tool == 'log_asy' else events
+    del events
+    if tool != 'log_asy':
+        del lines
+    for name, func in stages:
+        value = timed(name, func, value)
+    return results
+
+
+def child(mode: str, tool: str, log_path: str, result_path: str):
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{tool}_")
+    try:
+        result = run_e2e(tool, log_path, work_dir) if mode == 'e2e' else run_stages(tool, log_path, work_dir)
+    finally:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+# 在子进程中运行 repeat 次，取耗时最短的一次（各指标取该次的值）
+def measure(mode: str, tool: str, log_path: str, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_path = f.name
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, tool, log_path, result_path],
+                           check=True, stdout=subprocess.DEVNULL, cwd=BENCH_DIR)
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        finally:
+            os.remove(result_path)
+        total = result['elapsed'] if mode == 'e2e' else sum(stage['elapsed'] for stage in result.values())
+        if best is None or total < best[0]:
+            best = (total, result)
+    return best[1]
+
+
+def add_throughput(entry: dict, truth: dict):
+    entry['lines_per_s'] = truth['lines'] / entry['elapsed'] if entry['elapsed'] else 0.0
+    entry['mb_per_s'] = truth['bytes'] / 2 ** 20 / entry['elapsed'] if entry['elapsed'] else 0.0
+
+
+# 与基线比较：返回 [(名称, 指标, 基线值, 当前值, 增幅, 是否退化)]
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    rows = []
+    for mode in MODES:
+        for tool, current in report.get(mode, {}).items():
+            base = baseline.get(mode, {}).get(tool)
+            if base is None:
+                continue
+            pairs = [(tool, current, base)] if mode == 'e2e' else \
+                [(f"{tool}.{stage}", current[stage], base[stage]) for stage in current if stage in base]
+            for name, cur, old in pairs:
+                for metric in ('elapsed', 'peak_rss_mb'):
+                    if old.get(metric):
+                        delta = cur[metric] / old[metric] - 1
+                        rows.append((f"{mode}:{name}", metric, old[metric], cur[metric], delta, delta > threshold))
+    return rows
+
+
+def print_report(report: dict):
+    truth = report['log']
+    print(f"场景 {report['scenario']}: {truth['lines']} 行，{truth['bytes'] / 2 ** 20:.1f}MB，请求 {truth['requests']}")
+    for mode in MODES:
+        for tool, result in report.get(mode, {}).items():
+            entries = [(tool, result)] if mode == 'e2e' else [(f"{tool}.{stage}", v) for stage, v in result.items()]
+            for name, entry in entries:
+                print(f"  {mode:<6} {name:<22} {entry['elapsed']:8.2f}s  cpu {entry['cpu']:8.2f}s  "
+                      f"{entry['lines_per_s']:>12,.0f} 行/秒  {entry['mb_per_s']:7.1f}MB/s  "
+                      f"峰值RSS {entry['peak_rss_mb']:7.0f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='KbdSvrPacket 分析工具基准测试')
+    parser.add_argument('--scenario', default='medium', choices=sorted(SCENARIOS))
+    parser.add_argument('--tools', default=','.join(TOOLS))
+    parser.add_argument('--mode', default=','.join(MODES))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'kbdsvr_bench'))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为该场景的基线')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='退化判定的增幅阈值')
+    parser.add_argument('--json', default='', help='完整结果另存为 JSON 文件')
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(*args.child)
+        return 0
+
+    log_path, truth = scenario_log(args.scenario, args.data_dir)
+    report = {'scenario': args.scenario, 'params': SCENARIOS[args.scenario], 'log': truth,
+              'python': sys.version.split()[0], 'machine': machine_info(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    for mode in args.mode.split(','):
+        report[mode] = {}
+        for tool in args.tools.split(','):
+            result = measure(mode, tool, log_path, args.repeat)
+            for entry in ([result] if mode == 'e2e' else result.values()):
+                add_throughput(entry, truth)
+            report[mode][tool] = result
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+    regressions = 0
+    baseline = baselines.get(args.scenario)
+    if baseline is None:
+        if not args.save_baseline:
+            print(f"{args.baseline} 中没有场景 {args.scenario} 的基线，不比较；先用 --save-baseline 保存")
+    else:
+        print(f"与基线（{baseline['time']}，Python {baseline['python']}）比较，阈值 {args.threshold:.0%}:")
+        base_machine = baseline.get('machine', {})
+        if {k: v for k, v in base_machine.items() if k != 'node'} != \
+                {k: v for k, v in report['machine'].items() if k != 'node'}:
+            print(f"  注意: 基线测于 {base_machine.get('platform', '未知机器')}（{base_machine.get('cpus', '?')} 核，"
+                  f"Python {baseline['python']}），与本机不同，差异可能来自机器而非代码")
+        for name, metric, old, new, delta, regressed in compare(report, baseline, args.threshold):
+            regressions += regressed
+            print(f"  {name:<30} {metric:<12} {old:10.2f} -> {new:10.2f}  {delta:+7.1%}{'  退化' if regressed else ''}")
+    if args.save_baseline:
+        baselines[args.scenario] = report
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=1)
+        print(f"已保存基线: {args.baseline}")
+    return 1 if regressions and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# cdi/logjoin.py 的端到端测试：用 loggen 生成 KbdSvrPacket 日志，再按其中每笔请求的 AfterGet/最后回复时间合成
+# 上游网关日志（先于 AfterGet 收到、晚于最后回复发回）和下游网关日志（AfterGet 之后转发、最后回复之前收到应答），
+# 各段延迟按已知分布抽样；关联后核对每笔请求的段耗时与生成值一致，并输出各阶段吞吐量和峰值内存
+# 用法: python joinbench.py [--duration 秒] [--rate 每秒请求数] [--workers 进程数] [--bucket 秒] [--keep 目录] [--json 结果文件]
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'cdi'))
+sys.path.insert(0, BENCH_DIR)
+
+import logjoin  # noqa: E402
+from loggen import LogGenerator  # noqa: E402
+from chunked import iter_file_events  # noqa: E402
+from pktparse import OP_AFTERGET, US_PER_SEC  # noqa: E402
+
+UPSTREAM_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+UPSTREAM_PATTERN = r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{6}) \[Gateway\] (?:recv|send) reqid=(?P<pktid>\d+)'
+DOWNSTREAM_PATTERN = r'^(?P<time>\d{8} \d\d:\d\d:\d\d\.\d{6}) \[Backend\] (?:call|done) id=(?P<pktid>\d+) func=(?P<func>\d+)'
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _format(ts: int, fmt: str) -> str:
+    return (_EPOCH + timedelta(microseconds=ts)).strftime(fmt)
+
+
+# 合成上下游日志，返回 {pktid: {段名: 微秒}}（只含有回复的请求）
+def write_gateway_logs(packet_log: str, upstream: str, downstream: str, seed: int) -> dict:
+    rng = random.Random(seed)
+    requests = {}
+    for ts, op, pktid, func in iter_file_events(packet_log):
+        if op == OP_AFTERGET:
+            requests[pktid] = [ts, None, func]
+        elif pktid in requests:
+            requests[pktid][1] = ts
+    truth, up_lines, down_lines = {}, [], []
+    for pktid, (afterget, last, func) in requests.items():
+        if last is None:
+            continue
+        hops = {'gateway->kbdsvr': int(rng.expovariate(1 / 2000)) + 1, 'kbdsvr->gateway': int(rng.expovariate(1 / 3000)) + 1}
+        up_lines.append((afterget - hops['gateway->kbdsvr'],
+                         f"{_format(afterget - hops['gateway->kbdsvr'], UPSTREAM_FORMAT)} [Gateway] recv reqid={pktid}"))
+        up_lines.append((last + hops['kbdsvr->gateway'],
+                         f"{_format(last + hops['kbdsvr->gateway'], UPSTREAM_FORMAT)} [Gateway] send reqid={pktid} 应答"))
+        if last - afterget > 200:
+            call = afterget + rng.randrange(1, (last - afterget) // 2)
+            done = rng.randrange(call, last)
+            hops['kbdsvr->backend'], hops['backend->kbdsvr'] = call - afterget, last - done
+            for ts, verb in ((call, 'call'), (done, 'done')):
+                down_lines.append((ts, f"{_format(ts, '%Y%m%d %H:%M:%S.%f')} [Backend] {verb} id={pktid} func={func}"))
+        truth[pktid] = hops
+    for path, lines in ((upstream, up_lines), (downstream, down_lines)):
+        lines.sort()
+        with open(path, 'w', encoding='gb2312', newline='\r\n') as f:
+            f.writelines(line + '\n' for _, line in lines)
+    return truth
+
+
+def check(output: str, truth: dict) -> dict:
+    checked = mismatched = 0
+    with open(output, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            hops = truth.get(int(row['pktid']))
+            if hops is None:
+                continue
+            for name, expected in hops.items():
+                checked += 1
+                mismatched += round(float(row[f"{name}_s"] or 'nan') * US_PER_SEC) != expected
+    return {'checked': checked, 'mismatched': mismatched}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='跨日志关联测试')
+    parser.add_argument('--duration', type=float, default=600, help='日志时长（秒）')
+    parser.add_argument('--rate', type=float, default=200, help='每秒请求数')
+    parser.add_argument('--workers', type=int, default=0, help='进程数，0 为全部 CPU 核')
+    parser.add_argument('--bucket', type=float, default=300, help='时间分区秒数')
+    parser.add_argument('--keep', default='', help='日志和结果写到该目录并保留（默认临时目录）')
+    parser.add_argument('--json', default='', help='把结果另存为 JSON')
+    args = parser.parse_args(argv)
+    work_dir = args.keep or tempfile.mkdtemp(prefix='joinbench_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        paths = {name: os.path.join(work_dir, f"{name}.log") for name in ('kbdsvr', 'gateway', 'backend')}
+        LogGenerator(args.duration, args.rate).write(paths['kbdsvr'])
+        truth = write_gateway_logs(paths['kbdsvr'], paths['gateway'], paths['backend'], 1)
+        sources = [
+            {'name': 'gateway', 'files': [paths['gateway']], 'pattern': UPSTREAM_PATTERN,
+             'time_format': UPSTREAM_FORMAT, 'encoding': 'gb18030'},
+            {'name': 'kbdsvr', 'files': [paths['kbdsvr']], 'pattern': logjoin.PACKET_PATTERN, 'time_format': '',
+             'encoding': 'gb18030'},
+            {'name': 'backend', 'files': [paths['backend']], 'pattern': DOWNSTREAM_PATTERN, 'time_format': '',
+             'encoding': 'gb18030'},
+        ]
+        settings = {'out_dir': work_dir, 'bucket': args.bucket, 'max_skew': 30,
+                    'spill_dir': os.path.join(work_dir, 'spill'), 'workers': args.workers, 'window': None,
+                    'percentiles': (50, 99), 'relative_accuracy': 0.01, 'sources': sources}
+        size = sum(os.path.getsize(path) for path in paths.values())
+        started = time.perf_counter()
+        stats = logjoin.join_logs(settings, report=lambda message: None)
+        elapsed = time.perf_counter() - started
+        result = {'bytes': size, 'elapsed_s': elapsed, 'mb_s': size / 2 ** 20 / elapsed,
+                  'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'requests': stats['requests'], 'matched': stats['matched'], 'events': stats['events'],
+                  'rejected': stats['rejected']}
+        result.update(check(stats['output'], truth))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{size / 2 ** 20:.1f}MB，{result['events']} 个事件，{result['requests']} 笔请求，"
+          f"关联 {result['matched']}，耗时 {elapsed:.2f}s（{result['mb_s']:.1f}MB/s），主进程峰值RSS {result['peak_rss_mb']:.0f}MB")
+    print(f"核对 {result['checked']} 个段耗时，不一致 {result['mismatched']} 个")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+    return 1 if result['mismatched'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
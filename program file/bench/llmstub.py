@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# 本地 OpenAI 兼容桩服务：POST /v1/chat/completions（及 /chat/completions），支持 stream=true 的 SSE 分块应答和普通 JSON 应答，
+# HTTP/1.1 长连接（供客户端连接池复用）。应答内容由提示词确定地生成；首包延迟、每个分块的间隔、分块数和
+# 随机返回 429/503 的比例可调，用于测试 cdi/Ds_apiuse.py 的重试和缓存，以及测量吞吐
+# GET /stats 返回已处理的请求数和按提示词统计的请求次数
+# 用法: python llmstub.py [--port 9500] [--latency 秒] [--chunk-interval 秒] [--chunks N] [--fail-rate 比例]
+#       python llmstub.py --bench 提示词数 [--unique 不同提示词数] [--concurrency N]  在本进程启动桩服务并跑一遍客户端
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cdi'))
+
+# 读取请求头/请求体的超时（秒），空闲的长连接超过此时间关闭
+IDLE_TIMEOUT = 30.0
+
+
+class StubServer:
+    # latency: 首个分块前的等待（秒）；chunk_interval: 分块间隔（秒）；chunks: 应答分块数；
+    # fail_rate: 以 429（带 Retry-After: 0）或 503 拒绝请求的比例
+    def __init__(self, latency: float = 0.05, chunk_interval: float = 0.0, chunks: int = 8, fail_rate: float = 0.0,
+                 seed: int = 1):
+        self.latency = latency
+        self.chunk_interval = chunk_interval
+        self.chunks = chunks
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.failed = 0
+        self.connections = 0
+        self.prompts = {}
+
+    # 由提示词确定地生成应答，切成 chunks 段
+    def answer(self, prompt: str) -> list:
+        text = f"分诊结果：{prompt[:60]} —— 建议检查相关调用的返回值和错误码。"
+        step = max(-(-len(text) // self.chunks), 1)
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT) if length else b''
+                parts = request.split()
+                method, path = parts[0], parts[1].split(b'?')[0] if len(parts) > 1 else b''
+                if method == b'POST' and path.endswith(b'/chat/completions'):
+                    await self.completions(json.loads(body), writer)
+                elif method == b'GET' and path == b'/stats':
+                    self.respond(writer, b'200 OK', json.dumps(self.stats(), ensure_ascii=False).encode())
+                else:
+                    self.respond(writer, b'404 Not Found', b'{"error": {"message": "not found"}}')
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def respond(writer, status: bytes, body: bytes, extra: bytes = b''):
+        writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: application/json\r\nContent-Length: '
+                     + str(len(body)).encode() + b'\r\n' + extra + b'\r\n' + body)
+
+    async def completions(self, request: dict, writer):
+        self.requests += 1
+        prompt = request['messages'][-1]['content']
+        self.prompts[prompt] = self.prompts.get(prompt, 0) + 1
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            self.failed += 1
+            if self.rng.random() < 0.5:
+                self.respond(writer, b'429 Too Many Requests', b'{"error": {"message": "rate limited"}}',
+                             b'Retry-After: 0\r\n')
+            else:
+                self.respond(writer, b'503 Service Unavailable', b'{"error": {"message": "overloaded"}}')
+            return
+        await asyncio.sleep(self.latency)
+        pieces = self.answer(prompt)
+        created = int(time.time())
+        base = {'id': f'chatcmpl-{self.requests}', 'created': created, 'model': request.get('model', 'stub')}
+        if not request.get('stream'):
+            body = dict(base, object='chat.completion', choices=[{
+                'index': 0, 'message': {'role': 'assistant', 'content': ''.join(pieces)}, 'finish_reason': 'stop'}],
+                usage={'prompt_tokens': len(prompt), 'completion_tokens': len(pieces),
+                       'total_tokens': len(prompt) + len(pieces)})
+            self.respond(writer, b'200 OK', json.dumps(body, ensure_ascii=False).encode())
+            return
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+        for i, piece in enumerate(pieces + [None]):
+            delta = {'content': piece} if piece is not None else {}
+            event = dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'delta': dict(delta, role='assistant') if i == 0 else delta,
+                'finish_reason': None if piece is not None else 'stop'}])
+            self._chunk(writer, b'data: ' + json.dumps(event, ensure_ascii=False).encode() + b'\n\n')
+            if self.chunk_interval and piece is not None:
+                await writer.drain()
+                await asyncio.sleep(self.chunk_interval)
+        self._chunk(writer, b'data: [DONE]\n\n')
+        writer.write(b'0\r\n\r\n')
+
+    @staticmethod
+    def _chunk(writer, data: bytes):
+        writer.write(b'%x\r\n' % len(data) + data + b'\r\n')
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'failed': self.failed, 'connections': self.connections,
+                'distinct_prompts': len(self.prompts), 'max_requests_per_prompt': max(self.prompts.values(), default=0)}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        server = await asyncio.start_server(self.handle, host, port)
+        return server, server.sockets[0].getsockname()[1]
+
+
+# 在本进程启动桩服务，用 LLMClient 处理 count 条提示词（其中 unique 条不同），跑两遍：第二遍应全部命中缓存
+async def bench(stub: StubServer, count: int, unique: int, concurrency: int, cache_entries: int) -> dict:
+    from Ds_apiuse import LLMClient, ResponseCache
+    server, port = await stub.start()
+    rng = random.Random(7)
+    prompts = [f'sErrMsg = "错误 {rng.randrange(unique)}：处理失败";' for _ in range(count)]
+    result = {'prompts': count, 'unique': len(set(prompts)), 'concurrency': concurrency}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'cache.sqlite'), cache_entries)
+        try:
+            for run in ('cold', 'warm'):
+                async with LLMClient('stub', f'http://127.0.0.1:{port}/v1', concurrency=concurrency,
+                                     cache=cache) as client:
+                    started = time.perf_counter()
+                    results = await client.complete_many(prompts)
+                    elapsed = time.perf_counter() - started
+                result[run] = dict(client.stats, elapsed_s=round(elapsed, 3), prompts_per_s=round(count / elapsed, 1),
+                                   errors=sum(error is not None for _, _, error in results))
+        finally:
+            cache.close()
+    server.close()
+    await server.wait_closed()
+    result['server'] = stub.stats()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容桩服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9500)
+    parser.add_argument('--latency', type=float, default=0.05, help='首个分块前的等待（秒）')
+    parser.add_argument('--chunk-interval', type=float, default=0.0, help='分块间隔（秒）')
+    parser.add_argument('--chunks', type=int, default=8, help='应答分块数')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='以 429/503 拒绝请求的比例')
+    parser.add_argument('--bench', type=int, default=0, help='在本进程跑吞吐测试的提示词数')
+    parser.add_argument('--unique', type=int, default=0, help='吞吐测试中不同提示词的数量（默认为提示词数的一半）')
+    parser.add_argument('--concurrency', type=int, default=32, help='吞吐测试的客户端并发数')
+    parser.add_argument('--cache-entries', type=int, default=100000, help='吞吐测试的缓存容量')
+    args = parser.parse_args(argv)
+    stub = StubServer(args.latency, args.chunk_interval, args.chunks, args.fail_rate)
+    if args.bench:
+        result = asyncio.run(bench(stub, args.bench, args.unique or max(args.bench // 2, 1), args.concurrency,
+                                   args.cache_entries))
+        print(json.dumps(result, ensure_ascii=False, indent=1))
+        return 0
+
+    async def run():
+        server, port = await stub.start(args.host, args.port)
+        print(f"桩服务已启动: http://{args.host}:{port}/v1")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# 合成 KbdSvrPacket 日志生成器：请求按泊松过程到达，func 按给定比例分布，耗时按对数正态分布；
+# 可配置多回复 Put 序列、以 ReplyNull 结束的请求、无回复的请求、找不到 AfterGet 的孤立回复、
+# gb2312 中文 Info 以及不匹配的噪声行。同样的参数和种子生成的文件逐字节相同，供基准测试复现
+# 用法: python loggen.py 输出文件 [--duration 秒] [--rate 每秒请求数] [--funcs 100:40,331:20] ...（见 --help）
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import sys
+from datetime import datetime
+
+# func -> 权重
+DEFAULT_FUNCS = {100: 40, 331: 20, 410: 20, 6001: 15, 20: 5}
+DEFAULT_START = '20240927 13:00:00'
+INFOS = ('委托应答信息', '查询资金信息', '成交回报', '撤单应答', '行情快照 len=128', '登录应答 用户=张三')
+NOISE = ('[KbdSvr]心跳 conn={}', '[KbdSvr]连接建立 conn={}', '[WritePacket]KSvrComm Send[conn({})] 发送数据',
+         '[KbdSvr]队列长度 {}')
+OP_NAMES = ('AfterGet', 'Put', 'ReplyNull')
+
+
+# 解析 '100:40,331:20' 形式的 func 分布
+def parse_funcs(text: str) -> dict:
+    funcs = {}
+    for item in text.split(','):
+        func, _, weight = item.strip().partition(':')
+        funcs[int(func)] = float(weight or 1)
+    return funcs
+
+
+class LogGenerator:
+    # duration: 日志时长（秒）；rate: 每秒请求数；funcs: func -> 权重；latency: 首个回复耗时中位数（秒）；
+    # sigma: 耗时对数正态分布的形状参数；multi: 多回复请求占比，回复数在 2..max_replies 间均匀分布；
+    # replynull: 请求以 ReplyNull 结束的占比；missing: 无任何回复的请求占比；orphans: 每个请求附带的孤立回复数；
+    # noise: 每个请求附带的噪声行数；pktid_space: pktid 取值范围，0 为递增不重复，否则在 1..pktid_space 内循环复用
+    def __init__(self, duration: float = 600, rate: float = 200, funcs=None, latency: float = 0.03,
+                 sigma: float = 1.0, multi: float = 0.3, max_replies: int = 4, replynull: float = 0.2,
+                 missing: float = 0.05, orphans: float = 0.002, noise: float = 1.0, pktid_space: int = 0,
+                 start: str = DEFAULT_START, seed: int = 20240927):
+        self.duration = duration
+        self.rate = rate
+        self.funcs = funcs or DEFAULT_FUNCS
+        self.latency = latency
+        self.sigma = sigma
+        self.multi = multi
+        self.max_replies = max(max_replies, 2)
+        self.replynull = replynull
+        self.missing = missing
+        self.orphans = orphans
+        self.noise = noise
+        self.pktid_space = pktid_space
+        self.start_us = int(datetime.strptime(start, '%Y%m%d %H:%M:%S').timestamp() * 1e6)
+        self.seed = seed
+        # 生成时统计的真实值，供核对分析结果
+        self.truth = {}
+
+    def _replies(self, rng: random.Random, ts: int) -> list:
+        if rng.random() < self.missing:
+            return []
+        count = rng.randint(2, self.max_replies) if rng.random() < self.multi else 1
+        ts += max(int(rng.lognormvariate(math.log(self.latency * 1e6), self.sigma)), 1)
+        replies = []
+        for i in range(count):
+            replies.append(ts)
+            ts += int(rng.expovariate(1 / 5000)) + 1
+        return replies
+
+    # 按时间顺序产出日志行（str，不含换行）；回复按时间排入堆，到达时刻不晚于下一个请求时输出
+    def iter_lines(self):
+        rng = random.Random(self.seed)
+        funcs, weights = list(self.funcs), list(self.funcs.values())
+        truth = self.truth = dict.fromkeys(('requests', 'replies', 'replynull', 'missing', 'orphans', 'noise'), 0)
+        truth['funcs'] = {str(func): 0 for func in funcs}
+        pending = []
+        order = itertools.count()
+        seq = 0
+        end_us = self.start_us + int(self.duration * 1e6)
+        ts = self.start_us
+        while True:
+            ts += int(rng.expovariate(self.rate) * 1e6)
+            while pending and (pending[0][0] <= ts or ts >= end_us):
+                reply_ts, _, op, pktid, func, info = heapq.heappop(pending)
+                yield self._line(reply_ts, op, pktid, func, info, rng)
+            if ts >= end_us:
+                break
+            seq += 1
+            pktid = (seq - 1) % self.pktid_space + 1 if self.pktid_space else seq
+            func = rng.choices(funcs, weights)[0]
+            info = rng.choice(INFOS)
+            truth['requests'] += 1
+            truth['funcs'][str(func)] += 1
+            yield self._line(ts, 0, pktid, func, info, rng)
+            replies = self._replies(rng, ts)
+            if not replies:
+                truth['missing'] += 1
+            last_op = 2 if replies and rng.random() < self.replynull else 1
+            truth['replies'] += len(replies)
+            truth['replynull'] += last_op == 2 and bool(replies)
+            for i, reply_ts in enumerate(replies):
+                op = last_op if i == len(replies) - 1 else 1
+                heapq.heappush(pending, (reply_ts, next(order), op, pktid, func, info))
+            if rng.random() < self.orphans:
+                truth['orphans'] += 1
+                orphan = (10 ** 9 + seq) if not self.pktid_space else self.pktid_space + seq
+                heapq.heappush(pending, (ts + rng.randrange(1000, 100000), next(order), 1, orphan, func, info))
+            noise = int(self.noise) + (rng.random() < self.noise - int(self.noise))
+            for _ in range(noise):
+                truth['noise'] += 1
+                yield f"{_format_ts(ts)} {rng.choice(NOISE).format(rng.randrange(64))}"
+
+    def _line(self, ts: int, op: int, pktid: int, func: int, info: str, rng: random.Random) -> str:
+        # 实际日志中 AfterGet 与回复的 'func:' 后有时有空格、有时没有
+        space = ' ' if rng.random() < 0.7 else ''
+        return f"{_format_ts(ts)} [WritePacket]KSvrComm {OP_NAMES[op]}[pktid({pktid})], func:{space}{func}, {info}"
+
+    # 写出日志文件，返回生成统计（行数、字节数及各类事件的真实数量）
+    def write(self, path: str, encoding: str = 'gb2312', newline: str = '\r\n') -> dict:
+        lines = 0
+        size = 0
+        batch = []
+        with open(path, 'wb') as f:
+            for line in self.iter_lines():
+                batch.append(line)
+                if len(batch) >= 8192:
+                    size += f.write((newline.join(batch) + newline).encode(encoding))
+                    lines += len(batch)
+                    batch.clear()
+            if batch:
+                size += f.write((newline.join(batch) + newline).encode(encoding))
+                lines += len(batch)
+        return dict(self.truth, lines=lines, bytes=size)
+
+
+_ts_cache = [None, '']
+
+
+def _format_ts(ts: int) -> str:
+    second, us = divmod(ts, 1000000)
+    if _ts_cache[0] != second:
+        _ts_cache[0] = second
+        _ts_cache[1] = datetime.fromtimestamp(second).strftime('%Y%m%d %H:%M:%S')
+    return f"{_ts_cache[1]}.{us:06d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成合成 KbdSvrPacket 日志')
+    parser.add_argument('output', help='输出日志文件')
+    parser.add_argument('--duration', type=float, default=600, help='日志时长（秒）')
+    parser.add_argument('--rate', type=float, default=200, help='每秒请求数')
+    parser.add_argument('--funcs', default='', help="func 分布，如 '100:40,331:20'")
+    parser.add_argument('--latency', type=float, default=0.03, help='首个回复耗时中位数（秒）')
+    parser.add_argument('--sigma', type=float, default=1.0, help='耗时对数正态分布的形状参数')
+    parser.add_argument('--multi', type=float, default=0.3, help='多回复请求占比')
+    parser.add_argument('--max-replies', type=int, default=4, help='多回复请求的最大回复数')
+    parser.add_argument('--replynull', type=float, default=0.2, help='以 ReplyNull 结束的请求占比')
+    parser.add_argument('--missing', type=float, default=0.05, help='无回复请求占比')
+    parser.add_argument('--orphans', type=float, default=0.002, help='每个请求附带的孤立回复数')
+    parser.add_argument('--noise', type=float, default=1.0, help='每个请求附带的噪声行数')
+    parser.add_argument('--pktid-space', type=int, default=0, help='pktid 循环复用的范围，0 为不复用')
+    parser.add_argument('--start', default=DEFAULT_START, help="起始时间，如 '20240927 13:00:00'")
+    parser.add_argument('--seed', type=int, default=20240927)
+    parser.add_argument('--encoding', default='gb2312')
+    parser.add_argument('--lf', action='store_true', help="以 '\\n' 换行（默认 '\\r\\n'）")
+    args = parser.parse_args(argv)
+    generator = LogGenerator(args.duration, args.rate, parse_funcs(args.funcs) if args.funcs else None, args.latency,
+                             args.sigma, args.multi, args.max_replies, args.replynull, args.missing, args.orphans,
+                             args.noise, args.pktid_space, args.start, args.seed)
+    truth = generator.write(args.output, args.encoding, '\n' if args.lf else '\r\n')
+    print(json.dumps(truth, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
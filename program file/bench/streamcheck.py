@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# log_asy 流式模式与批量模式的输出一致性核对：用 loggen 生成日志，[Sorting] by_time 取 true/false 各运行一次
+# 一次性解析（workers 个进程）和空闲超时足够大的流式分析，逐个比较两边输出目录中全部文件的摘要；
+# 流式排序的批大小取得很小，使外部排序确实经过临时文件和多路归并
+# 用法: python streamcheck.py [--duration 秒] [--rate 每秒请求数] [--workers 进程数] [--run-size 行数] [--keep 目录]
+import argparse
+import configparser
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'cdi'))
+sys.path.insert(0, BENCH_DIR)
+
+import log_asy  # noqa: E402
+from loggen import LogGenerator  # noqa: E402
+
+
+def digests(directory: str) -> dict:
+    result = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            result[name] = hashlib.md5(f.read()).hexdigest()
+    return result
+
+
+# 按 config.ini 的其余设置写出临时配置并读取（日志路径、输出目录和排序方式替换为给定值）
+def load_settings(work_dir: str, log_path: str, by_time: bool) -> dict:
+    config = configparser.ConfigParser()
+    config.read(log_asy.CONFIG_PATH, encoding='utf-8')
+    config['Paths']['log_path'] = log_path
+    config['Paths']['out_dir'] = work_dir
+    config['Sorting']['by_time'] = str(by_time).lower()
+    config['TimeIntervals']['start_time'] = config['TimeIntervals']['end_time'] = ''
+    config['Profile']['enabled'] = 'false'
+    path = os.path.join(work_dir, f'by_time_{by_time}.ini')
+    with open(path, 'w', encoding='utf-8') as f:
+        config.write(f)
+    return log_asy.read_config(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='流式与批量输出一致性核对')
+    parser.add_argument('--duration', type=float, default=120, help='日志时长（秒）')
+    parser.add_argument('--rate', type=float, default=200, help='每秒请求数')
+    parser.add_argument('--workers', type=int, default=4, help='一次性解析的进程数')
+    parser.add_argument('--run-size', type=int, default=5000, help='流式外部排序每批的行数')
+    parser.add_argument('--keep', default='', help='日志和结果写到该目录并保留（默认临时目录）')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    work_dir = args.keep or tempfile.mkdtemp(prefix='streamcheck_')
+    os.makedirs(work_dir, exist_ok=True)
+    failures = 0
+    try:
+        log_path = os.path.join(work_dir, 'check_KbdSvrPacket.txt')
+        LogGenerator(args.duration, args.rate).write(log_path)
+        for by_time in (True, False):
+            settings = load_settings(work_dir, log_path, by_time)
+            batch_dir, stream_dir = (os.path.join(work_dir, f'{name}_{by_time}') for name in ('batch', 'stream'))
+            log_asy.run_reports(dict(settings, out_dir=batch_dir, workers=args.workers))
+            log_asy.configure(settings)
+            log_asy.run_streaming(log_path, log_asy.detect_encoding(log_path), stream_dir, settings['widths'],
+                                  args.duration * 10, settings['percentiles'], settings['sketch_accuracy'],
+                                  settings['window'], settings['max_open_files'], settings['compress'], by_time,
+                                  args.run_size)
+            batch, stream = digests(batch_dir), digests(stream_dir)
+            differ = sorted(name for name in set(batch) | set(stream) if batch.get(name) != stream.get(name))
+            failures += bool(differ)
+            print(f"by_time={str(by_time).lower()}: {len(batch)} 个文件，requests.txt {batch.get('requests.txt')}，"
+                  + (f"不一致: {', '.join(differ)}" if differ else '流式与批量一致'))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
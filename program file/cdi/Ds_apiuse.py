@@ -1,25 +1,292 @@
-from openai import OpenAI
 
-# 使用环境变量管理 API 密钥
-api_key = ''
-if not api_key:
-    raise ValueError("请设置环境变量 OPENAI_API_KEY")
+# 批量调用 DeepSeek（OpenAI 兼容接口）分诊错误信息：findCodingError.py 收集的错误字符串、日志分析标记的异常等，
+# 一次可能有成千上万条提示词。异步客户端用信号量限制并发、共享一个带连接池的 HTTP 客户端，流式接收应答，
+# 限流/超时/5xx 时按指数退避重试；应答按提示词哈希缓存在磁盘上（sqlite，按最近使用淘汰），
+# 重复的提示词（包括同一批中同时在途的）只请求一次
+# 用法: python Ds_apiuse.py 输入文件 [输出文件]；输入每行一条（findCodingError.py 的 "文件 | 语句" 取语句部分），
+# 输出为 JSON Lines（input/response/cached/error）。API 密钥取环境变量 OPENAI_API_KEY，其余设置见 config.ini 的 [LLM]
+# openai/httpx 在创建客户端时才导入，导入本模块没有副作用
+import asyncio
+import configparser
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
 
 # 提取常量
 BASE_URL = "https://api.deepseek.com"
 MODEL_NAME = "deepseek-chat"
+SYSTEM_PROMPT = "You are a helpful assistant"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.ini')
+# 退避的初始等待和上限（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
 
-client = OpenAI(api_key=api_key, base_url=BASE_URL)
-
-try:
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": "Hello"},
-        ],
-        stream=False
-    )
-    print(response.choices[0].message.content)
-except Exception as e:
-    print(f"发生错误: {e}")
+
+def get_api_key() -> str:
+    # 使用环境变量管理 API 密钥
+    api_key = os.environ.get('OPENAI_API_KEY', '')
+    if not api_key:
+        raise ValueError("请设置环境变量 OPENAI_API_KEY")
+    return api_key
+
+
+# 缓存键：模型、系统提示词、温度和提示词一起哈希
+def prompt_key(model: str, system: str, prompt: str, temperature) -> str:
+    text = json.dumps([model, system, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    # 磁盘上的应答缓存（sqlite 单文件），最多保留 max_entries 条，超出时淘汰最久未使用的；
+    # 命中时刷新使用时间。只在事件循环线程中使用，不需要加锁
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+                        'used REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+        self.count = self.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, key: str):
+        row = self.db.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute('UPDATE responses SET used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, response: str):
+        with self.db:
+            if self.db.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is None:
+                self.count += 1
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (key, response, time.time()))
+            if self.count > self.max_entries:
+                self.db.execute('DELETE FROM responses WHERE key IN '
+                                '(SELECT key FROM responses ORDER BY used LIMIT ?)', (self.count - self.max_entries,))
+                self.count = self.max_entries
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class LLMClient:
+    # concurrency: 同时在途的请求数（也是连接池大小）；timeout: 单次请求超时（秒）；max_retries: 失败后的重试次数；
+    # cache: ResponseCache 或 None
+    def __init__(self, api_key: str, base_url: str = BASE_URL, model: str = MODEL_NAME, system: str = SYSTEM_PROMPT,
+                 concurrency: int = 16, timeout: float = 60.0, max_retries: int = 5, temperature=None, cache=None):
+        import httpx
+        from openai import AsyncOpenAI
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self.http = httpx.AsyncClient(limits=limits, timeout=timeout)
+        # 重试由本类自己做（带抖动的指数退避），SDK 不再重试
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http, max_retries=0)
+        self.model = model
+        self.system = system
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.cache = cache
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = {}
+        self.stats = dict.fromkeys(('requests', 'cache_hits', 'shared', 'retries', 'failures', 'chunks'), 0)
+
+    async def close(self):
+        await self.client.close()
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # 返回提示词的应答和是否来自缓存；on_token(text) 在收到每段流式内容时调用（缓存命中时以整个应答调用一次）。
+    # 流式应答中途断开而重试时，先以 on_token(None) 通知丢弃这次已收到的内容，重试的应答从头再送一遍
+    async def complete(self, prompt: str, on_token=None) -> tuple:
+        key = prompt_key(self.model, self.system, prompt, self.temperature)
+        if self.cache is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                self.stats['cache_hits'] += 1
+                if on_token is not None:
+                    on_token(response)
+                return response, True
+        # 同样的提示词正在请求中时等它的结果，不再重复请求
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats['shared'] += 1
+            response = await asyncio.shield(future)
+            if on_token is not None:
+                on_token(response)
+            return response, True
+        future = self.in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            async with self.semaphore:
+                response = await self._request(prompt, on_token)
+            if self.cache is not None:
+                self.cache.put(key, response)
+            future.set_result(response)
+            return response, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def _request(self, prompt: str, on_token) -> str:
+        import openai
+        messages = [{"role": "system", "content": self.system}, {"role": "user", "content": prompt}]
+        kwargs = {} if self.temperature is None else {'temperature': self.temperature}
+        for attempt in range(self.max_retries + 1):
+            parts = []
+            try:
+                self.stats['requests'] += 1
+                stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True,
+                                                                   **kwargs)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        text = chunk.choices[0].delta.content
+                        parts.append(text)
+                        self.stats['chunks'] += 1
+                        if on_token is not None:
+                            on_token(text)
+                return ''.join(parts)
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                # APITimeoutError 是 APIConnectionError 的子类；其余 4xx 重试也没用，直接抛出
+                if attempt == self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+                self.stats['retries'] += 1
+                if parts and on_token is not None:
+                    on_token(None)
+                await asyncio.sleep(self._backoff(attempt, e))
+            except Exception:
+                self.stats['failures'] += 1
+                raise
+
+    # 第 attempt 次失败后的等待时间：服务端给了 Retry-After 时按它，否则为带全抖动的指数退避
+    @staticmethod
+    def _backoff(attempt: int, error) -> float:
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+        return random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+
+    # 并发处理一批提示词，按输入顺序返回 (应答或 None, 是否缓存, 错误信息或 None)；
+    # on_result(index, result) 在每条完成时调用。只为正在处理的提示词建任务，任务数不随批大小增长
+    async def complete_many(self, prompts, on_result=None) -> list:
+        prompts = list(prompts)
+        results = [None] * len(prompts)
+        indexes = iter(range(len(prompts)))
+
+        async def worker():
+            for index in indexes:
+                try:
+                    response, cached = await self.complete(prompts[index])
+                    results[index] = (response, cached, None)
+                except Exception as e:
+                    results[index] = (None, False, f"{type(e).__name__}: {e}")
+                if on_result is not None:
+                    on_result(index, results[index])
+
+        # 比并发数多开一些，使等待缓存命中或同一在途请求的任务不占满请求槽
+        workers = min(len(prompts), self.concurrency * 2)
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        return results
+
+
+def read_config(path: str = CONFIG_PATH) -> dict:
+    config = configparser.ConfigParser()
+    config.read(path, encoding='utf-8')
+    section = config['LLM'] if config.has_section('LLM') else {}
+    cache_path = section.get('cache_path', '') or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               'llm_cache.sqlite')
+    return {'base_url': section.get('base_url', '') or BASE_URL, 'model': section.get('model', '') or MODEL_NAME,
+            'system': section.get('system_prompt', '') or SYSTEM_PROMPT,
+            'concurrency': int(section.get('concurrency', '') or 16),
+            'timeout': float(section.get('timeout', '') or 60), 'max_retries': int(section.get('max_retries', '') or 5),
+            'cache_path': cache_path, 'cache_entries': int(section.get('cache_entries', '') or 100000)}
+
+
+# 读取输入的提示词：findCodingError.py 的结果行取 " | " 之后的语句，去掉空行和重复的行
+def read_prompts(path: str) -> list:
+    prompts = {}
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            text = line.split(' | ', 1)[-1].strip()
+            if text:
+                prompts.setdefault(text, None)
+    return list(prompts)
+
+
+async def triage(prompts: list, output, settings: dict, api_key: str) -> dict:
+    cache = ResponseCache(settings['cache_path'], settings['cache_entries'])
+    started = time.perf_counter()
+    done = [0]
+
+    def on_result(index, result):
+        response, cached, error = result
+        output.write(json.dumps({'input': prompts[index], 'response': response, 'cached': cached, 'error': error},
+                                ensure_ascii=False) + '\n')
+        done[0] += 1
+        if done[0] % 100 == 0:
+            print(f"已完成 {done[0]}/{len(prompts)}")
+
+    try:
+        async with LLMClient(api_key, settings['base_url'], settings['model'], settings['system'],
+                             settings['concurrency'], settings['timeout'], settings['max_retries'],
+                             cache=cache) as client:
+            await client.complete_many(prompts, on_result)
+            stats = dict(client.stats)
+    finally:
+        cache.close()
+    stats['prompts'] = len(prompts)
+    stats['elapsed_s'] = time.perf_counter() - started
+    return stats
+
+
+def main(argv):
+    if len(argv) < 2:
+        # 没有输入文件时保留原来的单次对话示例
+        from openai import OpenAI
+        client = OpenAI(api_key=get_api_key(), base_url=BASE_URL)
+        try:
+            response = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": "Hello"},
+                ],
+                stream=False
+            )
+            print(response.choices[0].message.content)
+        except Exception as e:
+            print(f"发生错误: {e}")
+        return 0
+    prompts = read_prompts(argv[1])
+    output_path = argv[2] if len(argv) > 2 else os.path.splitext(argv[1])[0] + '_triage.jsonl'
+    with open(output_path, 'w', encoding='utf-8') as output:
+        stats = asyncio.run(triage(prompts, output, read_config(), get_api_key()))
+    print(f"共 {stats['prompts']} 条，请求 {stats['requests']} 次（重试 {stats['retries']}），"
+          f"缓存命中 {stats['cache_hits']}，失败 {stats['failures']}，耗时 {stats['elapsed_s']:.1f}s，结果已保存至 {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# 慢请求与异常检测：按块接收配对好的请求列（每笔请求一行，大致按 AfterGet 时间排列），内存与请求总数无关
+#   - 全局和每个功能各保留耗时最长的 K 笔请求（小顶堆；块内先按第 K 大的耗时筛出候选，只有候选进堆）
+#   - 滚动基线：按 interval 秒分段，每个功能以之前 baseline_intervals 段的耗时草图估计 p99（quantile），
+#     耗时超过 factor 倍基线的请求记为异常，基线样本少于 min_samples 时不判断；异常按超出倍数保留前 K 笔
+#   - 无应答突增：按 burst_window 秒统计 AfterGet 之后没有任何 Put/ReplyNull 的请求，
+#     数量不少于 burst_min 且占该时间窗请求数的比例不低于 burst_ratio 时记为突增，相邻的时间窗合并为一段
+# 结果写为 slow_requests.txt 和同名 .json，只对各个堆里的 K 笔排序，不对全部请求排序
+# 耗时相同的请求以先出现的为准（与逐笔输出按耗时稳定排序的先后一致）
+import heapq
+import json
+from collections import deque
+
+import numpy as np
+
+from pktparse import US_PER_SEC, format_ts_ms
+from sketch import LatencySketch, DEFAULT_ACCURACY
+
+DEFAULT_TOP_K = 100
+DEFAULT_FUNC_TOP_K = 20
+# 突增段列出的无应答最多的功能数
+BURST_TOP_FUNCS = 5
+
+
+class AnomalyDetector:
+    # top_k/func_top_k: 全局/每个功能保留的最慢请求数；factor: 异常判定的基线倍数；interval: 基线分段秒数；
+    # baseline_intervals: 基线覆盖之前的段数；min_samples: 基线的最少样本数；quantile: 基线分位数（0~100）；
+    # burst_window: 无应答统计的时间窗秒数；burst_min/burst_ratio: 突增的最少无应答数/最低占比；
+    # relative_accuracy: 基线草图的相对误差
+    def __init__(self, top_k: int = DEFAULT_TOP_K, func_top_k: int = DEFAULT_FUNC_TOP_K, factor: float = 3.0,
+                 interval: float = 60, baseline_intervals: int = 5, min_samples: int = 50, quantile: float = 99,
+                 burst_window: float = 10, burst_min: int = 20, burst_ratio: float = 0.5,
+                 relative_accuracy: float = DEFAULT_ACCURACY):
+        if top_k < 1 or func_top_k < 0:
+            raise ValueError(f"top_k 必须大于 0，func_top_k 不能小于 0: {top_k}, {func_top_k}")
+        if interval <= 0 or burst_window <= 0 or baseline_intervals < 1:
+            raise ValueError("interval、burst_window 必须大于 0，baseline_intervals 至少为 1")
+        self.top_k = top_k
+        self.func_top_k = func_top_k
+        self.factor = factor
+        self.interval_us = int(interval * US_PER_SEC)
+        self.baseline_intervals = baseline_intervals
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.burst_us = int(burst_window * US_PER_SEC)
+        self.burst_min = burst_min
+        self.burst_ratio = burst_ratio
+        self.relative_accuracy = relative_accuracy
+        self.requests = 0
+        self.missing = 0
+        # 已处理的行数，作为耗时相同的请求的先后
+        self.seq = 0
+        # 堆元素 (耗时微秒, -序号, pktid, func, AfterGet, 应答数)
+        self.top = []
+        self.func_top = {}
+        # 异常堆元素 (倍数, -序号, pktid, func, AfterGet, 耗时微秒, 基线秒)
+        self.outliers = []
+        self.outlier_counts = {}
+        # 当前基线分段、各功能当前段的草图、之前各段的草图（无数据的段为 None）、当前段的基线缓存
+        self.bucket = None
+        self.current = {}
+        self.history = {}
+        self.baselines = {}
+        # 时间窗 -> [请求数, 无应答数, {func: 无应答数}]
+        self.windows = {}
+
+    # 累加一块请求列：pktid/func/afterget/last_put（整数微秒）/put_count
+    def add(self, cols: dict):
+        func = np.asarray(cols['func'])
+        count = len(func)
+        if not count:
+            return
+        afterget = np.asarray(cols['afterget'], dtype=np.int64)
+        put_count = np.asarray(cols['put_count'])
+        replied = put_count > 0
+        duration = np.where(replied, np.asarray(cols['last_put'], dtype=np.int64) - afterget, -1)
+        seq = np.arange(self.seq, self.seq + count)
+        self.seq += count
+        self.requests += count
+        self.missing += count - int(replied.sum())
+        rows = (np.asarray(cols['pktid']), func, afterget, put_count)
+
+        candidates = np.flatnonzero(replied)
+        self._push_top(self.top, self.top_k, candidates, duration, seq, rows)
+        if self.func_top_k:
+            for f, group in _groups(func, candidates):
+                self._push_top(self.func_top.setdefault(f, []), self.func_top_k, group, duration, seq, rows)
+        self._add_baseline(candidates, duration, seq, rows)
+        self._add_windows(afterget, func, replied)
+
+    @staticmethod
+    def _push_top(heap: list, k: int, candidates, duration, seq, rows):
+        if len(heap) >= k:
+            candidates = candidates[duration[candidates] > heap[0][0]]
+        if len(candidates) > k:
+            # 只留下不小于块内第 k 大耗时的行（相同耗时全部保留，由堆按先后取舍）
+            kth = np.partition(duration[candidates], len(candidates) - k)[len(candidates) - k]
+            candidates = candidates[duration[candidates] >= kth]
+        pktid, func, afterget, put_count = rows
+        for r in candidates.tolist():
+            item = (int(duration[r]), -int(seq[r]), int(pktid[r]), int(func[r]), int(afterget[r]), int(put_count[r]))
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    # 按基线分段依次处理：先用之前各段的基线判断，再把本段耗时计入当前段的草图；早于当前段的迟到请求计入当前段
+    def _add_baseline(self, candidates, duration, seq, rows):
+        if not len(candidates):
+            return
+        pktid, func, afterget, _ = rows
+        buckets = afterget[candidates] // self.interval_us
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for part in np.split(order, bounds):
+            bucket = int(buckets[part[0]])
+            if self.bucket is None:
+                self.bucket = bucket
+            elif bucket > self.bucket:
+                self._roll(bucket)
+            selected = candidates[part]
+            for f, group in _groups(func, selected):
+                seconds = duration[group] / US_PER_SEC
+                baseline = self._baseline(f)
+                if baseline:
+                    flagged = group[seconds > self.factor * baseline]
+                    if len(flagged):
+                        self.outlier_counts[f] = self.outlier_counts.get(f, 0) + len(flagged)
+                        for r in flagged.tolist():
+                            item = (duration[r] / US_PER_SEC / baseline, -int(seq[r]), int(pktid[r]), f,
+                                    int(afterget[r]), int(duration[r]), baseline)
+                            if len(self.outliers) < self.top_k:
+                                heapq.heappush(self.outliers, item)
+                            elif item > self.outliers[0]:
+                                heapq.heapreplace(self.outliers, item)
+                sketch = self.current.get(f)
+                if sketch is None:
+                    sketch = self.current[f] = LatencySketch(self.relative_accuracy)
+                sketch.add_many(seconds)
+
+    # 进入新的基线分段：当前段的草图移入历史，中间没有数据的段记为 None
+    def _roll(self, bucket: int):
+        gap = min(bucket - self.bucket, self.baseline_intervals)
+        for f in set(self.history) | set(self.current):
+            history = self.history.setdefault(f, deque(maxlen=self.baseline_intervals))
+            history.append(self.current.get(f))
+            history.extend([None] * (gap - 1))
+        self.bucket = bucket
+        self.current = {}
+        self.baselines = {}
+
+    # 功能 f 当前段的基线（秒），样本不足时为 None
+    def _baseline(self, f: int):
+        if f not in self.baselines:
+            merged = LatencySketch(self.relative_accuracy)
+            for sketch in self.history.get(f, ()):
+                if sketch is not None:
+                    merged.merge(sketch)
+            self.baselines[f] = merged.percentiles([self.quantile])[0] if merged.count >= self.min_samples else None
+        return self.baselines[f]
+
+    def _add_windows(self, afterget, func, replied):
+        windows = afterget // self.burst_us
+        keys, totals = np.unique(windows, return_counts=True)
+        for window, total in zip(keys.tolist(), totals.tolist()):
+            self.windows.setdefault(window, [0, 0, {}])[0] += total
+        missing = ~replied
+        if missing.any():
+            pairs, counts = np.unique(np.stack((windows[missing], func[missing].astype(np.int64))), axis=1,
+                                      return_counts=True)
+            for (window, f), n in zip(pairs.T.tolist(), counts.tolist()):
+                entry = self.windows[window]
+                entry[1] += n
+                entry[2][f] = entry[2].get(f, 0) + n
+
+    # 无应答突增段：[{start, end, requests, missing, funcs: [(func, 数量)]}]，按时间排列
+    def bursts(self) -> list:
+        bursts = []
+        last = None
+        for window in sorted(self.windows):
+            total, missing, funcs = self.windows[window]
+            if missing < self.burst_min or missing < self.burst_ratio * total:
+                continue
+            if last is not None and window == last + 1:
+                burst = bursts[-1]
+                burst['end'] = (window + 1) * self.burst_us
+                burst['requests'] += total
+                burst['missing'] += missing
+                for f, n in funcs.items():
+                    burst['funcs'][f] = burst['funcs'].get(f, 0) + n
+            else:
+                bursts.append({'start': window * self.burst_us, 'end': (window + 1) * self.burst_us,
+                               'requests': total, 'missing': missing, 'funcs': dict(funcs)})
+            last = window
+        for burst in bursts:
+            burst['funcs'] = sorted(burst['funcs'].items(), key=lambda item: (-item[1], item[0]))[:BURST_TOP_FUNCS]
+        return bursts
+
+    # 检测结果（JSON 可序列化），时间为日志中的整数微秒，耗时为秒
+    def result(self) -> dict:
+        def slow(heap):
+            return [{'func': func, 'pktid': pktid, 'afterget': afterget, 'duration': duration / US_PER_SEC,
+                     'reply_count': count} for duration, _, pktid, func, afterget, count in sorted(heap, reverse=True)]
+        return {
+            'requests': self.requests, 'missing': self.missing, 'factor': self.factor, 'quantile': self.quantile,
+            'top': slow(self.top),
+            'func_top': {str(f): slow(heap) for f, heap in sorted(self.func_top.items())},
+            'outlier_count': sum(self.outlier_counts.values()),
+            'outlier_counts': {str(f): n for f, n in sorted(self.outlier_counts.items())},
+            'outliers': [{'func': func, 'pktid': pktid, 'afterget': afterget, 'duration': duration / US_PER_SEC,
+                          'baseline': baseline, 'ratio': ratio}
+                         for ratio, _, pktid, func, afterget, duration, baseline in sorted(self.outliers, reverse=True)],
+            'bursts': [dict(burst, funcs=[[f, n] for f, n in burst['funcs']]) for burst in self.bursts()],
+        }
+
+    # 写出 <base>.txt 和 <base>.json，返回结果
+    def write(self, base: str, encoding: str = 'gb2312') -> dict:
+        result = self.result()
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        label = f"p{self.quantile:g}"
+        lines = [f"慢请求检测: 请求 {result['requests']} 笔，无应答 {result['missing']} 笔，"
+                 f"异常 {result['outlier_count']} 笔（耗时超过 {self.factor:g} 倍滚动 {label}），"
+                 f"无应答突增 {len(result['bursts'])} 段\n",
+                 f"\n== 耗时最长的 {len(result['top'])} 笔 ==\n"]
+        lines.extend(_slow_line(entry) for entry in result['top'])
+        for f, entries in result['func_top'].items():
+            lines.append(f"\n== 功能 {f} 耗时最长的 {len(entries)} 笔 ==\n")
+            lines.extend(_slow_line(entry) for entry in entries)
+        lines.append(f"\n== 异常（按耗时 / 基线 {label} 的倍数，前 {len(result['outliers'])} 笔） ==\n")
+        lines.extend(f"func: {entry['func']}, pktid: {entry['pktid']}, AfterGet: {format_ts_ms(entry['afterget'])}, "
+                     f"Duration: {entry['duration']} seconds, 基线 {label}: {entry['baseline']:.6f} seconds, "
+                     f"倍数: {entry['ratio']:.1f}\n" for entry in result['outliers'])
+        lines.append("\n== 无应答突增 ==\n")
+        lines.extend(f"时间: {format_ts_ms(burst['start'])} ~ {format_ts_ms(burst['end'])}, "
+                     f"无应答 {burst['missing']} / 请求 {burst['requests']}（{burst['missing'] / burst['requests']:.0%}），"
+                     f"主要功能: {', '.join(f'{f}({n})' for f, n in burst['funcs'])}\n" for burst in result['bursts'])
+        with open(base + '.txt', 'w', encoding=encoding, errors='replace') as f:
+            f.writelines(lines)
+        return result
+
+
+def _slow_line(entry: dict) -> str:
+    return (f"func: {entry['func']}, pktid: {entry['pktid']}, AfterGet: {format_ts_ms(entry['afterget'])}, "
+            f"Duration: {entry['duration']} seconds, 应答数: {entry['reply_count']}\n")
+
+
+# 把 rows（行号数组）按 keys[rows] 分组，依次产出 (键, 该组的行号)，行号保持原有先后
+def _groups(keys, rows):
+    if not len(rows):
+        return
+    values = keys[rows]
+    order = np.argsort(values, kind='stable')
+    bounds = np.flatnonzero(np.diff(values[order])) + 1
+    for part in np.split(order, bounds):
+        yield int(values[part[0]]), rows[part]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# 多文件/多服务器批量分析的公共部分：展开日志来源、按文件名识别服务器、进程池调度和进度报告
+# 每个文件独立解析和关联请求，结果交回主进程按服务器和全局汇总
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chunked import resolve_workers
+
+# 从文件名中提取服务器编号，如 a5_HTZQ_to_spx_19138_KbdSvrPacket_20240927_13.txt -> 19138
+SERVER_PATTERN = r'_(\d+)_KbdSvrPacket'
+# 目录来源下参与分析的文件
+DIR_PATTERN = '*.txt'
+
+
+# 展开日志来源：分号或换行分隔的文件、通配符（支持 **）或目录（递归查找 *.txt），去重后按路径排序
+def expand_sources(spec: str) -> list:
+    paths = []
+    for item in re.split(r'[;\n]', spec or ''):
+        item = item.strip()
+        if not item:
+            continue
+        if os.path.isdir(item):
+            paths.extend(glob.glob(os.path.join(item, '**', DIR_PATTERN), recursive=True))
+        elif glob.has_magic(item):
+            paths.extend(glob.glob(item, recursive=True))
+        else:
+            paths.append(item)
+    return sorted({os.path.abspath(path) for path in paths if os.path.isfile(path)})
+
+
+# 文件名中的服务器编号（pattern 的第一个分组），不匹配时返回 None
+def server_id(path: str, pattern: str = SERVER_PATTERN):
+    match = re.search(pattern, os.path.basename(path)) if pattern else None
+    return match.group(1) if match else None
+
+
+# 文件所属的服务器：文件名匹配 pattern 时取第一个分组，否则取所在目录名
+def server_of(path: str, pattern: str = SERVER_PATTERN) -> str:
+    server = server_id(path, pattern)
+    if server is not None:
+        return server
+    return os.path.basename(os.path.dirname(os.path.abspath(path))) or 'default'
+
+
+# 按服务器分组，每组内文件按路径排序（同一服务器的小时文件即按时间顺序）
+def group_by_server(paths, pattern: str = SERVER_PATTERN) -> dict:
+    groups = {}
+    for path in sorted(paths):
+        groups.setdefault(server_of(path, pattern), []).append(path)
+    return dict(sorted(groups.items()))
+
+
+# 对每个文件调用 func(path, *args)，按完成顺序产出 (path, 结果)，并通过 report 输出进度和吞吐量
+# workers 为 1 时在本进程内顺序处理
+def run_pool(func, paths, workers: int, *args, report=print):
+    paths = list(paths)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    done_bytes = 0
+    started = time.perf_counter()
+
+    def progress(i, path):
+        nonlocal done_bytes
+        done_bytes += os.path.getsize(path)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        report(f"[{i}/{len(paths)}] {os.path.basename(path)}: {done_bytes / 2 ** 20:.1f}/{total_bytes / 2 ** 20:.1f}MB, "
+               f"{elapsed:.1f}s, {done_bytes / 2 ** 20 / elapsed:.1f}MB/s")
+
+    workers = min(resolve_workers(workers), max(len(paths), 1))
+    if workers == 1:
+        for i, path in enumerate(paths, 1):
+            result = func(path, *args)
+            progress(i, path)
+            yield path, result
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, path, *args): path for path in paths}
+        for i, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            result = future.result()
+            progress(i, path)
+            yield path, result
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# 大日志文件的内存映射分块解析：按换行对齐切分字节区间，多进程并行扫描，
+# 再按文件顺序合并每个 pktid 的部分状态，结果与单进程逐行扫描完全一致
+#
+# 合并后的状态: pktid -> [func, AfterGet时间列表, 回复数, 第一个回复, 最后一个回复, 最大回复时间]
+# 只有出现过（时间段内的）AfterGet 的 pktid 才会建立条目，之前到达的回复计为未知 pktid 回复
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pktparse import parse_packet_line, iter_packet_events, MARKER, OP_AFTERGET, US_PER_DAY
+
+# 每个分块至少 8MB，分块数取进程数的 4 倍以平衡负载
+MIN_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKS_PER_WORKER = 4
+
+
+# 解析 workers 配置，0 或负数表示使用全部 CPU 核
+def resolve_workers(workers: int) -> int:
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+# 把 [start, size) 切成 count 段，start 须为行首，每段起点都对齐到行首
+def split_ranges(mm, size: int, count: int, start: int = 0) -> list:
+    bounds = [start]
+    for i in range(1, count):
+        nl = mm.find(b'\n', start + (size - start) * i // count, size)
+        pos = size if nl < 0 else nl + 1
+        if pos > bounds[-1]:
+            bounds.append(pos)
+    if bounds[-1] < size:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# 在 [start, end) 中用字面量查找 MARKER，只产出包含它的整行，其余行不进入 Python 层
+def iter_marked_lines(buf, start: int, end: int):
+    find = buf.find
+    rfind = buf.rfind
+    pos = find(MARKER, start, end)
+    while pos >= 0:
+        nl = rfind(b'\n', start, pos)
+        line_start = nl + 1 if nl >= 0 else start
+        nl = find(b'\n', pos, end)
+        line_end = nl + 1 if nl >= 0 else end
+        yield buf[line_start:line_end]
+        pos = find(MARKER, line_end, end)
+
+
+def _add_reply(stats: list, i: int, ts: int):
+    stats[i] += 1
+    if stats[i + 1] is None:
+        stats[i + 1] = ts
+    stats[i + 2] = ts
+    if stats[i + 3] is None or ts > stats[i + 3]:
+        stats[i + 3] = ts
+
+
+def _merge_replies(stats: list, i: int, other: list, j: int):
+    if not other[j]:
+        return
+    stats[i] += other[j]
+    if stats[i + 1] is None:
+        stats[i + 1] = other[j + 1]
+    stats[i + 2] = other[j + 2]
+    if stats[i + 3] is None or other[j + 3] > stats[i + 3]:
+        stats[i + 3] = other[j + 3]
+
+
+# 扫描一段日志行，返回 (opened, orphans)
+# opened: 本段内出现 AfterGet 的 pktid，按首个 AfterGet 的顺序排列，回复只统计其后的部分
+# orphans: 本段内在首个 AfterGet 之前（或根本没有 AfterGet）的回复 [数量, 第一个, 最后一个, 最大值]
+# window 为 (start_us, end_us) 当天时间段，只统计落在其中的 AfterGet
+def scan_lines(lines, window=None):
+    opened = {}
+    orphans = {}
+    start_us, end_us = window if window else (None, None)
+    for line in lines:
+        event = parse_packet_line(line)
+        if event is None:
+            continue
+        ts, op, pktid, func, _ = event
+        entry = opened.get(pktid)
+        if op == OP_AFTERGET:
+            if start_us is not None and not (start_us <= ts % US_PER_DAY <= end_us):
+                continue
+            if entry is None:
+                opened[pktid] = [func, [ts], 0, None, None, None]
+            else:
+                entry[1].append(ts)
+        elif entry is not None:
+            _add_reply(entry, 2, ts)
+        else:
+            stats = orphans.get(pktid)
+            if stats is None:
+                orphans[pktid] = [1, ts, ts, ts]
+            else:
+                _add_reply(stats, 0, ts)
+    return opened, orphans
+
+
+# 按文件顺序合并各分块的部分状态，返回 (state, 未知 pktid 回复数)
+def merge_partials(parts) -> tuple:
+    state = {}
+    orphan_replies = 0
+    for opened, orphans in parts:
+        # 同一 pktid 在本段内的 orphan 回复一定早于本段的首个 AfterGet，先合并
+        for pktid, stats in orphans.items():
+            entry = state.get(pktid)
+            if entry is None:
+                orphan_replies += stats[0]
+            else:
+                _merge_replies(entry, 2, stats, 0)
+        for pktid, part in opened.items():
+            entry = state.get(pktid)
+            if entry is None:
+                state[pktid] = part
+            else:
+                entry[1].extend(part[1])
+                _merge_replies(entry, 2, part, 2)
+    return state, orphan_replies
+
+
+# [start, end) 中的行数（末行没有换行符也算一行），按块统计换行符，不逐行进入 Python 层
+def count_range_lines(buf, start: int, end: int, block: int = 1 << 22) -> int:
+    lines = 0
+    for pos in range(start, end, block):
+        lines += buf[pos:min(pos + block, end)].count(b'\n')
+    return lines + (end > start and buf[end - 1:end] != b'\n')
+
+
+# 按文件顺序产出整个文件（或 span 指定的对齐行首的字节区间）的事件 (ts_us, op, pktid, func)，供流式关联使用
+# on_lines 不为 None 时在区间读完后以区间行数调用（用于运行剖析）
+def iter_file_events(path: str, span=None, on_lines=None):
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, end = span or (0, len(mm))
+        yield from iter_packet_events(iter_marked_lines(mm, start, end))
+        if on_lines is not None:
+            on_lines(count_range_lines(mm, start, end))
+
+
+# 返回 (opened, orphans, 行数)，count_lines 为 False 时行数为 None
+def _scan_range(path: str, start: int, end: int, window, count_lines=False):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        opened, orphans = scan_lines(iter_marked_lines(mm, start, end), window)
+        return opened, orphans, count_range_lines(mm, start, end) if count_lines else None
+
+
+# 把文件（或 span 指定的对齐行首的字节区间）切成对齐行首的分块，对每块调用 func(path, start, end, *args)，
+# 按文件顺序返回各块结果；workers 为 1 或区间较小时整个区间作为一块在本进程内处理
+def map_ranges(path: str, workers: int, func, *args, span=None) -> list:
+    start, size = span or (0, os.path.getsize(path))
+    if size <= start:
+        return []
+    workers = resolve_workers(workers)
+    count = min(workers * CHUNKS_PER_WORKER, (size - start) // MIN_CHUNK_SIZE)
+    if workers == 1 or count <= 1:
+        return [func(path, start, size, *args)]
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = split_ranges(mm, size, count, start)
+
+    n = len(ranges)
+    with ProcessPoolExecutor(max_workers=min(workers, n)) as pool:
+        return list(pool.map(func, [path] * n, [r[0] for r in ranges], [r[1] for r in ranges],
+                             *([arg] * n for arg in args)))
+
+
+# 扫描整个日志文件，workers > 1 时按分块多进程并行；on_lines 不为 None 时以文件行数调用（各分块在映射期间顺便统计）
+def scan_file(path: str, workers: int = 1, window=None, on_lines=None) -> tuple:
+    parts = map_ranges(path, workers, _scan_range, window, on_lines is not None)
+    if on_lines is not None:
+        on_lines(sum(part[2] for part in parts))
+    return merge_partials(part[:2] for part in parts)
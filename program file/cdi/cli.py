@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# 统一命令行入口: python cli.py [--timing] [--check] <子命令> [选项]
+#   analyze      按 config.ini 运行完整分析（与 python log_asy.py 相同：导出来源/跟踪/批量/流式/一次性解析）
+#   summary      只解析 log_path 并写出 summary.txt
+#   intervals    只解析 log_path 并写出时间段统计
+#   scan-errors  扫描源码中的 sErrMsg/sNote.Format 语句（findCodingError.py，[Directories]）
+#   follow       跟踪模式，只解析新追加的日志
+#   assay        按 LogAssay.ini 运行 logassay.py
+#   triage       批量调用大模型分诊错误信息（Ds_apiuse.py，[LLM]）
+#   join         按 pktid 关联多个来源的日志，输出逐段耗时（logjoin.py，[Join]）
+# 各子命令的模块在执行时才导入，numpy/pyarrow/chardet/openai 等随之按需加载，--help 和参数错误不导入任何分析模块；
+# 配置文件在入口读取、校验一次，设置以参数传给各模块的函数。--check 只导入模块并校验配置，不运行；
+# --timing 在结束时向 stderr 输出导入、读取配置和运行各自的耗时；整个进程的冷启动耗时见 bench/coldstart.py
+import argparse
+import importlib
+import logging
+import os
+import sys
+import time
+
+CDI_DIR = os.path.dirname(os.path.abspath(__file__))
+PROGRAM_DIR = os.path.dirname(CDI_DIR)
+sys.path.insert(0, CDI_DIR)
+
+# 子命令 -> (模块, 说明)
+COMMANDS = {
+    'analyze': ('log_asy', '按 config.ini 运行完整分析'),
+    'summary': ('log_asy', '只写出汇总 summary.txt'),
+    'intervals': ('log_asy', '只写出时间段统计'),
+    'scan-errors': ('findCodingError', '扫描源码中的错误信息语句'),
+    'follow': ('log_asy', '跟踪模式，只解析新追加的日志'),
+    'assay': ('logassay', '按 LogAssay.ini 运行 logassay'),
+    'triage': ('Ds_apiuse', '批量调用大模型分诊错误信息'),
+    'join': ('logjoin', '按 pktid 关联多个来源的日志，输出逐段耗时'),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description='KbdSvr 日志分析工具')
+    parser.add_argument('--timing', action='store_true', help='结束时输出导入、读取配置和运行的耗时')
+    parser.add_argument('--check', action='store_true', help='只校验配置，不运行')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='子命令')
+    for name, (_, text) in COMMANDS.items():
+        command = commands.add_parser(name, help=text, description=text)
+        if name == 'assay':
+            command.add_argument('--config', default=os.path.join(PROGRAM_DIR, 'LogAssay.ini'), help='配置文件')
+        else:
+            command.add_argument('--config', default=os.path.join(PROGRAM_DIR, 'config', 'config.ini'), help='配置文件')
+        if name in ('analyze', 'summary', 'intervals', 'follow'):
+            command.add_argument('--log', help='日志文件（覆盖 [Paths] log_path）')
+        if name in ('analyze', 'summary', 'intervals'):
+            command.add_argument('--workers', type=int, help='解析进程数（覆盖 [Parallel] workers）')
+        if name == 'follow':
+            command.add_argument('--poll-interval', type=float, help='刷新间隔秒数，0 为刷新一次即退出')
+        if name == 'scan-errors':
+            command.add_argument('dirs', nargs='*', help='源码目录（默认为 [Directories] search_dirs）')
+            command.add_argument('--output', help='结果文件（覆盖 [Directories] output_file）')
+            command.add_argument('--workers', type=int, help='扫描进程数（覆盖 [Directories] workers）')
+        if name == 'join':
+            command.add_argument('--workers', type=int, help='进程数（覆盖 [Join] workers）')
+            command.add_argument('--out-dir', help='结果目录（覆盖 [Paths] out_dir）')
+        if name == 'triage':
+            command.add_argument('input', help='输入文件，每行一条（findCodingError 的结果可直接使用）')
+            command.add_argument('output', nargs='?', help='输出的 JSON Lines 文件')
+    return parser
+
+
+# 读取并校验子命令的配置，返回传给 run 的设置
+def load_settings(module, args):
+    if args.command == 'assay':
+        if not os.path.exists(args.config):
+            raise FileNotFoundError(f"找不到配置文件: {args.config}")
+        return module.read_config(args.config)
+    if args.command == 'scan-errors':
+        search_dirs, output, workers = module.read_config(args.config)
+        return (args.dirs or search_dirs, args.output or output, workers if args.workers is None else args.workers)
+    if args.command == 'triage':
+        return module.read_config(args.config)
+    settings = module.read_config(args.config)
+    if getattr(args, 'out_dir', None):
+        settings['out_dir'] = os.path.abspath(args.out_dir)
+    if getattr(args, 'log', None):
+        settings['log_path'] = os.path.abspath(args.log)
+    if getattr(args, 'workers', None) is not None:
+        settings['workers'] = args.workers
+    if getattr(args, 'poll_interval', None) is not None:
+        settings['poll_interval'] = args.poll_interval
+    return settings
+
+
+def run(module, args, settings) -> int:
+    command = args.command
+    if command == 'analyze':
+        module.analyze(settings)
+    elif command in ('summary', 'intervals'):
+        module.run_reports(settings, requests_files=False, summary=command == 'summary',
+                           intervals=command == 'intervals')
+    elif command == 'follow':
+        module.follow_log(settings)
+    elif command == 'scan-errors':
+        search_dirs, output, workers = settings
+        files, written = module.recursive_search(search_dirs, output, workers)
+        print(f"搜索完成，共扫描 {files} 个文件，{written} 条结果已保存至 {output}")
+    elif command == 'assay':
+        return module.run(settings)
+    elif command == 'join':
+        stats = module.join_logs(settings)
+        print(f"共 {stats['requests']} 笔请求，各来源关联到的请求数 {stats['matched']}，结果已保存至 {stats['output']}")
+    elif command == 'triage':
+        import asyncio
+        prompts = module.read_prompts(args.input)
+        output_path = args.output or os.path.splitext(args.input)[0] + '_triage.jsonl'
+        with open(output_path, 'w', encoding='utf-8') as output:
+            stats = asyncio.run(module.triage(prompts, output, settings, module.get_api_key()))
+        print(f"共 {stats['prompts']} 条，请求 {stats['requests']} 次，缓存命中 {stats['cache_hits']}，"
+              f"失败 {stats['failures']}，结果已保存至 {output_path}")
+    return 0
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    timings = {}
+    started = time.perf_counter()
+    module_name = COMMANDS[args.command][0]
+    if module_name == 'logassay':
+        sys.path.insert(0, PROGRAM_DIR)
+    module = importlib.import_module(module_name)
+    timings['import_s'] = time.perf_counter() - started
+    try:
+        settings = load_settings(module, args)
+    except Exception as e:
+        print(f"配置错误: {e}", file=sys.stderr)
+        return 2
+    timings['config_s'] = time.perf_counter() - started - timings['import_s']
+    code = 0
+    if args.check:
+        print(f"{args.command}: 配置有效")
+    else:
+        run_started = time.perf_counter()
+        code = run(module, args, settings)
+        timings['run_s'] = time.perf_counter() - run_started
+    if args.timing:
+        print(f"[timing] {args.command}: 导入 {timings['import_s'] * 1000:.0f}ms，读取配置 {timings['config_s'] * 1000:.1f}ms"
+              + (f"，运行 {timings['run_s']:.2f}s" if 'run_s' in timings else ''), file=sys.stderr)
+    return code or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
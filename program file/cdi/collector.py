@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# 实时采集服务：同时接收多个网关的 KbdSvrPacket 日志行（跟踪本地日志文件、Unix/TCP 套接字），
+# 按来源用与 log_asy.py 流式模式相同的解析和关联逻辑（pktparse/streaming）得到请求，
+# 在内存中保留每个 func 最近 1/5/15 分钟的请求量、QPS 和耗时分位数（可合并草图，见 sketch.py），
+# 并通过本地 HTTP 接口以 JSON 提供：GET /stats 为统计，GET /health 为各来源的采集状态
+#
+# 各来源解析出的事件经有界队列交给唯一的汇总协程：队列满时读取方暂停（套接字不再读取，发送方随之阻塞），
+# HTTP 请求只返回汇总协程每秒生成的快照，慢速的查询方只占用自己的连接，不会拖慢采集
+#
+# 统计口径与 log_asy.py 相同：同一 pktid 以首个 AfterGet 为接收时间，耗时为最后一个回复减接收时间，
+# 请求在空闲 idle_timeout 秒（日志时间）后才关闭计入，所以各窗口截止于 最新日志时间 - idle_timeout
+#
+# 用法: python collector.py                          按 ../config/config.ini 的 [Collector] 启动服务
+#       python collector.py ship 日志文件 地址 [每秒行数]  把日志文件逐行发给 tcp://主机:端口 或 unix://路径（模拟转发程序）
+import asyncio
+import configparser
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+from pktparse import parse_packet_line, format_ts, US_PER_SEC
+from streaming import StreamCorrelator
+from follow import LogFollower
+from sketch import LatencySketch, DEFAULT_ACCURACY
+from latency import parse_percentiles, percentile_label, DEFAULT_PERCENTILES
+
+# 滚动窗口（秒）和分桶粒度（秒），窗口按整桶计算
+WINDOWS = (60, 300, 900)
+BUCKET_SECONDS = 10
+DEFAULT_IDLE_TIMEOUT = 5.0
+# 每批交给汇总协程的事件数、套接字每次读取的字节数
+BATCH_EVENTS = 4096
+READ_SIZE = 64 * 1024
+# HTTP 读取请求、写出响应的超时（秒）
+HTTP_TIMEOUT = 5.0
+
+
+def window_label(seconds: int) -> str:
+    return f"{seconds // 60}m" if seconds % 60 == 0 else f"{seconds}s"
+
+
+# 解析 'tcp://主机:端口'、'unix://路径' 或 '主机:端口'，返回 ('tcp', (主机, 端口)) 或 ('unix', 路径)
+def parse_address(address: str) -> tuple:
+    if address.startswith('unix://'):
+        return 'unix', address[len('unix://'):]
+    if address.startswith('tcp://'):
+        address = address[len('tcp://'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class RollingStats:
+    # 每个 func 按 bucket_seconds 分桶保存耗时草图（计数器 req_count/reply_count/no_reply），只保留最长窗口内的桶
+    def __init__(self, windows=WINDOWS, bucket_seconds: int = BUCKET_SECONDS,
+                 relative_accuracy: float = DEFAULT_ACCURACY):
+        self.windows = tuple(windows)
+        self.bucket_us = bucket_seconds * US_PER_SEC
+        self.keep_us = max(self.windows) * US_PER_SEC + self.bucket_us
+        self.relative_accuracy = relative_accuracy
+        # func -> {桶起点微秒: LatencySketch}
+        self.buckets = {}
+        # 关闭时已超出保留范围而丢弃的请求数
+        self.dropped = 0
+
+    # 累加一笔已关闭的请求；无回复的请求只计数，不计入耗时
+    def add(self, func: int, recv_us: int, reply_count: int, proc_time: float, end_us: int):
+        start = recv_us - recv_us % self.bucket_us
+        if start < end_us - self.keep_us:
+            self.dropped += 1
+            return
+        sketches = self.buckets.get(func)
+        if sketches is None:
+            sketches = self.buckets[func] = {}
+        sketch = sketches.get(start)
+        if sketch is None:
+            sketch = sketches[start] = LatencySketch(self.relative_accuracy)
+        if reply_count:
+            sketch.add(proc_time)
+        sketch.add_counters(req_count=1, reply_count=reply_count, no_reply=0 if reply_count else 1)
+
+    # 删除早于保留范围的桶
+    def expire(self, end_us: int):
+        limit = end_us - self.keep_us
+        for func in list(self.buckets):
+            sketches = self.buckets[func]
+            for start in [start for start in sketches if start < limit]:
+                del sketches[start]
+            if not sketches:
+                del self.buckets[func]
+
+    def _entry(self, sketch: LatencySketch, seconds: int, percentiles) -> dict:
+        stats = sketch.stats(percentiles)
+        req_count = stats.get('req_count', 0)
+        reply_count = stats.get('reply_count', 0)
+        entry = {'req_count': req_count, 'reply_count': reply_count, 'no_reply': stats.get('no_reply', 0),
+                 'qps': req_count / seconds, 'reply_qps': reply_count / seconds}
+        for name in ('min', 'max', 'mean', 'std'):
+            entry[f"{name}_s"] = stats[name]
+        for p, value in zip(percentiles, stats['percentiles']):
+            entry[f"{percentile_label(p)}_s"] = value
+        return entry
+
+    # 截止到 end_us（对齐到桶边界）的各窗口统计：{'funcs': {func: {窗口: 统计}}, 'total': {窗口: 统计}}
+    def snapshot(self, end_us: int, percentiles=DEFAULT_PERCENTILES) -> dict:
+        end_us -= end_us % self.bucket_us
+        funcs = {}
+        totals = {seconds: LatencySketch(self.relative_accuracy) for seconds in self.windows}
+        for func in sorted(self.buckets):
+            sketches = self.buckets[func]
+            entry = {}
+            for seconds in self.windows:
+                merged = LatencySketch(self.relative_accuracy)
+                begin = end_us - seconds * US_PER_SEC
+                for start, sketch in sketches.items():
+                    if begin <= start < end_us:
+                        merged.merge(sketch)
+                totals[seconds].merge(merged)
+                entry[window_label(seconds)] = self._entry(merged, seconds, percentiles)
+            funcs[str(func)] = entry
+        return {'end': format_ts(end_us), 'end_us': end_us,
+                'funcs': funcs,
+                'total': {window_label(s): self._entry(totals[s], s, percentiles) for s in self.windows}}
+
+
+class Collector:
+    # idle_timeout: 请求空闲多少秒（日志时间）后关闭计入；queue_size: 待汇总的事件批数上限
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT, percentiles=DEFAULT_PERCENTILES,
+                 relative_accuracy: float = DEFAULT_ACCURACY, queue_size: int = 256):
+        self.idle_timeout = idle_timeout
+        self.percentiles = percentiles
+        self.stats = RollingStats(relative_accuracy=relative_accuracy)
+        self.queue = asyncio.Queue(queue_size)
+        self.correlators = {}
+        # 来源 -> 采集计数；连接断开的套接字来源计入 closed_sources
+        self.sources = {}
+        self.closed_sources = 0
+        self.latest_ts = None
+        self.started = time.time()
+        self.snapshot = b'{}'
+        self.health = b'{}'
+
+    # 读取方调用：把一批事件交给汇总协程，队列满时在此等待（背压）
+    async def ingest(self, source: str, events: list, lines: int):
+        info = self.sources.setdefault(source, {'lines': 0, 'events': 0, 'blocked_s': 0.0})
+        info['lines'] += lines
+        info['events'] += len(events)
+        if self.queue.full():
+            waited = time.perf_counter()
+            await self.queue.put((source, events))
+            info['blocked_s'] += time.perf_counter() - waited
+        else:
+            self.queue.put_nowait((source, events))
+
+    # 来源结束（连接断开）：关闭其全部在途请求
+    async def close_source(self, source: str):
+        await self.queue.put((source, None))
+
+    def _end_us(self) -> int:
+        return self.latest_ts - int(self.idle_timeout * US_PER_SEC)
+
+    def _add_closed(self, closed):
+        end_us = self._end_us()
+        for pktid, (func, afterget, reply_count, _, last_reply, _) in closed:
+            recv_us = afterget[0]
+            proc_time = (last_reply - recv_us) / US_PER_SEC if reply_count else 0.0
+            self.stats.add(func, recv_us, reply_count, proc_time, end_us)
+
+    # 汇总协程：唯一修改关联状态和滚动统计的地方
+    async def aggregate(self):
+        while True:
+            source, events = await self.queue.get()
+            correlator = self.correlators.get(source)
+            if events is None:
+                if correlator is not None:
+                    self._add_closed(correlator.flush())
+                    del self.correlators[source]
+                self.sources.pop(source, None)
+                self.closed_sources += 1
+                continue
+            if correlator is None:
+                correlator = self.correlators[source] = StreamCorrelator(self.idle_timeout)
+            feed = correlator.feed
+            for ts, op, pktid, func in events:
+                closed = feed(ts, op, pktid, func)
+                if closed:
+                    self.latest_ts = max(self.latest_ts or ts, correlator.watermark)
+                    self._add_closed(closed)
+            if correlator.watermark is not None:
+                self.latest_ts = max(self.latest_ts or correlator.watermark, correlator.watermark)
+
+    # 每 interval 秒以所有来源的最新日志时间推进各来源的水位线，清理过期的桶并生成快照
+    async def refresh(self, interval: float = 1.0):
+        while True:
+            if self.latest_ts is not None:
+                for correlator in self.correlators.values():
+                    self._add_closed(correlator.advance(self.latest_ts))
+                self.stats.expire(self._end_us())
+                snapshot = self.stats.snapshot(self._end_us(), self.percentiles)
+                snapshot['latest'] = format_ts(self.latest_ts)
+                self.snapshot = json.dumps(snapshot, ensure_ascii=False).encode('utf-8')
+            sources = {name: dict(info, open_pktids=len(self.correlators[name].pending) if name in self.correlators else 0)
+                       for name, info in self.sources.items()}
+            self.health = json.dumps({
+                'uptime_s': time.time() - self.started, 'queue': self.queue.qsize(), 'queue_max': self.queue.maxsize,
+                'latest': format_ts(self.latest_ts) if self.latest_ts is not None else None,
+                'dropped_late': self.stats.dropped, 'closed_sources': self.closed_sources, 'sources': sources,
+            }, ensure_ascii=False).encode('utf-8')
+            await asyncio.sleep(interval)
+
+    # 跟踪本地日志文件（小时文件滚动时自动切换）；from_start 为 False 时从文件当前末尾开始
+    async def tail_file(self, path: str, from_start: bool = False, poll_interval: float = 0.5):
+        offset = 0
+        if not from_start and os.path.exists(path):
+            # 从最后一个完整行之后开始，只需读取文件末尾
+            with open(path, 'rb') as f:
+                end = f.seek(0, os.SEEK_END)
+                while end > 0 and not offset:
+                    start = max(end - READ_SIZE, 0)
+                    f.seek(start)
+                    newline = f.read(end - start).rfind(b'\n')
+                    if newline >= 0:
+                        offset = start + newline + 1
+                    end = start
+        follower = LogFollower(path, offset)
+        source = f"file:{path}"
+        while True:
+            read_from, lines_from = follower.bytes_read, follower.lines_read
+            events = await asyncio.to_thread(lambda: list(follower.poll()))
+            # 本次读到的行数随第一批事件计入；没有事件时直接计入来源统计
+            lines = follower.lines_read - lines_from
+            for i in range(0, len(events), BATCH_EVENTS):
+                await self.ingest(source, events[i:i + BATCH_EVENTS], lines if i == 0 else 0)
+            info = self.sources.setdefault(source, {'lines': 0, 'events': 0, 'blocked_s': 0.0})
+            info['path'] = follower.path
+            if not events:
+                info['lines'] += lines
+            if follower.bytes_read == read_from:
+                await asyncio.sleep(poll_interval)
+
+    # 套接字连接：读取日志行并解析，每个连接是一个独立来源
+    async def handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        source = f"tcp:{peer[0]}:{peer[1]}" if isinstance(peer, tuple) else f"unix:{id(writer):x}"
+        logging.info(f"Source connected: {source}")
+        tail = b''
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                lines = (tail + data).split(b'\n')
+                tail = lines.pop()
+                await self._ingest_lines(source, lines)
+            if tail:
+                await self._ingest_lines(source, [tail])
+        except ConnectionError as e:
+            logging.warning(f"Source {source} disconnected: {e}")
+        finally:
+            writer.close()
+            await self.close_source(source)
+            logging.info(f"Source closed: {source}")
+
+    async def _ingest_lines(self, source: str, lines: list):
+        events = []
+        for line in lines:
+            event = parse_packet_line(line)
+            if event is not None:
+                events.append(event[:4])
+        await self.ingest(source, events, len(lines))
+
+    # 最小的 HTTP/1.0 接口：GET /stats、GET /health，响应后关闭连接；读写都有超时
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)
+            while (await asyncio.wait_for(reader.readline(), HTTP_TIMEOUT)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            path = parts[1].split(b'?')[0] if len(parts) > 1 else b''
+            if parts[:1] != [b'GET']:
+                status, body = b'405 Method Not Allowed', b'{"error": "method not allowed"}'
+            elif path in (b'/', b'/stats'):
+                status, body = b'200 OK', self.snapshot
+            elif path == b'/health':
+                status, body = b'200 OK', self.health
+            else:
+                status, body = b'404 Not Found', b'{"error": "not found"}'
+            writer.write(b'HTTP/1.0 ' + status + b'\r\nContent-Type: application/json; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await asyncio.wait_for(writer.drain(), HTTP_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+# 启动服务：files 为跟踪的日志文件，tcp/unix 为接收日志行的监听地址，http 为统计接口地址（主机:端口）
+async def serve(files=(), tcp: str = '', unix: str = '', http: str = '127.0.0.1:9480',
+                idle_timeout: float = DEFAULT_IDLE_TIMEOUT, percentiles=DEFAULT_PERCENTILES,
+                relative_accuracy: float = DEFAULT_ACCURACY, from_start: bool = False, poll_interval: float = 0.5,
+                queue_size: int = 256):
+    collector = Collector(idle_timeout, percentiles, relative_accuracy, queue_size)
+    tasks = [asyncio.create_task(collector.aggregate()), asyncio.create_task(collector.refresh())]
+    tasks += [asyncio.create_task(collector.tail_file(path, from_start, poll_interval)) for path in files]
+    servers = []
+    if tcp:
+        host, port = parse_address(tcp)[1]
+        servers.append(await asyncio.start_server(collector.handle_stream, host, port))
+        logging.info(f"Accepting log lines on tcp://{host}:{port}")
+    if unix:
+        servers.append(await asyncio.start_unix_server(collector.handle_stream, unix))
+        logging.info(f"Accepting log lines on unix://{unix}")
+    host, port = parse_address(http)[1]
+    servers.append(await asyncio.start_server(collector.handle_http, host, port))
+    logging.info(f"Serving stats on http://{host}:{port}/stats, tailing {len(files)} files")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for server in servers:
+            server.close()
+
+
+# 模拟转发程序：把日志文件逐行发给采集服务，rate 为每秒行数（0 为不限速）
+def ship(path: str, address: str, rate: float = 0):
+    kind, target = parse_address(address)
+    sock = socket.socket(socket.AF_UNIX if kind == 'unix' else socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(target)
+    sent = 0
+    started = time.perf_counter()
+    with sock, open(path, 'rb') as f:
+        batch = []
+        for line in f:
+            batch.append(line)
+            if len(batch) >= 1000:
+                sock.sendall(b''.join(batch))
+                sent += len(batch)
+                batch.clear()
+                if rate > 0:
+                    time.sleep(max(sent / rate - (time.perf_counter() - started), 0))
+        if batch:
+            sock.sendall(b''.join(batch))
+            sent += len(batch)
+    elapsed = time.perf_counter() - started
+    print(f"已发送 {sent} 行，{elapsed:.1f}s，{sent / max(elapsed, 1e-9):.0f} 行/秒")
+
+
+def main(argv):
+    if len(argv) >= 4 and argv[1] == 'ship':
+        ship(argv[2], argv[3], float(argv[4]) if len(argv) > 4 else 0)
+        return 0
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.ini'), encoding='utf-8')
+    files = [path.strip() for path in config.get('Collector', 'files', fallback='').split(';') if path.strip()]
+    asyncio.run(serve(
+        files, config.get('Collector', 'tcp', fallback=''), config.get('Collector', 'unix', fallback=''),
+        config.get('Collector', 'http', fallback='') or '127.0.0.1:9480',
+        config.getfloat('Collector', 'idle_timeout', fallback=DEFAULT_IDLE_TIMEOUT),
+        parse_percentiles(config.get('Summary', 'percentiles', fallback='')),
+        config.getfloat('Summary', 'relative_accuracy', fallback=DEFAULT_ACCURACY),
+        config.getboolean('Collector', 'from_start', fallback=False),
+        config.getfloat('Collector', 'poll_interval', fallback=0.5),
+        config.getint('Collector', 'queue_size', fallback=256)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
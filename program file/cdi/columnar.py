@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# 解析事件的列式存储：int64 微秒时间戳 / uint64 pktid / int32 func / uint8 操作码
+# 追加阶段用 array 缓冲（每个事件 21 字节），计算阶段零拷贝转成 NumPy 数组，
+# 请求关联、耗时、分组统计和排序都在列上向量化完成
+import mmap
+from array import array
+
+import numpy as np
+
+from pktparse import iter_packet_events, OP_AFTERGET, US_PER_DAY
+from chunked import iter_marked_lines, map_ranges
+
+# 缺失时间戳的占位值（日志时间均晚于 1970 年，不会与真实值冲突）
+NO_TS = -1
+
+
+class EventColumns:
+    def __init__(self):
+        self.ts = array('q')
+        self.pktid = array('Q')
+        self.func = array('i')
+        self.op = array('B')
+
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(col.itemsize * len(col) for col in (self.ts, self.pktid, self.func, self.op))
+
+    def append(self, ts: int, op: int, pktid: int, func: int):
+        self.ts.append(ts)
+        self.op.append(op)
+        self.pktid.append(pktid)
+        self.func.append(func)
+
+    # 追加事件流 (ts_us, op, pktid, func)
+    def extend(self, events):
+        ts, op, pktid, func = self.ts.append, self.op.append, self.pktid.append, self.func.append
+        for t, o, p, f in events:
+            ts(t)
+            op(o)
+            pktid(p)
+            func(f)
+
+    # 按顺序拼接多个分块的结果
+    @classmethod
+    def concat(cls, parts):
+        cols = cls()
+        for part in parts:
+            cols.ts.extend(part.ts)
+            cols.pktid.extend(part.pktid)
+            cols.func.extend(part.func)
+            cols.op.extend(part.op)
+        return cols
+
+    # 零拷贝转成 NumPy 数组，期间不要再追加事件
+    def arrays(self) -> dict:
+        return {
+            'ts': np.frombuffer(self.ts, dtype=np.int64),
+            'pktid': np.frombuffer(self.pktid, dtype=np.uint64),
+            'func': np.frombuffer(self.func, dtype=np.int32),
+            'op': np.frombuffer(self.op, dtype=np.uint8),
+        }
+
+
+def _load_range(path: str, start: int, end: int) -> EventColumns:
+    cols = EventColumns()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        cols.extend(iter_packet_events(iter_marked_lines(mm, start, end)))
+    return cols
+
+
+# 读取整个日志文件（或 span 指定的字节区间）为列式事件，workers > 1 时分块多进程解析后按文件顺序拼接
+def load_columns(path: str, workers: int = 1, span=None) -> EventColumns:
+    return EventColumns.concat(map_ranges(path, workers, _load_range, span=span))
+
+
+# 按首次出现顺序分组，返回 (唯一值, 每个元素的组号)
+def group_by_first_seen(keys):
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    return uniq[order], rank[inverse.ravel()]
+
+
+# 分段归约，空输入时 reduceat 会报错
+def _reduce(ufunc, values, starts):
+    return ufunc.reduceat(values, starts) if len(starts) else values[:0]
+
+
+# 向量化请求关联，口径与 chunked.scan_file 一致：
+# 只统计（时间段内的）AfterGet 建立的 pktid，回复只统计该 pktid 首个 AfterGet 之后的部分
+# 事件按 pktid 稳定排序一次后，每个 pktid 的事件连续且保持文件顺序，其余都是分段归约
+# 返回按首个 AfterGet 顺序排列的每 pktid 列，以及每个 AfterGet 一行的请求列:
+#   pktid/func/afterget/reply_count/first_reply/last_reply/max_reply（缺失为 NO_TS）
+#   ag_row（所属 pktid 行号）/ag_ts，按 pktid 行号、再按文件顺序排列
+def correlate(events: dict, window=None) -> dict:
+    ts, op, pktid, func = events['ts'], events['op'], events['pktid'], events['func']
+    n = len(ts)
+    is_ag = op == OP_AFTERGET
+    if window is not None:
+        tod = ts % US_PER_DAY
+        is_ag &= (tod >= window[0]) & (tod <= window[1])
+
+    order = np.argsort(pktid, kind='stable')
+    sorted_pktid = pktid[order]
+    sorted_ts = ts[order]
+    sorted_ag = is_ag[order]
+    sorted_reply = op[order] != OP_AFTERGET
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = sorted_pktid[1:] != sorted_pktid[:-1]
+    starts = np.flatnonzero(boundary)
+    group = np.cumsum(boundary) - 1
+    pos = np.arange(n)
+
+    # 每个 pktid 首个 AfterGet 的位置，之后的回复才计入
+    first_ag = _reduce(np.minimum, np.where(sorted_ag, pos, n), starts)
+    valid = sorted_reply & (pos > first_ag[group])
+    has_ag = first_ag < n
+
+    reply_count = _reduce(np.add, valid.astype(np.int64), starts)
+    first_pos = _reduce(np.minimum, np.where(valid, pos, n), starts)
+    last_pos = _reduce(np.maximum, np.where(valid, pos, -1), starts)
+    max_reply = _reduce(np.maximum, np.where(valid, sorted_ts, NO_TS), starts)
+    padded_ts = np.append(sorted_ts, NO_TS)
+    first_reply = padded_ts[first_pos]
+    last_reply = padded_ts[last_pos]
+
+    # 只保留有 AfterGet 的 pktid，按首个 AfterGet 在文件中的位置排列
+    keep = np.flatnonzero(has_ag)
+    rows = keep[np.argsort(order[first_ag[keep]], kind='stable')]
+    rank = np.full(len(starts), -1, dtype=np.intp)
+    rank[rows] = np.arange(len(rows))
+
+    ag_pos = np.flatnonzero(sorted_ag)
+    ag_row = rank[group[ag_pos]]
+    ag_order = np.argsort(ag_row, kind='stable')
+    return {
+        'pktid': sorted_pktid[starts[rows]],
+        'func': func[order[first_ag[rows]]],
+        'afterget': sorted_ts[first_ag[rows]],
+        'reply_count': reply_count[rows],
+        'first_reply': first_reply[rows],
+        'last_reply': last_reply[rows],
+        'max_reply': max_reply[rows],
+        'ag_row': ag_row[ag_order],
+        'ag_ts': sorted_ts[ag_pos[ag_order]],
+        'orphan_replies': int(np.count_nonzero(sorted_reply) - reply_count.sum()),
+    }
+
+
+# 向量化的请求配对，口径与 StreamCorrelator(pair=True) 一致：每个 AfterGet 是一笔请求，
+# 回复配给同一 pktid 在它之前最近的一个 AfterGet，首个 AfterGet 之前的回复为孤立回复；
+# 时间段外的 AfterGet 同样截断上一笔请求，但本身不输出
+# 事件按 pktid 稳定排序后，每笔请求及其回复是连续的一段，按段归约即可，不会因 pktid 复用而出现平方复杂度
+# 返回按 AfterGet 在文件中的顺序排列的每请求列 pktid/func/afterget/reply_count/first_reply/last_reply/max_reply
+# （缺失为 NO_TS），以及孤立回复数 orphan_replies、pktid 复用次数 reused_pktids
+def pair_requests(events: dict, window=None) -> dict:
+    ts, op, pktid, func = events['ts'], events['op'], events['pktid'], events['func']
+    n = len(ts)
+    order = np.argsort(pktid, kind='stable')
+    sorted_pktid = pktid[order]
+    sorted_ts = ts[order]
+    sorted_ag = op[order] == OP_AFTERGET
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = sorted_pktid[1:] != sorted_pktid[:-1]
+    pos = np.arange(n)
+
+    # 每个位置之前（含）最近的 AfterGet 位置，不在同一个 pktid 内（或没有）时为孤立回复
+    last_ag = np.maximum.accumulate(np.where(sorted_ag, pos, -1)) if n else pos
+    group_start = np.maximum.accumulate(np.where(boundary, pos, 0)) if n else pos
+    valid = ~sorted_ag & (last_ag >= group_start)
+
+    # 每个 AfterGet 开始一段，段内只有它自己的回复（其他 pktid 的孤立回复已排除）
+    ag_pos = np.flatnonzero(sorted_ag)
+    reply_count = _reduce(np.add, valid.astype(np.int64), ag_pos)
+    first_pos = _reduce(np.minimum, np.where(valid, pos, n), ag_pos)
+    last_pos = _reduce(np.maximum, np.where(valid, pos, -1), ag_pos)
+    max_reply = _reduce(np.maximum, np.where(valid, sorted_ts, NO_TS), ag_pos)
+    padded_ts = np.append(sorted_ts, NO_TS)
+
+    keep = np.argsort(order[ag_pos], kind='stable')
+    if window is not None:
+        tod = sorted_ts[ag_pos[keep]] % US_PER_DAY
+        keep = keep[(tod >= window[0]) & (tod <= window[1])]
+    rows = ag_pos[keep]
+    return {
+        'pktid': sorted_pktid[rows],
+        'func': func[order[rows]],
+        'afterget': sorted_ts[rows],
+        'reply_count': reply_count[keep],
+        'first_reply': padded_ts[first_pos[keep]],
+        'last_reply': padded_ts[last_pos[keep]],
+        'max_reply': max_reply[keep],
+        'orphan_replies': int(np.count_nonzero(~sorted_ag) - np.count_nonzero(valid)),
+        'reused_pktids': len(ag_pos) - len(np.unique(group_start[ag_pos])),
+    }
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# 逐笔请求记录的列式导出：按 日期/服务器/功能 分区写成 Parquet 或 Arrow IPC（hive 目录风格，
+# 如 date=20240927/server=19138/func=100/），供其他查询引擎直接读取；read_requests 把导出的
+# 记录读回为 NumPy 列，交给汇总/时间段统计，无需再解析原始日志
+# 依赖 pyarrow（pip install pyarrow），只在用到导出功能时才导入
+import os
+
+import numpy as np
+
+from pktparse import US_PER_SEC, US_PER_DAY
+
+# 配置中的格式名 -> pyarrow.dataset 的格式名和文件扩展名
+EXPORT_FORMATS = {'parquet': ('parquet', 'parquet'), 'arrow': ('ipc', 'arrow')}
+PARTITION_COLUMNS = ('date', 'server', 'func')
+# 读回时缺失的时间戳（无回复）
+NO_TS = -1
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError("导出/读取列式文件需要安装 pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def _format(fmt: str) -> tuple:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选 {', '.join(EXPORT_FORMATS)}")
+    return EXPORT_FORMATS[fmt]
+
+
+def _partitioning(pa):
+    schema = pa.schema([('date', pa.string()), ('server', pa.string()), ('func', pa.int32())])
+    return pa.dataset.partitioning(schema, flavor='hive')
+
+
+# cols: pktid/func/recv_time/first_reply/last_reply（整数微秒，无回复为 NO_TS）/reply_count
+# 派生 proc_time（最后回复 - 接收）、output_time（最后回复 - 第一个回复，秒）和 success，无回复时为空值
+def request_table(cols: dict, server: str, source: str):
+    pa = _pyarrow()
+    recv_time = np.asarray(cols['recv_time'], dtype=np.int64)
+    reply_count = np.asarray(cols['reply_count'], dtype=np.int64)
+    first_reply = np.asarray(cols['first_reply'], dtype=np.int64)
+    last_reply = np.asarray(cols['last_reply'], dtype=np.int64)
+    no_reply = reply_count == 0
+    days = (recv_time // US_PER_DAY).astype('datetime64[D]').astype(str)
+
+    def timestamps(values, mask=None):
+        return pa.array(values, type=pa.int64(), mask=mask).cast(pa.timestamp('us'))
+
+    return pa.table({
+        'pktid': pa.array(np.asarray(cols['pktid'], dtype=np.uint64)),
+        'func': pa.array(np.asarray(cols['func'], dtype=np.int32)),
+        'recv_time': timestamps(recv_time),
+        'first_reply': timestamps(first_reply, no_reply),
+        'last_reply': timestamps(last_reply, no_reply),
+        'proc_time': pa.array((last_reply - recv_time) / US_PER_SEC, mask=no_reply),
+        'output_time': pa.array((last_reply - first_reply) / US_PER_SEC, mask=no_reply),
+        'success': pa.array(~no_reply),
+        'reply_count': pa.array(reply_count),
+        'date': pa.array(np.char.replace(days, '-', '')),
+        'server': pa.array(np.full(len(recv_time), server, dtype=object), type=pa.string()),
+        'source': pa.array(np.full(len(recv_time), source, dtype=object), type=pa.string()),
+    })
+
+
+# 按 日期/服务器/功能 分区写出一个日志文件的请求记录；文件名以日志文件名开头，重复导出同一日志会覆盖旧文件
+def write_requests(cols: dict, out_dir: str, server: str, source: str, fmt: str = 'parquet'):
+    pa = _pyarrow()
+    ds_format, ext = _format(fmt)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    pa.dataset.write_dataset(request_table(cols, server, os.path.basename(source)), out_dir, format=ds_format,
+                             partitioning=_partitioning(pa), basename_template=f"{stem}-{{i}}.{ext}",
+                             existing_data_behavior='overwrite_or_ignore')
+
+
+# 读回导出的请求记录，返回 NumPy 列：时间为整数微秒（缺失为 NO_TS），耗时为秒（缺失为 NaN），
+# date/server/source 为字符串数组；servers/funcs/dates 不为空时只读取对应分区
+def read_requests(path: str, fmt: str = 'parquet', servers=None, funcs=None, dates=None) -> dict:
+    pa = _pyarrow()
+    pc = pa.compute
+    dataset = pa.dataset.dataset(path, format=_format(fmt)[0], partitioning=_partitioning(pa))
+    condition = None
+    for name, values in (('server', servers), ('func', funcs), ('date', dates)):
+        if values:
+            term = pc.field(name).isin(list(values))
+            condition = term if condition is None else condition & term
+    table = dataset.to_table(filter=condition)
+
+    cols = {}
+    for name in ('recv_time', 'first_reply', 'last_reply'):
+        cols[name] = pc.fill_null(table.column(name).cast(pa.int64()), NO_TS).to_numpy()
+    for name in ('proc_time', 'output_time'):
+        cols[name] = pc.fill_null(table.column(name), float('nan')).to_numpy()
+    cols['pktid'] = table.column('pktid').to_numpy()
+    cols['func'] = table.column('func').to_numpy().astype(np.int64)
+    cols['reply_count'] = table.column('reply_count').to_numpy()
+    cols['success'] = table.column('success').to_numpy()
+    for name in ('date', 'server', 'source'):
+        cols[name] = np.asarray(table.column(name).to_pylist(), dtype=object)
+    return cols
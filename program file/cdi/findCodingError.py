@@ -1,80 +1,144 @@
 # -*- coding: utf-8 -*-
+# 在 C++ 源码中查找 sErrMsg = "..." 赋值和 sNote.Format(...) 语句，结果写到一个文件中（每行 "文件路径 | 语句"）
+# 源文件分给进程池并行扫描：每个文件内存映射后直接用预编译的字节正则匹配（源码为 gb2312，所需符号都是 ASCII），
+# 只解码匹配到的片段；Format 的括号配对跳过字符串和字符字面量中的括号。结果按遍历顺序交给主进程统一写出，全局去重
 import configparser
+import contextlib
+import mmap
 import os
 import re
+import sys
+from multiprocessing import Pool
 
-def read_config():
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.ini')
+SOURCE_ENCODING = 'gb2312'
+SOURCE_SUFFIX = '.cpp'
+# 每次交给工作进程的文件数
+CHUNK_FILES = 64
+# 不小于此大小的文件用内存映射，更小的文件直接读入（映射的系统调用开销比读取本身还大）
+MMAP_MIN_BYTES = 1 << 20
+
+def read_config(config_path=CONFIG_PATH):
     config = configparser.ConfigParser()
-    config.read('./config/config.ini')
-    return config.get('Directories','search_dirs').split(';')
+    config.read(config_path, encoding='utf-8')
+    search_dirs = [path.strip() for path in config.get('Directories', 'search_dirs').split(';') if path.strip()]
+    return (search_dirs, config.get('Directories', 'output_file', fallback='') or output_file,
+            config.getint('Directories', 'workers', fallback=0))
 
-# 输出结果的文件
+# 输出结果的文件（未在配置中指定时）
 output_file = r'D:\combined_results.txt'
 
-# 正则表达式1：用于找到 sErrMsg = "..." 形式的语句
-pattern1 = re.compile(r'sErrMsg\s*=\s*"(.*?)"')
-# 正则表达式2：用于找到 sNote.Format( 开头的行
-pattern2 = re.compile(r'sNote\.Format\s*\(\s*')
+# 正则表达式1：用于找到 sErrMsg = "..." 形式的语句（与逐行匹配相同，不跨行）
+pattern1 = re.compile(rb'sErrMsg[ \t\x0b\x0c]*=[ \t\x0b\x0c]*"([^\r\n]*?)"')
+# 正则表达式2：用于找到 sNote.Format( 开头的语句
+pattern2 = re.compile(rb'sNote\.Format\s*\(\s*')
+# 括号配对时关心的字符：括号和字面量的起始引号
+_TOKEN = re.compile(rb'[()"\']')
+# 字符串/字符字面量（处理转义，不跨行；未闭合时到行尾为止）
+_LITERALS = {ord('"'): re.compile(rb'"(?:[^"\\\r\n]|\\.)*"?'), ord("'"): re.compile(rb"'(?:[^'\\\r\n]|\\.)*'?")}
+_OPEN, _CLOSE = ord('('), ord(')')
+
+# 从 pos（左括号之后）开始找到配对的右括号，返回其后的位置，找不到返回 -1
+def find_call_end(content, pos):
+    balance = 1
+    search = _TOKEN.search
+    while True:
+        match = search(content, pos)
+        if match is None:
+            return -1
+        char = content[match.start()]
+        if char == _OPEN:
+            balance += 1
+            pos = match.end()
+        elif char == _CLOSE:
+            balance -= 1
+            pos = match.end()
+            if balance == 0:
+                return pos
+        else:
+            pos = _LITERALS[char].match(content, match.start()).end()
 
 def find_format_statements(content):
     results = []
     start_match = pattern2.search(content)
     while start_match:
-        start_index = start_match.start()
-        balance = 1
-        end_index = -1
-        for i, char in enumerate(content[start_index + len(start_match.group(0)):],
-                                 start=start_index + len(start_match.group(0))):
-            if char == '(':
-                balance += 1
-            elif char == ')':
-                balance -= 1
-            if balance == 0:
-                end_index = i + 1
-                break
-        if end_index!= -1:
-            statement = content[start_index:end_index]
-            results.append(statement)
-            start_match = pattern2.search(content, end_index)
-        else:
+        end_index = find_call_end(content, start_match.end())
+        if end_index == -1:
             break
+        results.append(content[start_match.start():end_index])
+        start_match = pattern2.search(content, end_index)
     return results
 
+def _line_at(content, pos):
+    start = max(content.rfind(b'\n', 0, pos), content.rfind(b'\r', 0, pos)) + 1
+    ends = [end for end in (content.find(b'\n', pos), content.find(b'\r', pos)) if end != -1]
+    return content[start:min(ends) if ends else len(content)]
+
+# 扫描一个文件，按出现顺序返回要写出的行（去重由写出方统一做）
 def search_in_file(file_path):
-    unique_lines = set()
+    lines = []
     try:
-        with open(file_path, 'r', encoding='gb2312', errors='replace') as file:
-            content = file.read()
-            for line in content.splitlines():
-                match1 = pattern1.search(line)
-                if match1 and match1.group(1).strip():
-                    line_to_write = f"{file_path} | {line.strip()}"
-                    if line_to_write not in unique_lines:
-                        unique_lines.add(line_to_write)
-            matches2 = find_format_statements(content)
-            for match in matches2:
-                formatted_match = ' '.join(match.split())
-                line_to_write = f"{file_path} | {formatted_match}"
-                if line_to_write not in unique_lines:
-                    unique_lines.add(line_to_write)
-        with open(output_file, 'a', encoding='gb2312') as out:
-            for unique_line in unique_lines:
-                out.write(f"{unique_line}\n")
-    except UnicodeDecodeError:
-        print(f"无法解码文件 {file_path}，已跳过。")
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_MIN_BYTES else f.read()
+        with content if size >= MMAP_MIN_BYTES else contextlib.nullcontext(content):
+            last_line = None
+            for match1 in pattern1.finditer(content):
+                if not match1.group(1).decode(SOURCE_ENCODING, 'replace').strip():
+                    continue
+                # 同一行上的多个匹配只输出一次该行
+                line = _line_at(content, match1.start())
+                if line != last_line:
+                    last_line = line
+                    lines.append(f"{file_path} | {line.decode(SOURCE_ENCODING, 'replace').strip()}")
+            for match in find_format_statements(content):
+                formatted_match = ' '.join(match.decode(SOURCE_ENCODING, 'replace').split())
+                lines.append(f"{file_path} | {formatted_match}")
     except Exception as e:
-        print(f"处理文件 {file_path} 时发生错误: {e}")
+        return file_path, f"处理文件 {file_path} 时发生错误: {e}"
+    return file_path, lines
 
-def recursive_search(directories):
+# 遍历目录，按遍历顺序产出 .cpp 文件；同一文件（如目录重叠或符号链接）只产出一次
+def iter_source_files(directories):
+    seen = set()
     for directory in directories:
         for root, dirs, files in os.walk(directory):
             for file in files:
-                if file.endswith('.cpp'):
+                if file.endswith(SOURCE_SUFFIX):
                     full_path = os.path.join(root, file)
-                    search_in_file(full_path)
+                    real_path = os.path.realpath(full_path)
+                    if real_path not in seen:
+                        seen.add(real_path)
+                        yield full_path
+
+# 扫描全部目录并写出结果，workers 为进程数（0 为全部 CPU 核，1 为本进程内顺序扫描）；返回 (文件数, 写出行数)
+def recursive_search(directories, out_path, workers=0):
+    workers = workers if workers > 0 else os.cpu_count() or 1
+    files = written = 0
+    unique_lines = set()
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        paths = iter_source_files(directories)
+        results = pool.imap(search_in_file, paths, CHUNK_FILES) if pool else map(search_in_file, paths)
+        with open(out_path, 'w', encoding=SOURCE_ENCODING, errors='replace') as out:
+            for file_path, lines in results:
+                files += 1
+                if isinstance(lines, str):
+                    print(lines)
+                    continue
+                for line in lines:
+                    if line not in unique_lines:
+                        unique_lines.add(line)
+                        written += 1
+                        out.write(f"{line}\n")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return files, written
 
 if __name__ == "__main__":
-    open(output_file, 'w').close()
-    search_dirs = read_config()
-    recursive_search(search_dirs)
-    print(f"搜索完成，结果已保存至 {output_file}")
\ No newline at end of file
+    search_dirs, out_path, workers = read_config()
+    files, written = recursive_search(search_dirs, out_path, workers)
+    print(f"搜索完成，共扫描 {files} 个文件，{written} 条结果已保存至 {out_path}")
+    sys.exit(0)
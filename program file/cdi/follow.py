@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# 跟踪正在写入的按小时滚动日志（..._KbdSvrPacket_20240927_13.txt），每次只解析新追加的完整行
+# 读到的位置和调用方的在途状态保存在检查点文件中，下次从断点继续，刷新代价与新增字节数成正比
+import logging
+import mmap
+import os
+import pickle
+import re
+from datetime import datetime, timedelta
+
+from pktparse import iter_packet_events
+from chunked import iter_marked_lines, count_range_lines
+
+# 文件名末尾的 日期_小时，如 _20240927_13.txt
+HOURLY_PATTERN = re.compile(r'_(\d{8})_(\d{2})(\.[^.\\/]*)?$')
+CHECKPOINT_VERSION = 1
+
+
+# 下一个小时的日志文件路径，文件名不含 日期_小时 时返回 None
+def next_hourly_path(path: str):
+    match = HOURLY_PATTERN.search(path)
+    if match is None:
+        return None
+    hour = datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H') + timedelta(hours=1)
+    return f"{path[:match.start()]}_{hour.strftime('%Y%m%d_%H')}{match.group(3) or ''}"
+
+
+# 读取检查点，不存在或版本不符时返回 None
+def load_checkpoint(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        logging.warning(f"Ignoring checkpoint with unsupported version: {path}")
+        return None
+    return state
+
+
+# 先写临时文件再替换，中途退出不会留下损坏的检查点
+def save_checkpoint(path: str, state: dict):
+    state['version'] = CHECKPOINT_VERSION
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+# [start, end) 中的事件列表及行数
+def _read_events(path: str, start: int, end: int) -> tuple:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return list(iter_packet_events(iter_marked_lines(mm, start, end))), count_range_lines(mm, start, end)
+
+
+class LogFollower:
+    # path/offset: 当前文件及已处理到的字节位置（总是行首）
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        # 累计读取的字节数和行数（跨文件）
+        self.bytes_read = 0
+        self.lines_read = 0
+
+    # 当前文件中 [offset, 最后一个换行] 的完整行，文件已滚动时读到文件末尾
+    def _complete_end(self, size: int, finished: bool) -> int:
+        if finished or size == self.offset:
+            return size
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.rfind(b'\n', self.offset, size) + 1 or self.offset
+
+    # 产出自上次以来新增的事件 (ts_us, op, pktid, func)；下一个小时的文件出现后，
+    # 读完当前文件剩余部分（包括没有换行的最后一行）再切换过去
+    def poll(self):
+        while True:
+            if not os.path.exists(self.path):
+                return
+            size = os.path.getsize(self.path)
+            if size < self.offset:
+                logging.warning(f"{self.path} shrank from {self.offset} to {size} bytes, re-reading from start")
+                self.offset = 0
+            next_path = next_hourly_path(self.path)
+            finished = next_path is not None and os.path.exists(next_path)
+            end = self._complete_end(size, finished)
+            if end > self.offset:
+                events, lines = _read_events(self.path, self.offset, end)
+                yield from events
+                self.bytes_read += end - self.offset
+                self.lines_read += lines
+                self.offset = end
+            if not finished:
+                return
+            logging.info(f"Log rotated to {next_path}")
+            self.path, self.offset = next_path, 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# 按功能分组的耗时汇总：一次排序 + 分段归约，得到数量/最小/最大/均值/标准差和精确分位数
+# 分位数与 numpy.percentile 默认的线性插值一致，基于全部耗时而非近似
+import csv
+import json
+
+import numpy as np
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+# 解析配置中的分位数，如 '50, 90, 99, 99.9'，空值使用默认值
+def parse_percentiles(text) -> tuple:
+    if not text or not text.strip():
+        return DEFAULT_PERCENTILES
+    percentiles = tuple(float(p) for p in text.replace('，', ',').split(',') if p.strip())
+    for p in percentiles:
+        if not 0 <= p <= 100:
+            raise ValueError(f"分位数必须在 0~100 之间: {p}")
+    return percentiles
+
+
+# 分位数的显示名，如 50 -> 'p50'，99.9 -> 'p99.9'
+def percentile_label(p: float) -> str:
+    return f"p{p:g}"
+
+
+# 按 keys 分组汇总 values
+# mask: 只有为 True 的行计入耗时统计（默认全部），未计入的行仍参与 sums 的求和
+# sums: {名称: 每行的整数}，按组求和后放进结果
+# 返回 {key: {'count', 'min', 'max', 'mean', 'std', 'percentiles': [...], 名称: 和}}，key 按升序排列；
+# 没有耗时的组各项统计为 0
+def summarize(keys, values, percentiles=DEFAULT_PERCENTILES, mask=None, sums=None) -> dict:
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=np.float64)
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    nkeys = len(uniq)
+
+    if mask is None:
+        group, vals = inverse, values
+    else:
+        group, vals = inverse[mask], values[mask]
+    order = np.lexsort((vals, group))
+    group, vals = group[order], vals[order]
+
+    counts = np.bincount(group, minlength=nkeys)
+    starts = np.cumsum(counts) - counts
+    stats = np.zeros((nkeys, 5 + len(percentiles)))
+    has = np.flatnonzero(counts)
+    if len(has):
+        s, c = starts[has], counts[has]
+        means = np.add.reduceat(vals, s) / c
+        dev = vals - np.repeat(means, c)
+        stats[has, 0] = vals[s]
+        stats[has, 1] = vals[s + c - 1]
+        stats[has, 2] = means
+        stats[has, 3] = np.sqrt(np.add.reduceat(dev * dev, s) / c)
+        for j, p in enumerate(percentiles):
+            rank = p / 100 * (c - 1)
+            lo = np.floor(rank).astype(np.int64)
+            hi = np.minimum(lo + 1, c - 1)
+            stats[has, 5 + j] = vals[s + lo] + (vals[s + hi] - vals[s + lo]) * (rank - lo)
+
+    totals = {}
+    for name, column in (sums or {}).items():
+        total = np.zeros(nkeys, dtype=np.int64)
+        np.add.at(total, inverse, np.asarray(column, dtype=np.int64))
+        totals[name] = total.tolist()
+
+    result = {}
+    for i, key in enumerate(uniq.tolist()):
+        row = stats[i].tolist()
+        entry = {'count': int(counts[i]), 'min': row[0], 'max': row[1], 'mean': row[2], 'std': row[3],
+                 'percentiles': row[5:]}
+        for name, total in totals.items():
+            entry[name] = total[i]
+        result[key] = entry
+    return result
+
+
+# 汇总表的机器可读版本：每行一个功能，耗时单位为秒
+def summary_rows(stats: dict, percentiles, count_fields=()) -> list:
+    rows = []
+    for key, entry in stats.items():
+        row = {'func': key}
+        for name in count_fields:
+            row[name] = entry[name]
+        row['latency_count'] = entry['count']
+        for name in ('min', 'max', 'mean', 'std'):
+            row[f"{name}_s"] = entry[name]
+        for p, value in zip(percentiles, entry['percentiles']):
+            row[f"{percentile_label(p)}_s"] = value
+        rows.append(row)
+    return rows
+
+
+# 在 base_path 旁写出 .csv 和 .json 两份汇总表
+def write_summary_tables(base_path: str, rows: list):
+    fields = list(rows[0]) if rows else ['func']
+    with open(base_path + '.csv', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(base_path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
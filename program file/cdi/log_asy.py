@@ -1,227 +1,760 @@
 # -*- coding: utf-8 -*-
 import logging
 import os
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-import chardet
-import re
+import sys
+import time
 import configparser
+import copy
+import functools
+import heapq
+import pickle
+import shutil
+import tempfile
+from array import array
 
-# 配置日志，将日志级别设置为INFO，这样就不会输出DEBUG级别的调试信息了
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import numpy as np
 
-# 读取配置文件
-config = configparser.ConfigParser()
-config.read('../config/config.ini', encoding='utf-8')
+from pktparse import parse_packet_line, iter_packet_events, format_ts, OP_NAMES, US_PER_SEC
+from chunked import scan_file, scan_lines, merge_partials, iter_file_events
+from streaming import StreamCorrelator, iter_closed
+from columnar import correlate
+from sidecar import open_index
+from latency import (summarize, summary_rows, write_summary_tables, parse_percentiles,
+                     percentile_label, DEFAULT_PERCENTILES)
+from sketch import LatencySketch, add_grouped, sketch_stats, save_sketches, DEFAULT_ACCURACY
+from follow import LogFollower, load_checkpoint, save_checkpoint
+from batch import expand_sources, server_id, server_of, run_pool, SERVER_PATTERN
+from export import EXPORT_FORMATS
+from textenc import EncodingCache, is_ascii_compatible, iter_raw_lines
+from outfiles import PartitionedWriter, TextChunkWriter, COMPRESSIONS, DEFAULT_MAX_OPEN
+from profiling import RunProfile, CAPTURES
+from timeseries import (parse_widths, parse_window, in_window, bucket_start, bucket_stats, add_rates,
+                        format_interval, interval_rows, interval_file_base)
 
-log_path = os.path.abspath(config.get('Paths', 'log_path'))
-out_dir = os.path.abspath(config.get('Paths', 'out_dir'))
-by_time = config.getboolean('Sorting', 'by_time')
-interval = config.getint('TimeIntervals', 'interval')
-auto_detect = config.getboolean('Encoding', 'auto_detect')
-start_time = config.get('TimeIntervals', 'start_time')
-end_time = config.get('TimeIntervals','end_time')
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.ini')
 
-# 缓存编码
-encoding_cache = {}
+# 读取并校验配置文件，返回设置字典；同一路径在进程内只解析一次，每次返回缓存结果的副本，调用方可以随意修改
+def read_config(config_path=CONFIG_PATH):
+    return copy.deepcopy(_read_config(config_path))
 
-# 自动检测文件编码
+@functools.lru_cache(maxsize=8)
+def _read_config(config_path):
+    config = configparser.ConfigParser()
+    if not config.read(config_path, encoding='utf-8'):
+        raise FileNotFoundError(f"找不到配置文件: {config_path}")
+    settings = {}
+    settings['log_path'] = os.path.abspath(config.get('Paths', 'log_path'))
+    settings['out_dir'] = out_dir = os.path.abspath(config.get('Paths', 'out_dir'))
+    settings['by_time'] = config.getboolean('Sorting', 'by_time')
+    settings['max_open_files'] = config.getint('Output', 'max_open_files', fallback=DEFAULT_MAX_OPEN)
+    # 逐笔输出的压缩方式：空为不压缩，gzip 或 zstd
+    settings['compress'] = compress = config.get('Output', 'compress', fallback='')
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compress}")
+    interval = config.getint('TimeIntervals', 'interval')
+    settings['auto_detect'] = config.getboolean('Encoding', 'auto_detect')
+    # 编码缓存文件，按文件和服务器记录识别出的编码，跨次运行复用
+    settings['encoding_cache_path'] = (config.get('Encoding', 'cache_file', fallback='')
+                                       or os.path.join(out_dir, 'encoding_cache.json'))
+    # 时间段粒度（秒）：interval 为主粒度，resolutions 为同时输出的其他粒度
+    settings['widths'] = parse_widths(interval, config.get('TimeIntervals', 'resolutions', fallback=''))
+    settings['window'] = parse_window(config.get('TimeIntervals', 'start_time'), config.get('TimeIntervals', 'end_time'))
+    settings['workers'] = config.getint('Parallel', 'workers', fallback=1)
+    settings['idle_timeout'] = config.getfloat('Stream', 'idle_timeout', fallback=0)
+    settings['percentiles'] = parse_percentiles(config.get('Summary', 'percentiles', fallback=''))
+    backend = config.get('Summary', 'backend', fallback='exact')
+    relative_accuracy = config.getfloat('Summary', 'relative_accuracy', fallback=DEFAULT_ACCURACY)
+    if backend not in ('exact', 'sketch'):
+        raise ValueError(f"不支持的汇总方式: {backend}")
+    # 草图模式下的相对误差，精确模式为 None；跟踪模式总是用草图，取 relative_accuracy
+    settings['sketch_accuracy'] = relative_accuracy if backend == 'sketch' else None
+    settings['relative_accuracy'] = relative_accuracy
+    settings['follow'] = config.getboolean('Follow', 'enabled', fallback=False)
+    settings['checkpoint_path'] = (config.get('Follow', 'checkpoint', fallback='')
+                                   or os.path.join(out_dir, 'follow.checkpoint'))
+    settings['poll_interval'] = config.getfloat('Follow', 'poll_interval', fallback=0)
+    settings['batch_sources'] = config.get('Batch', 'sources', fallback='')
+    settings['server_pattern'] = server_pattern = config.get('Batch', 'server_pattern', fallback='') or SERVER_PATTERN
+    # 索引目录：启用索引时为字符串（空串表示放在日志旁边），不启用时为 None
+    settings['index_dir'] = None
+    if config.getboolean('Index', 'enabled', fallback=False):
+        settings['index_dir'] = config.get('Index', 'index_dir', fallback='')
+    # 逐笔请求导出：format 为 parquet/arrow 时写出列式文件，空为不导出；source 不为空时直接从该目录的导出文件汇总
+    settings['export_format'] = export_format = config.get('Export', 'format', fallback='')
+    if export_format and export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+    export_dir = os.path.abspath(config.get('Export', 'dir', fallback='') or os.path.join(out_dir, 'export'))
+    settings['export_source'] = config.get('Export', 'source', fallback='')
+    # 导出设置 (格式, 目录, 服务器编号规则)，不导出时为 None
+    settings['export'] = (export_format, export_dir, server_pattern) if export_format else None
+    # 运行剖析：启用时记录各阶段耗时、行数、在途 pktid 峰值和峰值内存，运行结束后写出 JSON 报告（默认 out_dir/run_report.json）
+    settings['profile_enabled'] = config.getboolean('Profile', 'enabled', fallback=False)
+    settings['profile_capture'] = capture = config.get('Profile', 'capture', fallback='')
+    if capture not in CAPTURES:
+        raise ValueError(f"不支持的剖析方式: {capture}，可选 cprofile, tracemalloc")
+    settings['profile_report'] = config.get('Profile', 'report', fallback='') or os.path.join(out_dir, 'run_report.json')
+    return settings
+
+# 按设置初始化本模块的运行状态（编码识别和运行剖析），每次运行前调用；未调用时不识别编码、不剖析
+def configure(settings):
+    global auto_detect, encoding_cache_path, server_pattern, encoding_cache, profile, profile_report
+    auto_detect = settings['auto_detect']
+    encoding_cache_path = settings['encoding_cache_path']
+    server_pattern = settings['server_pattern']
+    encoding_cache = None
+    profile = RunProfile(settings['profile_enabled'], settings['profile_capture'])
+    profile_report = settings['profile_report']
+
+auto_detect = False
+encoding_cache_path = None
+server_pattern = SERVER_PATTERN
+profile = RunProfile()
+profile_report = None
+
+# 逐笔输出每批写出的行数
+OUTPUT_BATCH = 65536
+# 流式模式逐笔输出外部排序的批大小：每攒够这么多笔已关闭的请求排好序写入一个临时文件，结束时多路归并
+SORT_RUN = 100000
+
+# 编码缓存，首次用到时加载
+encoding_cache = None
+
+# 日志文件的编码：未开启自动检测时为 gb2312，否则依次查缓存（同一文件、同一服务器），都没有时抽样识别（见 textenc.py）
 def detect_encoding(file_path):
-    if file_path in encoding_cache:
-        return encoding_cache[file_path]
-    with open(file_path, 'rb') as f:
-        content = f.read(4096)  # 读取前4KB内容
-        result = chardet.detect(content)
-    encoding_cache[file_path] = result['encoding']
-    return result['encoding']
-
-# 解析单行日志
-def parse_log_line(line):
-    # 使用提供的正则表达式进行匹配
-    logging.debug(f"Parsing log line: {line.strip()}")
-    match = re.search(
-        r'(\d{8} \d{2}:\d{2}:\d{2}\.\d{6}) \[WritePacket\]KSvrComm (AfterGet|Put|ReplyNull)\[pktid\((\d+)\)\], func: ?(\d+),.*',
-        line
-    )
-    if not match:
+    global encoding_cache
+    if not auto_detect:
+        return 'gb2312'
+    if encoding_cache is None:
+        encoding_cache = EncodingCache(encoding_cache_path)
+    encoding = encoding_cache.resolve(file_path, server_id(file_path, server_pattern))
+    encoding_cache.save()
+    return encoding
+
+# 解析单行日志（str 或 bytes），返回字段字典，不匹配返回 None
+def parse_log_line(line, encoding='gb2312'):
+    raw = line.encode(encoding, 'replace') if isinstance(line, str) else line
+    event = parse_packet_line(raw)
+    if event is None:
         return None
 
-    # 提取匹配的组
-    timestamp, action, pktid, func = match.groups()
+    ts_us, op, pktid, func, info_offset = event
+    # 提取Info部分，只有用到时才解码
+    info = raw[info_offset:].decode(encoding, 'replace').strip()
 
-    # 提取Info部分
-    info_start = match.end() + 1  # 跳过空格或其他分隔符
-    info = line[info_start:].strip()
+    return {'timestamp': format_ts(ts_us), 'pktid': str(pktid), 'func': str(func),
+            'action': OP_NAMES[op], 'info': info}
 
-    return {'timestamp': timestamp, 'pktid': pktid, 'func': func, 'action': action, 'info': info}
+# 由关联状态构造请求条目，同一 pktid 只统计首个 AfterGet
+def build_request(pktid, entry):
+    func, afterget, reply_count, first_reply, last_reply, _ = entry
+    recv_time = afterget[0]
+    req = {
+        'func': str(func),
+        'recv_time': format_ts(recv_time),
+        'first_reply': None,
+        'last_reply': None,
+        'reply_count': reply_count,
+        'success': reply_count > 0,
+        'pktid': str(pktid),
+        'recv_us': recv_time
+    }
+    if reply_count:
+        req['first_reply'] = format_ts(first_reply)
+        req['last_reply'] = format_ts(last_reply)
+        req['proc_time'] = (last_reply - recv_time) / US_PER_SEC
+        req['output_time'] = (last_reply - first_reply) / US_PER_SEC
+    else:
+        req['proc_time'] = 0
+        req['output_time'] = 0
+    return req
 
-# 解析日志并计算所需信息
-def parse_logs(log_path, encoding):
-    logging.info(f"Parsing logs from: {log_path}")
-    requests = {}
-    with open(log_path, 'r', encoding=encoding, errors='replace') as file:
-        for line in file:
-            log_entry = parse_log_line(line)
-            if not log_entry:
-                logging.debug("Skipped an invalid log line.")
-                continue
-
-            pktid = log_entry['pktid']
-            action = log_entry['action']
-
-            if action == 'AfterGet':
-                # 初始化请求条目
-                if pktid not in requests:
-                    logging.debug(f"Initializing request for pktid: {pktid}")
-                    requests[pktid] = {
-                        'func': log_entry['func'],
-                        'recv_time': log_entry['timestamp'],
-                        'first_reply': None,
-                        'last_reply': None,
-                        'replies': [],
-                        'success': False,
-                        'pktid': pktid  # 确保 pktid 被设置
-                    }
-            elif action in ('Put', 'ReplyNull'):
-                if pktid in requests:
-                    requests[pktid]['replies'].append((log_entry['timestamp'], action))
-                    if not requests[pktid]['first_reply']:
-                        requests[pktid]['first_reply'] = log_entry['timestamp']
-                    requests[pktid]['last_reply'] = log_entry['timestamp']
-                    requests[pktid]['success'] = True
-                    logging.debug(f"Updated request for pktid: {pktid}, action: {action}")
-                else:
-                    logging.warning(f"Received a reply for an unknown pktid: {pktid}")
-                    continue
-            else:
-                logging.warning(f"Unknown action: {action}")
-                continue
+# 逐行转发，on_lines 不为 None 时读完后以行数调用
+def counted_lines(lines, on_lines=None):
+    if on_lines is None:
+        return lines
+    return _count_through(lines, on_lines)
 
-    # 计算耗时
-    for req in requests.values():
-        if 'pktid' not in req:
-            logging.error(f"Request is missing pktid: {req}")
-            continue
-
-        if req['replies']:
-            recv_time = datetime.strptime(req['recv_time'], '%Y%m%d %H:%M:%S.%f')
-            last_reply_time = datetime.strptime(req['last_reply'], '%Y%m%d %H:%M:%S.%f')
-            req['proc_time'] = (last_reply_time - recv_time).total_seconds()
-            if req['first_reply']:
-                first_reply_time = datetime.strptime(req['first_reply'], '%Y%m%d %H:%M:%S.%f')
-                req['output_time'] = (last_reply_time - first_reply_time).total_seconds()
-            else:
-                req['output_time'] = 0
-                logging.warning(f"No first_reply for pktid: {req['pktid']}")
-            logging.debug(f"Calculated proc_time and output_time for pktid: {req['pktid']}")
+def _count_through(lines, on_lines):
+    count = 0
+    for line in lines:
+        count += 1
+        yield line
+    on_lines(count)
+
+# 扫描日志并关联请求，返回 pktid -> [func, AfterGet时间列表, 回复数, 第一个回复, 最后一个回复, 最大回复时间]
+# index_dir 不为 None 且编码兼容 ASCII 时改用 .idx 索引中的事件列，跳过文本解析（AfterGet 列表只含首个）
+# counters 不为 None 时填入运行剖析的计数：lines（读过的行数，走索引时不读行、没有）、matched_lines、orphan_replies、
+# open_pktids_peak；由调用方计入运行剖析，批量模式的工作进程中也能统计
+def scan_log(log_path, encoding, workers=1, index_dir=None, counters=None):
+    on_lines = None if counters is None else functools.partial(counters.__setitem__, 'lines')
+    if index_dir is not None and is_ascii_compatible(encoding):
+        corr = correlate(open_index(log_path, index_dir, workers).arrays())
+        columns = [corr[name].tolist() for name in
+                   ('pktid', 'func', 'afterget', 'reply_count', 'first_reply', 'last_reply', 'max_reply')]
+        state = {pktid: [func, [afterget], count, first, last, max_reply]
+                 for pktid, func, afterget, count, first, last, max_reply in zip(*columns)}
+        orphan_replies = corr['orphan_replies']
+    elif is_ascii_compatible(encoding):
+        state, orphan_replies = scan_file(log_path, workers, on_lines=on_lines)
+    else:
+        state, orphan_replies = merge_partials([scan_lines(counted_lines(iter_raw_lines(log_path, encoding), on_lines))])
+    if orphan_replies:
+        logging.warning(f"Received {orphan_replies} replies for unknown pktids in {log_path}")
+    if counters is not None:
+        # 批量模式所有 pktid 都保留到文件结束，在途峰值即 pktid 数
+        counters['matched_lines'] = orphan_replies + sum(len(entry[1]) + entry[2] for entry in state.values())
+        counters['orphan_replies'] = orphan_replies
+        counters['open_pktids_peak'] = len(state)
+    return state
+
+# 把 scan_log 填入的计数计入运行剖析：在途 pktid 峰值取最大值，其余累加
+def record_scan_counters(counters):
+    for name, value in counters.items():
+        if name == 'open_pktids_peak':
+            profile.high_water(name, value)
         else:
-            req['proc_time'] = 0
-            req['output_time'] = 0
-            logging.debug(f"No replies for pktid: {req['pktid']}")
+            profile.count(name, value)
+
+# 关联状态转成逐笔请求列：pktid/func/recv_time/first_reply/last_reply（微秒，无回复为 -1）/reply_count
+def state_columns(state):
+    n = len(state)
+    cols = {name: np.empty(n, dtype=np.int64) for name in
+            ('func', 'recv_time', 'first_reply', 'last_reply', 'reply_count')}
+    cols['pktid'] = np.fromiter(state.keys(), dtype=np.uint64, count=n)
+    for i, (func, afterget, count, first, last, _) in enumerate(state.values()):
+        cols['func'][i] = func
+        cols['recv_time'][i] = afterget[0]
+        cols['first_reply'][i] = first if count else -1
+        cols['last_reply'][i] = last if count else -1
+        cols['reply_count'][i] = count
+    return cols
+
+# 把一个日志文件的逐笔请求导出为列式文件，export 为 (格式, 目录, 服务器编号规则)
+def export_columns(cols, log_path, export):
+    from export import write_requests as write_export
+    fmt, directory, pattern = export
+    write_export(cols, directory, server_of(log_path, pattern), log_path, fmt)
+    logging.info(f"Exported {len(cols['pktid'])} requests of {log_path} to {directory} ({fmt})")
+
+# 解析日志并计算所需信息，workers > 1 时内存映射分块多进程解析，结果与单进程一致
+# export 不为 None 时同时导出逐笔请求
+def parse_logs(log_path, encoding, workers=1, index_dir=None, export=None):
+    logging.info(f"Parsing logs from: {log_path}")
+    with profile.stage('scan_log'):
+        counters = {} if profile.enabled else None
+        state = scan_log(log_path, encoding, workers, index_dir, counters)
+        if counters is not None:
+            record_scan_counters(counters)
+    if export is not None:
+        with profile.stage('export'):
+            export_columns(state_columns(state), log_path, export)
+    requests = {}
+    with profile.stage('build_requests'):
+        for pktid, entry in state.items():
+            req = build_request(pktid, entry)
+            requests[req['pktid']] = req
+    profile.count('requests', len(requests))
 
     return requests
 
-# 写入请求数据
-def write_requests(requests, out_dir_path, by_time=False):
+# 逐笔请求的输出行
+def format_request(req):
+    return (f"pktid: {req['pktid']}, func: {req['func']}, recv_time: {req['recv_time']}, "
+            f"first_reply: {req.get('first_reply', 'N/A')}, last_reply: {req.get('last_reply', 'N/A')}, "
+            f"proc_time: {req.get('proc_time', 0) * 1000:.3f}ms, output_time: {req.get('output_time', 0) * 1000:.3f}ms, success: {req['success']}\n")
+
+# 按功能拆分文件中的输出行（不含 func）
+def format_func_request(req):
+    return (f"pktid: {req['pktid']}, recv_time: {req['recv_time']}, "
+            f"first_reply: {req.get('first_reply', 'N/A')}, last_reply: {req.get('last_reply', 'N/A')}, "
+            f"proc_time: {req.get('proc_time', 0) * 1000:.3f}ms, "
+            f"output_time: {req.get('output_time', 0) * 1000:.3f}ms, success: {req['success']}\n")
+
+# 请求的输出顺序：by_time 为 True 时按接收时间，否则按处理耗时从大到小；均为稳定排序，相同时保持日志中的顺序
+def request_order(reqs, by_time=False):
+    if by_time:
+        keys = np.fromiter((req['recv_us'] for req in reqs), dtype=np.int64, count=len(reqs))
+    else:
+        keys = -np.fromiter((req['proc_time'] for req in reqs), dtype=np.float64, count=len(reqs))
+    return np.argsort(keys, kind='stable')
+
+# 写入请求数据，compress 为 gzip/zstd 时写出压缩文件 requests.txt.gz/.zst
+# 按输出顺序每次格式化一批行，整批编码写出
+def write_requests(requests, out_dir_path, by_time=False, compress=''):
     # 确保目录存在
     os.makedirs(out_dir_path, exist_ok=True)
 
-    with open(os.path.join(out_dir_path, 'requests.txt'), 'w', encoding='gb2312') as f:
-        for req in requests.values():
-            if 'pktid' not in req or 'func' not in req or 'recv_time' not in req:
-                logging.warning(f"Skipping incomplete request: {req}")
-                continue
-            f.write(f"pktid: {req['pktid']}, func: {req['func']}, recv_time: {req['recv_time']}, ")
-            f.write(f"first_reply: {req.get('first_reply', 'N/A')}, last_reply: {req.get('last_reply', 'N/A')}, ")
-            f.write(f"proc_time: {req.get('proc_time', 0) * 1000:.3f}ms, output_time: {req.get('output_time', 0) * 1000:.3f}ms, success: {req['success']}\n")
-            logging.debug(f"Written request to file: {req}")
-
-# 按功能写入请求数据
-def write_requests_per_function(requests, out_dir_path, by_time=False):
+    reqs = list(requests.values())
+    order = request_order(reqs, by_time).tolist()
+    with TextChunkWriter(os.path.join(out_dir_path, 'requests.txt'), compress=compress) as f:
+        for start in range(0, len(order), OUTPUT_BATCH):
+            lines = []
+            for i in order[start:start + OUTPUT_BATCH]:
+                req = reqs[i]
+                if 'pktid' not in req or 'func' not in req or 'recv_time' not in req:
+                    logging.warning(f"Skipping incomplete request: {req}")
+                    continue
+                lines.append(format_request(req))
+            f.writelines(lines)
+
+# 按功能写入请求数据：按输出顺序遍历一次，每笔请求写入所属功能的文件，同时打开的文件数不超过 max_open
+def write_requests_per_function(requests, out_dir_path, by_time=False, max_open=DEFAULT_MAX_OPEN, compress=''):
     # 确保目录存在
     os.makedirs(out_dir_path, exist_ok=True)
 
-    # 按功能写入文件
-    for func in set(req['func'] for req in requests.values()):
-        with open(os.path.join(out_dir_path, f'requests_func_{func}.txt'), 'w', encoding='gb2312') as f:
-            for req in requests.values():
-                if req['func'] == func:
-                    f.write(f"pktid: {req['pktid']}, recv_time: {req['recv_time']}, ")
-                    f.write(f"first_reply: {req.get('first_reply', 'N/A')}, last_reply: {req.get('last_reply', 'N/A')}, ")
-                    f.write(f"proc_time: {req.get('proc_time', 0) * 1000:.3f}ms, ")
-                    f.write(f"output_time: {req.get('output_time', 0) * 1000:.3f}ms, success: {req['success']}\n")
+    reqs = list(requests.values())
+    funcs = [req['func'] for req in reqs]
+    lines = [format_func_request(req) for req in reqs]
+    with PartitionedWriter(lambda func: os.path.join(out_dir_path, f'requests_func_{func}.txt'),
+                           max_open=max_open, compress=compress) as writer:
+        for i in request_order(reqs, by_time).tolist():
+            writer.write(funcs[i], lines[i])
 
 
-# 生成汇总分析结果
-def generate_summary(requests, out_dir_path):
-    logging.info("Generating summary")
-    summary = defaultdict(lambda: {
-        'max_proc_time': 0,
-        'min_proc_time': float('inf'),
-        'avg_proc_time': 0,
-        'req_count': 0,
-        'reply_count': 0,
-        'total_proc_time': 0
-    })
+# 汇总统计按请求收集 func/耗时/回复数，写出时一次性向量化计算
+# sketch_accuracy 不为 None 时改为每个 func 一个耗时草图，内存不随请求数增长
+def new_summary(sketch_accuracy=None):
+    if sketch_accuracy is not None:
+        return {'sketches': {}, 'relative_accuracy': sketch_accuracy}
+    return {'func': array('q'), 'proc_time': array('d'), 'reply_count': array('q')}
+
+# 累加一笔请求到汇总统计
+def add_to_summary(summary, req):
+    if 'sketches' in summary:
+        func = int(req['func'])
+        sketch = summary['sketches'].get(func)
+        if sketch is None:
+            sketch = summary['sketches'][func] = LatencySketch(summary['relative_accuracy'])
+        sketch.add(req['proc_time'])
+        sketch.add_counters(req_count=1, reply_count=req['reply_count'])
+        return
+    summary['func'].append(int(req['func']))
+    summary['proc_time'].append(req['proc_time'])
+    summary['reply_count'].append(req['reply_count'])
+
+# 写入汇总文件（按 func 字符串排序），并写出 summary.csv/summary.json
+# 草图模式下分位数为近似值，并保存 summary.sketch.json 供跨文件合并
+def write_summary(summary, out_dir_path, percentiles=DEFAULT_PERCENTILES):
+    if 'sketches' in summary:
+        stats = sketch_stats(summary['sketches'], percentiles)
+        save_sketches(os.path.join(out_dir_path, 'summary.sketch.json'), summary['sketches'])
+    else:
+        proc_time = np.frombuffer(summary['proc_time'], dtype=np.float64)
+        stats = summarize(np.frombuffer(summary['func'], dtype=np.int64), proc_time, percentiles,
+                          sums={'req_count': np.ones(len(proc_time), dtype=np.int64),
+                                'reply_count': np.frombuffer(summary['reply_count'], dtype=np.int64)})
+    stats = dict(sorted(stats.items(), key=lambda item: str(item[0])))
 
-    func_counts = Counter(req['func'] for req in requests.values())
-    for req in requests.values():
-        func = req['func']
-        summary[func]['reply_count'] += len(req['replies'])
-        summary[func]['total_proc_time'] += req['proc_time']
-        summary[func]['max_proc_time'] = max(summary[func]['max_proc_time'], req['proc_time'])
-        summary[func]['min_proc_time'] = min(summary[func]['min_proc_time'], req['proc_time'])
-
-    for func in func_counts:
-        summary[func]['req_count'] = func_counts[func]
-        if summary[func]['req_count'] > 0:
-            summary[func]['avg_proc_time'] = summary[func]['total_proc_time'] / summary[func]['req_count']
-
-    # 写入汇总文件
     summary_file = os.path.join(out_dir_path, 'summary.txt')
     with open(summary_file, 'w', encoding='gb2312') as f:
-        for func, data in sorted(summary.items()):
-            f.write(f"func: {func}, max_proc_time: {data['max_proc_time'] * 1000:.3f}ms, "
-                    f"min_proc_time: {data['min_proc_time'] * 1000:.3f}ms, "
-                    f"avg_proc_time: {data['avg_proc_time'] * 1000:.3f}ms, "
-                    f"req_count: {data['req_count']}, reply_count: {data['reply_count']}\n")
+        for func, data in stats.items():
+            tail = ''.join(f", {percentile_label(p)}: {value * 1000:.3f}ms"
+                           for p, value in zip(percentiles, data['percentiles']))
+            f.write(f"func: {func}, max_proc_time: {max(data['max'], 0) * 1000:.3f}ms, "
+                    f"min_proc_time: {data['min'] * 1000:.3f}ms, "
+                    f"avg_proc_time: {data['mean'] * 1000:.3f}ms, "
+                    f"req_count: {data['req_count']}, reply_count: {data['reply_count']}, "
+                    f"std_proc_time: {data['std'] * 1000:.3f}ms{tail}\n")
+    write_summary_tables(os.path.join(out_dir_path, 'summary'),
+                         summary_rows(stats, percentiles, ('req_count', 'reply_count')))
+
+# 生成汇总分析结果
+def generate_summary(requests, out_dir_path, percentiles=DEFAULT_PERCENTILES, sketch_accuracy=None):
+    logging.info("Generating summary")
+    summary = new_summary(sketch_accuracy)
+    for req in requests.values():
+        add_to_summary(summary, req)
+    write_summary(summary, out_dir_path, percentiles)
+
+
+# 时间段统计按请求收集接收时间（微秒）/耗时/回复数，写出时按各粒度一次性向量化汇总
+# widths 为时间段粒度（秒），第一个为主粒度；window 为当天时间段，只统计接收时间落在其中的请求
+# sketch_accuracy 不为 None 时改为每个粒度的每个时间段一个耗时草图，内存只与时间段数相关
+def new_intervals(widths, window=None, sketch_accuracy=None):
+    intervals = {'widths': tuple(widths), 'window': window}
+    if sketch_accuracy is not None:
+        intervals.update(sketches={width: {} for width in widths}, relative_accuracy=sketch_accuracy)
+    else:
+        intervals.update(recv_time=array('q'), proc_time=array('d'), reply_count=array('q'))
+    return intervals
+
+# 累加一笔请求到时间段统计
+def add_to_intervals(intervals, req):
+    recv_us = req['recv_us']
+    if intervals['window'] is not None and not in_window(recv_us, intervals['window']):
+        return
+    if 'sketches' in intervals:
+        for width, sketches in intervals['sketches'].items():
+            start = bucket_start(recv_us, width)
+            sketch = sketches.get(start)
+            if sketch is None:
+                sketch = sketches[start] = LatencySketch(intervals['relative_accuracy'])
+            sketch.add(req['proc_time'])
+            sketch.add_counters(req_count=1, reply_count=req['reply_count'])
+        return
+    intervals['recv_time'].append(recv_us)
+    intervals['proc_time'].append(req['proc_time'])
+    intervals['reply_count'].append(req['reply_count'])
+
+# 按列累加一批请求：recv_time（微秒）/proc_time（秒）/reply_count
+def add_interval_columns(intervals, cols):
+    recv_time, proc_time, reply_count = cols['recv_time'], cols['proc_time'], cols['reply_count']
+    if intervals['window'] is not None:
+        keep = in_window(recv_time, intervals['window'])
+        recv_time, proc_time, reply_count = recv_time[keep], proc_time[keep], reply_count[keep]
+    if 'sketches' in intervals:
+        for width, sketches in intervals['sketches'].items():
+            add_grouped(sketches, bucket_start(recv_time, width), proc_time,
+                        sums={'req_count': np.ones(len(recv_time), dtype=np.int64), 'reply_count': reply_count},
+                        relative_accuracy=intervals['relative_accuracy'])
+        return
+    intervals['recv_time'].frombytes(np.ascontiguousarray(recv_time, dtype=np.int64).tobytes())
+    intervals['proc_time'].frombytes(np.ascontiguousarray(proc_time, dtype=np.float64).tobytes())
+    intervals['reply_count'].frombytes(np.ascontiguousarray(reply_count, dtype=np.int64).tobytes())
+
+# 写入时间段统计：主粒度写 intervals.txt，其他粒度写 intervals_<秒数>s.txt，并各自写出同名 .csv/.json
+# 每段包括请求量、回复量、QPS、平均/最大耗时和分位数；草图模式下分位数为近似值，并保存同名 .sketch.json 供跨文件合并
+def write_intervals(intervals, out_dir_path, percentiles=DEFAULT_PERCENTILES):
+    main_width = intervals['widths'][0]
+    for width in intervals['widths']:
+        base = os.path.join(out_dir_path, interval_file_base(width, main_width))
+        if 'sketches' in intervals:
+            sketches = intervals['sketches'][width]
+            stats = {start: add_rates(sketch.stats(percentiles), width) for start, sketch in sorted(sketches.items())}
+            save_sketches(base + '.sketch.json', sketches)
+        else:
+            stats = bucket_stats(np.frombuffer(intervals['recv_time'], dtype=np.int64),
+                                 np.frombuffer(intervals['proc_time'], dtype=np.float64),
+                                 np.frombuffer(intervals['reply_count'], dtype=np.int64), width, percentiles)
+        with open(base + '.txt', 'w', encoding='gb2312') as f:
+            for start, entry in stats.items():
+                f.write(format_interval(start, entry, percentiles))
+        write_summary_tables(base, interval_rows(stats, percentiles))
 
 # 生成每个时间段的统计数据
-def generate_intervals(requests, out_dir_path, interval):
+def generate_intervals(requests, out_dir_path, widths, window=None, percentiles=DEFAULT_PERCENTILES,
+                       sketch_accuracy=None):
     logging.info("Generating intervals")
-    intervals = defaultdict(lambda: {
-        'req_count': 0,
-        'reply_count': 0,
-        'total_proc_time': 0
+    intervals = new_intervals(widths, window, sketch_accuracy)
+    reqs = requests.values()
+    add_interval_columns(intervals, {
+        'recv_time': np.fromiter((req['recv_us'] for req in reqs), dtype=np.int64, count=len(reqs)),
+        'proc_time': np.fromiter((req['proc_time'] for req in reqs), dtype=np.float64, count=len(reqs)),
+        'reply_count': np.fromiter((req['reply_count'] for req in reqs), dtype=np.int64, count=len(reqs)),
     })
+    write_intervals(intervals, out_dir_path, percentiles)
 
-    for req in requests.values():
-        recv_time = datetime.strptime(req['recv_time'], '%Y%m%d %H:%M:%S.%f')
-        interval_start = recv_time - timedelta(seconds=(recv_time.second % interval),
-                                               microseconds=recv_time.microsecond)
-        intervals[interval_start]['req_count'] += 1
-        intervals[interval_start]['reply_count'] += len(req['replies'])
-        intervals[interval_start]['total_proc_time'] += req['proc_time']
-
-    # 写入时间间隔统计文件
-    intervals_file = os.path.join(out_dir_path, 'intervals.txt')
-    with open(intervals_file, 'w', encoding='gb2312') as f:
-        for interval, data in sorted(intervals.items()):
-            avg_proc_time = data['total_proc_time'] / data['req_count'] if data['req_count'] > 0 else 0
-            f.write(f"interval: {interval.strftime('%Y%m%d %H:%M:%S')}, req_count: {data['req_count']}, "
-                    f"reply_count: {data['reply_count']}, avg_proc_time: {avg_proc_time * 1000:.3f}ms\n")
-
-# 主函数
-def main():
+# 已关闭的请求 (pktid, 记录, 首次出现序号) 按关闭顺序累加到汇总和时间段统计，产出待排序的输出行
+# (排序键, 序号, func, 逐笔行, 按功能行)；排序键与 request_order 相同，序号相同时的先后即批量模式下的日志顺序
+def closed_rows(closed, summary, intervals, by_time=False):
+    for pktid, entry, seq in closed:
+        req = build_request(pktid, entry)
+        add_to_summary(summary, req)
+        add_to_intervals(intervals, req)
+        yield (req['recv_us'] if by_time else -req['proc_time'], seq, req['func'], format_request(req),
+               format_func_request(req))
+
+def _write_run(path, rows):
+    with open(path, 'wb') as f:
+        for start in range(0, len(rows), OUTPUT_BATCH):
+            pickle.dump(rows[start:start + OUTPUT_BATCH], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+# 外部排序：每 run_size 行排好序写入 spill_root 下本次运行私有的临时目录，最后多路归并按序产出，
+# 内存只与 run_size 有关；只有一批时不写临时文件
+def iter_sorted_rows(rows, spill_root, run_size=SORT_RUN):
+    spill_dir = None
+    run, runs = [], []
+    try:
+        for row in rows:
+            run.append(row)
+            if len(run) >= run_size:
+                if spill_dir is None:
+                    spill_dir = tempfile.mkdtemp(prefix='sort_spill_', dir=spill_root)
+                run.sort()
+                runs.append(os.path.join(spill_dir, f'{len(runs)}.run'))
+                _write_run(runs[-1], run)
+                run = []
+        run.sort()
+        if not runs:
+            yield from run
+            return
+        yield from heapq.merge(*(_read_run(path) for path in runs), run)
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+# 按顺序逐笔写出 (…, func, 逐笔行, 按功能行)；mode 为 'a' 时追加到已有的逐笔文件
+def write_request_rows(rows, out_dir_path, mode='w', max_open=DEFAULT_MAX_OPEN, compress=''):
+    with TextChunkWriter(os.path.join(out_dir_path, 'requests.txt'), mode, compress=compress) as f, \
+            PartitionedWriter(lambda func: os.path.join(out_dir_path, f'requests_func_{func}.txt'), mode,
+                              max_open=max_open, compress=compress) as writer:
+        for _, _, func, line, func_line in rows:
+            f.write(line)
+            writer.write(func, func_line)
+
+# 流式分析：请求空闲超过 idle_timeout 秒（日志时间）即关闭，关联状态只与在途请求数相关；
+# 逐笔输出按 by_time 经外部排序（见 iter_sorted_rows）写出，顺序与批量模式相同，排序内存只与 run_size 有关
+# 输出文件与批量模式相同；超时足够大时内容也完全一致（bench/streamcheck.py 核对）
+def run_streaming(log_path, encoding, out_dir_path, widths, idle_timeout, percentiles=DEFAULT_PERCENTILES,
+                  sketch_accuracy=None, window=None, max_open=DEFAULT_MAX_OPEN, compress='', by_time=False,
+                  run_size=SORT_RUN):
+    logging.info(f"Streaming logs from: {log_path}, idle_timeout: {idle_timeout}s")
+    os.makedirs(out_dir_path, exist_ok=True)
+    if is_ascii_compatible(encoding):
+        events = iter_file_events(log_path, on_lines=profile.counter('lines'))
+    else:
+        events = iter_packet_events(counted_lines(iter_raw_lines(log_path, encoding), profile.counter('lines')))
+
+    correlator = StreamCorrelator(idle_timeout, with_seq=True)
+    summary = new_summary(sketch_accuracy)
+    intervals = new_intervals(widths, window, sketch_accuracy)
+    # 读取、解析、关联、排序与逐笔写出在同一个循环中交替进行，作为一个阶段计时
+    with profile.stage('stream'):
+        rows = closed_rows(iter_closed(profile.count_events(events), correlator), summary, intervals, by_time)
+        write_request_rows(iter_sorted_rows(rows, out_dir_path, run_size), out_dir_path, max_open=max_open,
+                           compress=compress)
+
+    if correlator.orphan_replies:
+        logging.warning(f"Received {correlator.orphan_replies} replies for unknown or closed pktids")
+    logging.info(f"Closed {correlator.closed_count} requests, {correlator.timed_out} timed out without reply, "
+                 f"peak open pktids: {correlator.peak_open}")
+    profile.count('requests', correlator.closed_count)
+    profile.count('timed_out', correlator.timed_out)
+    profile.count('orphan_replies', correlator.orphan_replies)
+    profile.high_water('open_pktids_peak', correlator.peak_open)
+    with profile.stage('write_summary'):
+        write_summary(summary, out_dir_path, percentiles)
+    with profile.stage('write_intervals'):
+        write_intervals(intervals, out_dir_path, percentiles)
+
+# 批量模式的单个文件：独立关联请求，只返回汇总所需的列（每笔请求 32 字节），供主进程累加
+# 列为 func/recv_time（微秒）/proc_time（秒）/reply_count，口径与 build_request 一致
+# export 不为 None 时在工作进程中顺便导出该文件的逐笔请求；encodings 为主进程识别好的 {路径: 编码}
+# profiled 为 True 时另返回 scan_log 的计数 counters，由主进程计入运行剖析
+def request_columns(log_path, index_dir=None, export=None, encodings=None, profiled=False):
+    encoding = encodings[log_path] if encodings else detect_encoding(log_path)
+    counters = {} if profiled else None
+    cols = state_columns(scan_log(log_path, encoding, 1, index_dir, counters))
+    if export is not None:
+        export_columns(cols, log_path, export)
+    replied = cols['reply_count'] > 0
+    proc_time = np.where(replied, cols['last_reply'] - cols['recv_time'], 0) / US_PER_SEC
+    result = {'func': cols['func'], 'recv_time': cols['recv_time'], 'proc_time': proc_time,
+              'reply_count': cols['reply_count']}
+    if counters is not None:
+        result['counters'] = counters
+    return result
+
+# 批量模式下一个汇总范围（单个服务器或全局）的汇总和时间段统计
+def new_batch_stats(widths, window=None, sketch_accuracy=None):
+    return {'summary': new_summary(sketch_accuracy), 'intervals': new_intervals(widths, window, sketch_accuracy)}
+
+# 把一个文件的请求列累加到汇总和时间段统计中
+def add_columns(stats, cols, sketch_accuracy=None):
+    summary = stats['summary']
+    if 'sketches' in summary:
+        add_grouped(summary['sketches'], cols['func'], cols['proc_time'],
+                    sums={'req_count': np.ones(len(cols['func']), dtype=np.int64), 'reply_count': cols['reply_count']},
+                    relative_accuracy=sketch_accuracy)
+    else:
+        summary['func'].frombytes(cols['func'].tobytes())
+        summary['proc_time'].frombytes(cols['proc_time'].tobytes())
+        summary['reply_count'].frombytes(cols['reply_count'].tobytes())
+
+    add_interval_columns(stats['intervals'], cols)
+
+# 写出每个服务器的 out_dir/<服务器>/ 和 out_dir 下全局合并的汇总、时间段统计
+def write_batch_stats(servers, merged, out_dir_path, percentiles=DEFAULT_PERCENTILES):
+    for name, stats in sorted(servers.items()) + [(None, merged)]:
+        server_dir = os.path.join(out_dir_path, name) if name else out_dir_path
+        os.makedirs(server_dir, exist_ok=True)
+        write_summary(stats['summary'], server_dir, percentiles)
+        write_intervals(stats['intervals'], server_dir, percentiles)
+    logging.info(f"Wrote summaries for {len(servers)} servers and the merged summary to {out_dir_path}")
+
+# 批量分析：sources 为分号/换行分隔的文件、通配符或目录，每个文件在进程池中独立解析
+# 输出每个服务器的 out_dir/<服务器>/summary.txt、intervals.txt，以及 out_dir 下合并全部服务器的同名文件
+def run_batch(sources, out_dir_path, widths, percentiles=DEFAULT_PERCENTILES, sketch_accuracy=None,
+              workers=1, pattern=SERVER_PATTERN, window=None, index_dir=None, export=None):
+    paths = expand_sources(sources)
+    if not paths:
+        logging.error(f"No log files found in: {sources}")
+        return
+    servers = {}
+    merged = new_batch_stats(widths, window, sketch_accuracy)
+    logging.info(f"Batch analysing {len(paths)} files with {workers} workers")
+    # 编码在主进程中统一识别，缓存文件只由主进程写
+    with profile.stage('detect_encoding'):
+        encodings = {path: detect_encoding(path) for path in paths}
+    # 工作进程中的解析与主进程的累加交替进行，作为一个阶段计时
+    with profile.stage('parse_and_aggregate'):
+        for path, cols in run_pool(request_columns, paths, workers, index_dir, export, encodings, profile.enabled,
+                                   report=logging.info):
+            server = server_of(path, pattern)
+            if server not in servers:
+                servers[server] = new_batch_stats(widths, window, sketch_accuracy)
+            add_columns(servers[server], cols, sketch_accuracy)
+            add_columns(merged, cols, sketch_accuracy)
+            profile.count('requests', len(cols['func']))
+            if 'counters' in cols:
+                record_scan_counters(cols['counters'])
+    with profile.stage('write_batch_stats'):
+        write_batch_stats(servers, merged, out_dir_path, percentiles)
+
+# 从导出的列式文件汇总，不再解析日志；输出与批量模式相同（按服务器分目录并全局合并）
+def run_from_export(source, fmt, out_dir_path, widths, percentiles=DEFAULT_PERCENTILES, sketch_accuracy=None,
+                    window=None):
+    from export import read_requests
+    logging.info(f"Reading exported requests from: {source} ({fmt})")
+    data = read_requests(source, fmt)
+    # 无回复的请求耗时按 0 计，与 build_request 一致
+    data['proc_time'] = np.where(data['success'], data['proc_time'], 0.0)
+    servers = {}
+    merged = new_batch_stats(widths, window, sketch_accuracy)
+    for server in sorted(set(data['server'])):
+        keep = data['server'] == server
+        cols = {name: data[name][keep] for name in ('func', 'recv_time', 'proc_time', 'reply_count')}
+        servers[server] = new_batch_stats(widths, window, sketch_accuracy)
+        add_columns(servers[server], cols, sketch_accuracy)
+        add_columns(merged, cols, sketch_accuracy)
+    write_batch_stats(servers, merged, out_dir_path, percentiles)
+
+# 跟踪模式：只解析上次检查点之后追加的字节，日志滚动到下一个小时的文件时自动切换
+# 检查点保存读取位置、在途请求和累计的汇总/时间段统计，逐笔文件追加写，summary.txt/intervals.txt 每次重写
+# 逐笔文件是追加写的，只能把每次刷新新关闭的请求按 by_time 排序后追加，整个文件不是全局有序的
+# 在途请求要等空闲超时（idle_timeout，未配置时 60 秒）后才计入
+# 汇总和时间段统计总是用草图（sketch_accuracy 为 None 时取 DEFAULT_ACCURACY）：精确模式保留全部耗时，
+# 每次刷新都要重算并写入检查点，代价与整个文件成正比；草图的大小有上限，每次刷新的代价只与新增字节数相关
+# poll_interval 为 0 时刷新一次即退出，大于 0 时每隔该秒数刷新一次
+def run_follow(log_path, out_dir_path, widths, idle_timeout, percentiles=DEFAULT_PERCENTILES,
+               sketch_accuracy=None, checkpoint_path=None, poll_interval=0, window=None, max_open=DEFAULT_MAX_OPEN,
+               compress='', by_time=False):
+    os.makedirs(out_dir_path, exist_ok=True)
+    sketch_accuracy = sketch_accuracy or DEFAULT_ACCURACY
+    checkpoint_path = checkpoint_path or os.path.join(out_dir_path, 'follow.checkpoint')
+    settings = {'log_path': log_path, 'widths': tuple(widths), 'window': window, 'sketch_accuracy': sketch_accuracy,
+                'by_time': by_time}
+    state = load_checkpoint(checkpoint_path)
+    if state is not None and state['settings'] != settings:
+        logging.warning("Follow settings changed, starting over from the beginning of the log")
+        state = None
+    if state is None:
+        state = {'settings': settings, 'path': log_path, 'offset': 0,
+                 'correlator': StreamCorrelator(idle_timeout if idle_timeout > 0 else 60, with_seq=True),
+                 'summary': new_summary(sketch_accuracy), 'intervals': new_intervals(widths, window, sketch_accuracy)}
+        mode = 'w'
+    else:
+        mode = 'a'
+
+    follower = LogFollower(state['path'], state['offset'])
+    correlator = state['correlator']
+    while True:
+        bytes_read = follower.bytes_read
+        closed = (item for event in follower.poll() for item in correlator.feed(*event))
+        rows = closed_rows(closed, state['summary'], state['intervals'], by_time)
+        write_request_rows(sorted(rows), out_dir_path, mode, max_open, compress)
+        mode = 'a'
+        write_summary(state['summary'], out_dir_path, percentiles)
+        write_intervals(state['intervals'], out_dir_path, percentiles)
+
+        state.update(path=follower.path, offset=follower.offset)
+        save_checkpoint(checkpoint_path, state)
+        logging.info(f"Followed {follower.path} to offset {follower.offset} (+{follower.bytes_read - bytes_read} bytes), "
+                     f"closed {correlator.closed_count} requests, open pktids: {len(correlator.pending)}")
+        if poll_interval <= 0:
+            return
+        time.sleep(poll_interval)
+
+# 按设置运行完整的分析：导出来源、跟踪、批量、流式或一次性解析，与直接运行本脚本相同
+def analyze(settings):
+    configure(settings)
+    if settings['export_source']:
+        run_from_export(settings['export_source'], settings['export_format'] or 'parquet', settings['out_dir'],
+                        settings['widths'], settings['percentiles'], settings['sketch_accuracy'], settings['window'])
+        return
+    if settings['follow']:
+        follow_log(settings)
+        return
+    if settings['batch_sources'].strip():
+        profile.start()
+        run_batch(settings['batch_sources'], settings['out_dir'], settings['widths'], settings['percentiles'],
+                  settings['sketch_accuracy'], settings['workers'], settings['server_pattern'], settings['window'],
+                  settings['index_dir'], settings['export'])
+        write_profile()
+        return
+    if settings['idle_timeout'] > 0:
+        profile.start()
+        with profile.stage('detect_encoding'):
+            encoding = detect_encoding(settings['log_path'])
+        run_streaming(settings['log_path'], encoding, settings['out_dir'], settings['widths'], settings['idle_timeout'],
+                      settings['percentiles'], settings['sketch_accuracy'], settings['window'],
+                      settings['max_open_files'], settings['compress'], settings['by_time'])
+        write_profile()
+        return
+    run_reports(settings)
+
+# 一次性解析 log_path 后写出指定的结果：requests 为全部/按功能的逐笔文件，summary 为 summary.txt，intervals 为时间段统计；
+# 只要汇总或时间段统计时可单独调用（不考虑批量、流式和跟踪设置）
+def run_reports(settings, requests_files=True, summary=True, intervals=True):
+    configure(settings)
+    profile.start()
+    log_path, out_dir = settings['log_path'], settings['out_dir']
+    with profile.stage('detect_encoding'):
+        encoding = detect_encoding(log_path)
+    requests = parse_logs(log_path, encoding, settings['workers'], settings['index_dir'], settings['export'])
+    if requests_files:
+        with profile.stage('write_requests'):
+            write_requests(requests, out_dir, settings['by_time'], settings['compress'])
+        with profile.stage('write_requests_per_function'):
+            write_requests_per_function(requests, out_dir, settings['by_time'], settings['max_open_files'],
+                                        settings['compress'])
+    if summary:
+        with profile.stage('generate_summary'):
+            generate_summary(requests, out_dir, settings['percentiles'], settings['sketch_accuracy'])
+    if intervals:
+        with profile.stage('generate_intervals'):
+            generate_intervals(requests, out_dir, settings['widths'], settings['window'], settings['percentiles'],
+                               settings['sketch_accuracy'])
+    write_profile()
+
+# 跟踪模式（见 run_follow），检查点和刷新间隔取自设置；backend = exact 时也用草图，精度取 relative_accuracy
+def follow_log(settings):
+    configure(settings)
+    if settings['sketch_accuracy'] is None:
+        logging.info(f"Follow mode always uses the sketch backend (relative_accuracy {settings['relative_accuracy']})")
+    run_follow(settings['log_path'], settings['out_dir'], settings['widths'], settings['idle_timeout'],
+               settings['percentiles'], settings['sketch_accuracy'] or settings['relative_accuracy'],
+               settings['checkpoint_path'],
+               settings['poll_interval'], settings['window'], settings['max_open_files'], settings['compress'],
+               settings['by_time'])
+
+# 主函数：config_path 为空时读取 ../config/config.ini（相对于本文件）
+def main(config_path=None):
+    # 配置日志，将日志级别设置为INFO，这样就不会输出DEBUG级别的调试信息了
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
-        encoding = detect_encoding(log_path) if auto_detect else 'gb2312'
-        requests = parse_logs(log_path, encoding)
-        write_requests(requests, out_dir, by_time)
-        write_requests_per_function(requests, out_dir, by_time)
-        generate_summary(requests, out_dir)
-        generate_intervals(requests, out_dir, interval)
+        analyze(read_config(config_path or CONFIG_PATH))
     except Exception as e:
         logging.error(f"An error occurred: {e}", exc_info=True)
+        return 1
+    return 0
+
+# 写出运行剖析报告，总行数取自解析阶段累加的计数
+def write_profile():
+    if not profile.enabled:
+        return
+    report = profile.write(profile_report)
+    slowest = max(report['stages'], key=lambda stage: stage['wall_s'], default=None)
+    logging.info(f"Run report written to {profile_report}: {report['wall_s']:.2f}s in total"
+                 + (f", slowest stage {slowest['stage']} ({slowest['wall_s']:.2f}s)" if slowest else ''))
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+# 跨日志请求关联：按 pktid 把多个来源（上游网关、KbdSvrPacket、下游网关等日志）中的同一笔请求连起来，得到逐段耗时
+#   1. 分区：各来源的文件按行首对齐切块，多进程用各自的正则扫描，事件 (pktid, 时间, func, 是否开始) 按 bucket 秒
+#      追加到本次运行的临时目录 <spill_dir>/join_spill_*/<来源>/<分区>/ 下的二进制文件；扫描进程每攒够 SPILL_EVENTS 个事件写出一次，内存与日志大小无关
+#   2. 关联：逐个时间分区读入该分区及前后相邻分区的事件，每个来源内同一 pktid、相邻间隔不超过 max_skew 秒的事件
+#      合为一次经过（进入/离开时间，packet 来源的每个 AfterGet 开始新的一次）；第一个来源在本分区开始的每次经过为一笔请求，
+#      以请求的 pktid 建哈希表，其他来源的经过逐个探测，进入时间相差不超过 max_skew 秒的取最接近的一次；
+#      各分区互不依赖，多进程并行，内存只与相邻三个分区的事件数相关
+#   3. 输出：每笔请求一行写到 join_requests.csv（按分区、分区内按进入时间），按段和功能的耗时草图汇总写到 join_summary.csv/.json
+# 段的耗时（秒）：a->b 为 b 的进入时间减 a 的进入时间，b->a 为 a 的离开时间减 b 的离开时间，来源名本身为在该来源停留的时间，
+# total 为关联到的各来源中最晚的离开时间减请求的进入时间；与未关联到的来源有关的段为空
+# 一次经过的跨度应小于 bucket 秒（更长的在分区边界处会被截断），bucket 不能小于 max_skew
+import configparser
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from batch import expand_sources
+from chunked import resolve_workers, split_ranges, iter_marked_lines, MIN_CHUNK_SIZE, CHUNKS_PER_WORKER
+from columnar import NO_TS
+from latency import parse_percentiles, summary_rows, write_summary_tables
+from pktparse import iter_packet_events, parse_ts, format_ts, OP_AFTERGET, US_PER_SEC
+from sketch import add_grouped, sketch_stats, DEFAULT_ACCURACY
+from textenc import is_ascii_compatible, DEFAULT_ENCODING
+from timeseries import parse_window, in_window
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'config.ini')
+# pattern 为 packet 时按 KbdSvrPacket 的 WritePacket 行解析（AfterGet 为进入，之后的回复延长这次经过）
+PACKET_PATTERN = 'packet'
+# 分区文件的记录格式；start 为 1 的事件开始新的一次经过
+EVENT_DTYPE = np.dtype([('pktid', '<u8'), ('ts', '<i8'), ('func', '<i4'), ('start', 'u1')])
+NO_FUNC = -1
+# 扫描进程攒够多少事件按分区写出一次
+SPILL_EVENTS = 1 << 18
+# 自定义时间格式按秒缓存的条数上限
+TIME_CACHE_MAX = 4 * 86400
+_EPOCH = datetime(1970, 1, 1)
+
+
+# 读取 [Join] 及各来源的 [Join.<来源名>]，返回设置字典
+def read_config(config_path=CONFIG_PATH) -> dict:
+    config = configparser.ConfigParser(interpolation=None)
+    if not config.read(config_path, encoding='utf-8'):
+        raise FileNotFoundError(f"找不到配置文件: {config_path}")
+    out_dir = os.path.abspath(config.get('Paths', 'out_dir', fallback='') or '.')
+    settings = {
+        'out_dir': out_dir,
+        'bucket': config.getfloat('Join', 'bucket', fallback=300),
+        'max_skew': config.getfloat('Join', 'max_skew', fallback=30),
+        # 临时分区目录的上级目录，为空时为 out_dir
+        'spill_dir': config.get('Join', 'spill_dir', fallback=''),
+        'workers': config.getint('Join', 'workers', fallback=0),
+        'window': parse_window(config.get('Join', 'start_time', fallback=''), config.get('Join', 'end_time', fallback='')),
+        'percentiles': parse_percentiles(config.get('Summary', 'percentiles', fallback='')),
+        'relative_accuracy': config.getfloat('Summary', 'relative_accuracy', fallback=DEFAULT_ACCURACY),
+        'sources': [],
+    }
+    if settings['max_skew'] <= 0 or settings['bucket'] < settings['max_skew']:
+        raise ValueError(f"max_skew 必须大于 0，bucket 不能小于 max_skew: {settings['bucket']}, {settings['max_skew']}")
+    names = [name.strip() for name in config.get('Join', 'sources', fallback='').split(',') if name.strip()]
+    if len(set(names)) != len(names):
+        raise ValueError(f"来源名重复: {', '.join(names)}")
+    for name in names:
+        section = f"Join.{name}"
+        if not config.has_section(section):
+            raise ValueError(f"缺少来源的配置节 [{section}]")
+        source = {
+            'name': name,
+            'files': expand_sources(config.get(section, 'files', fallback='')),
+            'pattern': config.get(section, 'pattern', fallback=PACKET_PATTERN) or PACKET_PATTERN,
+            'time_format': config.get(section, 'time_format', fallback=''),
+            'encoding': config.get(section, 'encoding', fallback='') or DEFAULT_ENCODING,
+        }
+        if not is_ascii_compatible(source['encoding']):
+            raise ValueError(f"来源 {name} 的编码须兼容 ASCII: {source['encoding']}")
+        if source['pattern'] != PACKET_PATTERN:
+            groups = re.compile(source['pattern']).groupindex
+            if 'pktid' not in groups or 'time' not in groups:
+                raise ValueError(f"来源 {name} 的 pattern 须包含 pktid 和 time 命名分组")
+        settings['sources'].append(source)
+    return settings
+
+
+# 把 time 分组的文本（bytes）转为整数微秒的函数，格式不符时返回 None；time_format 为空时为 YYYYMMDD HH:MM:SS.ffffff，
+# 自定义格式按秒以上的部分缓存，以 .%f 结尾时秒以下的部分逐条换算
+def make_time_parser(time_format: str):
+    if not time_format:
+        return parse_ts
+    fraction = time_format.endswith('.%f')
+    head_format = time_format[:-3] if fraction else time_format
+    cache = {}
+
+    def parse(text: bytes):
+        head, frac = text.rpartition(b'.')[::2] if fraction else (text, b'')
+        base = cache.get(head)
+        if base is None:
+            try:
+                base = (datetime.strptime(head.decode('ascii'), head_format) - _EPOCH) // timedelta(microseconds=1)
+            except (UnicodeDecodeError, ValueError):
+                return None
+            if len(cache) >= TIME_CACHE_MAX:
+                cache.clear()
+            cache[head] = base
+        if not frac:
+            return base
+        if not frac.isdigit() or len(frac) > 6:
+            return None
+        return base + int(frac.ljust(6, b'0'))
+    return parse
+
+
+# 扫描进程的事件缓冲：攒够后按分区排好，追加到 <directory>/<分区>/<tag>.bin
+class _Spiller:
+    def __init__(self, directory: str, tag: str, bucket_us: int):
+        self.directory = directory
+        self.tag = tag
+        self.bucket_us = bucket_us
+        self.pktid, self.ts, self.func, self.start = array('Q'), array('q'), array('i'), array('B')
+        self.events = 0
+
+    def flush(self):
+        count = len(self.ts)
+        if not count:
+            return
+        events = np.empty(count, dtype=EVENT_DTYPE)
+        events['pktid'] = np.frombuffer(self.pktid, dtype=np.uint64)
+        events['ts'] = np.frombuffer(self.ts, dtype=np.int64)
+        events['func'] = np.frombuffer(self.func, dtype=np.int32)
+        events['start'] = np.frombuffer(self.start, dtype=np.uint8)
+        buckets = events['ts'] // self.bucket_us
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for part in np.split(order, bounds):
+            directory = os.path.join(self.directory, str(int(buckets[part[0]])))
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, self.tag + '.bin'), 'ab') as f:
+                f.write(events[part].tobytes())
+        self.events += count
+        for column in (self.pktid, self.ts, self.func, self.start):
+            del column[:]
+
+
+# 扫描一个文件的 [start, end) 字节区间，事件按分区写到 spill_dir/<来源>/ 下，返回 (事件数, 不合格的匹配数)
+def partition_range(source: dict, path: str, start: int, end: int, spill_dir: str, tag: str, bucket_us: int) -> tuple:
+    spiller = _Spiller(os.path.join(spill_dir, source['name']), tag, bucket_us)
+    add_pktid, add_ts, add_func, add_start = (spiller.pktid.append, spiller.ts.append, spiller.func.append,
+                                              spiller.start.append)
+    rejected = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if source['pattern'] == PACKET_PATTERN:
+            for ts, op, pktid, func in iter_packet_events(iter_marked_lines(mm, start, end)):
+                add_pktid(pktid)
+                add_ts(ts)
+                add_func(func)
+                add_start(op == OP_AFTERGET)
+                if len(spiller.ts) >= SPILL_EVENTS:
+                    spiller.flush()
+        else:
+            regex = re.compile(source['pattern'].encode(source['encoding']), re.MULTILINE)
+            parse_time = make_time_parser(source['time_format'])
+            has_func = 'func' in regex.groupindex
+            for match in regex.finditer(mm, start, end):
+                pktid = match.group('pktid')
+                ts = parse_time(match.group('time'))
+                func = match.group('func') if has_func else None
+                if ts is None or not pktid.isdigit() or len(pktid) > 19:
+                    rejected += 1
+                    continue
+                add_pktid(int(pktid))
+                add_ts(ts)
+                add_func(int(func) if func and func.isdigit() and len(func) < 10 else NO_FUNC)
+                add_start(False)
+                if len(spiller.ts) >= SPILL_EVENTS:
+                    spiller.flush()
+    spiller.flush()
+    return spiller.events, rejected
+
+
+# 读入一个来源一个分区的全部事件，按文件、区间的先后拼接
+def load_bucket(spill_dir: str, name: str, bucket: int):
+    directory = os.path.join(spill_dir, name, str(bucket))
+    if not os.path.isdir(directory):
+        return np.empty(0, dtype=EVENT_DTYPE)
+    parts = [np.fromfile(os.path.join(directory, part), dtype=EVENT_DTYPE) for part in sorted(os.listdir(directory))]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=EVENT_DTYPE)
+
+
+# 把一个来源的事件合成经过：按 (pktid, 时间) 稳定排序，pktid 变化、间隔超过 skew_us 或遇到开始事件时开始新的一次；
+# 返回 {'pktid', 'first', 'last', 'func'} 列，func 取这次经过中出现的功能号（没有时为 NO_FUNC）
+def build_visits(events, skew_us: int) -> dict:
+    if not len(events):
+        return {'pktid': np.empty(0, np.uint64), 'first': np.empty(0, np.int64), 'last': np.empty(0, np.int64),
+                'func': np.empty(0, np.int32)}
+    events = events[np.lexsort((events['ts'], events['pktid']))]
+    pktid, ts = events['pktid'], events['ts']
+    new = np.ones(len(events), dtype=bool)
+    new[1:] = (pktid[1:] != pktid[:-1]) | (ts[1:] - ts[:-1] > skew_us) | (events['start'][1:] != 0)
+    starts = np.flatnonzero(new)
+    return {'pktid': pktid[starts], 'first': ts[starts], 'last': np.maximum.reduceat(ts, starts),
+            'func': np.maximum.reduceat(events['func'], starts)}
+
+
+# 段名及其计算方式 [(段名, 类型, 来源序号)]，类型为 in（进入）、dwell（停留）、out（返回）
+def segments(names: list) -> list:
+    result = [(f"{names[i - 1]}->{names[i]}", 'in', i) for i in range(1, len(names))]
+    result += [(name, 'dwell', i) for i, name in enumerate(names)]
+    result += [(f"{names[i]}->{names[i - 1]}", 'out', i) for i in range(len(names) - 1, 0, -1)]
+    return result + [('total', 'total', 0)]
+
+
+# 各笔请求的逐段耗时（整数微秒）和是否有效，列与 segments 对应
+def segment_values(first, last, names: list) -> tuple:
+    present = first != NO_TS
+    columns, valid = [], []
+    for _, kind, i in segments(names):
+        if kind == 'in':
+            columns.append(first[:, i] - first[:, i - 1])
+            valid.append(present[:, i] & present[:, i - 1])
+        elif kind == 'out':
+            columns.append(last[:, i - 1] - last[:, i])
+            valid.append(present[:, i] & present[:, i - 1])
+        elif kind == 'dwell':
+            columns.append(last[:, i] - first[:, i])
+            valid.append(present[:, i])
+        else:
+            columns.append(np.where(present, last, np.iinfo(np.int64).min).max(axis=1) - first[:, 0])
+            valid.append(present[:, 0])
+    return np.stack(columns, axis=1), np.stack(valid, axis=1)
+
+
+# 关联一个时间分区：读入各来源相邻三个分区的事件，第一个来源在本分区开始的经过为请求，其余来源按 pktid 哈希关联；
+# 返回 (请求列, {段名: {func: LatencySketch}}, 各来源关联到的请求数)
+def join_bucket(spill_dir: str, names: list, bucket: int, bucket_us: int, skew_us: int, window=None,
+                relative_accuracy: float = DEFAULT_ACCURACY) -> tuple:
+    low, high = bucket * bucket_us, (bucket + 1) * bucket_us
+    visits = [build_visits(np.concatenate([load_bucket(spill_dir, name, b) for b in (bucket - 1, bucket, bucket + 1)]),
+                           skew_us) for name in names]
+    anchor = visits[0]
+    keep = (anchor['first'] >= low) & (anchor['first'] < high)
+    if window:
+        keep &= in_window(anchor['first'], window)
+    order = np.flatnonzero(keep)
+    order = order[np.argsort(anchor['first'][order], kind='stable')]
+    count = len(order)
+    pktid, func = anchor['pktid'][order], anchor['func'][order].copy()
+    first = np.full((count, len(names)), NO_TS, dtype=np.int64)
+    last = np.full((count, len(names)), NO_TS, dtype=np.int64)
+    first[:, 0], last[:, 0] = anchor['first'][order], anchor['last'][order]
+
+    # 哈希表：pktid -> 请求行号（pktid 复用时一个 pktid 有多笔请求）
+    table = {}
+    for row, key in enumerate(pktid.tolist()):
+        table.setdefault(key, []).append(row)
+    anchor_first = first[:, 0].tolist()
+    matched = [count]
+    for i, probe in enumerate(visits[1:], 1):
+        candidates = np.flatnonzero(np.isin(probe['pktid'], pktid)
+                                    & (probe['first'] >= low - skew_us) & (probe['first'] < high + skew_us))
+        best = {}
+        for key, start, end, probe_func in zip(probe['pktid'][candidates].tolist(), probe['first'][candidates].tolist(),
+                                               probe['last'][candidates].tolist(), probe['func'][candidates].tolist()):
+            for row in table[key]:
+                gap = abs(start - anchor_first[row])
+                if gap <= skew_us and (row not in best or gap < best[row][0]):
+                    best[row] = (gap, start, end, probe_func)
+        for row, (_, start, end, probe_func) in best.items():
+            first[row, i], last[row, i] = start, end
+            if func[row] == NO_FUNC:
+                func[row] = probe_func
+        matched.append(len(best))
+
+    values, valid = segment_values(first, last, names)
+    sketches = {}
+    for j, (name, _, _) in enumerate(segments(names)):
+        mask = valid[:, j]
+        if mask.any():
+            sketches[name] = add_grouped({}, func[mask], values[mask, j] / US_PER_SEC,
+                                         relative_accuracy=relative_accuracy)
+    return {'pktid': pktid, 'func': func, 'first': first, 'values': values, 'valid': valid}, sketches, matched
+
+
+# 按顺序产出 func(*args) 的结果；有进程池时最多提前提交 ahead 个任务，已完成但尚未取走的结果不会无限堆积
+def _ordered_map(pool, func, tasks, ahead: int):
+    if pool is None:
+        for args in tasks:
+            yield func(*args)
+        return
+    pending = deque()
+    for args in tasks:
+        pending.append(pool.submit(func, *args))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# 一个分区的请求写成 CSV 行：pktid, func, 进入时间, 关联到的来源数, 各段耗时（秒，无效为空）
+def _csv_lines(rows: dict) -> list:
+    values = (rows['values'] / US_PER_SEC).tolist()
+    valid = rows['valid'].tolist()
+    matched = (rows['first'] != NO_TS).sum(axis=1).tolist()
+    lines = []
+    for pktid, func, start, count, row, ok in zip(rows['pktid'].tolist(), rows['func'].tolist(),
+                                                  rows['first'][:, 0].tolist(), matched, values, valid):
+        fields = ','.join(str(value) if flag else '' for value, flag in zip(row, ok))
+        lines.append(f"{pktid},{'' if func == NO_FUNC else func},{format_ts(start)},{count},{fields}\n")
+    return lines
+
+
+# 按设置关联各来源的日志，写出 join_requests.csv 和 join_summary.csv/.json，返回统计信息
+def join_logs(settings: dict, report=print) -> dict:
+    sources = settings['sources']
+    if len(sources) < 2:
+        raise ValueError("[Join] sources 至少需要两个来源")
+    names = [source['name'] for source in sources]
+    bucket_us = int(settings['bucket'] * US_PER_SEC)
+    skew_us = int(settings['max_skew'] * US_PER_SEC)
+    workers = resolve_workers(settings['workers'])
+    os.makedirs(settings['out_dir'], exist_ok=True)
+    # 每次运行在 spill_dir（为空时为 out_dir）下新建私有的临时目录，结束后只删除这个目录
+    spill_root = os.path.abspath(settings['spill_dir'] or settings['out_dir'])
+    os.makedirs(spill_root, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix='join_spill_', dir=spill_root)
+    try:
+        return _join_spilled(settings, sources, names, bucket_us, skew_us, workers, spill_dir, report)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _join_spilled(settings: dict, sources: list, names: list, bucket_us: int, skew_us: int, workers: int,
+                  spill_dir: str, report) -> dict:
+    # 分区任务：每个文件按行首切成约 workers * CHUNKS_PER_WORKER 块（每块至少 MIN_CHUNK_SIZE）
+    tasks = []
+    for source in sources:
+        for index, path in enumerate(source['files']):
+            size = os.path.getsize(path)
+            if not size:
+                continue
+            count = max(min(workers * CHUNKS_PER_WORKER, size // MIN_CHUNK_SIZE), 1)
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ranges = split_ranges(mm, size, count)
+            for part, (start, end) in enumerate(ranges):
+                tasks.append((source, path, start, end, spill_dir, f"{index:06d}_{part:04d}", bucket_us))
+    stats = {'files': sum(len(source['files']) for source in sources), 'events': 0, 'rejected': 0,
+             'requests': 0, 'matched': dict.fromkeys(names[1:], 0)}
+    output = os.path.join(settings['out_dir'], 'join_requests.csv')
+    sketches = {}
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for events, rejected in _ordered_map(pool, partition_range, tasks, workers * 2):
+            stats['events'] += events
+            stats['rejected'] += rejected
+        report(f"分区完成: {stats['files']} 个文件，{stats['events']} 个事件，不合格的匹配 {stats['rejected']} 个")
+
+        anchor_dir = os.path.join(spill_dir, names[0])
+        buckets = sorted(int(name) for name in os.listdir(anchor_dir)) if os.path.isdir(anchor_dir) else []
+        header = ','.join(['pktid', 'func', 'start', 'matched'] + [f"{name}_s" for name, _, _ in segments(names)])
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            f.write(header + '\n')
+            tasks = [(spill_dir, names, bucket, bucket_us, skew_us, settings['window'], settings['relative_accuracy'])
+                     for bucket in buckets]
+            for rows, bucket_sketches, matched in _ordered_map(pool, join_bucket, tasks, workers * 2):
+                f.writelines(_csv_lines(rows))
+                stats['requests'] += matched[0]
+                for name, value in zip(names[1:], matched[1:]):
+                    stats['matched'][name] += value
+                for segment, by_func in bucket_sketches.items():
+                    merged = sketches.setdefault(segment, {})
+                    for func, sketch in by_func.items():
+                        if func in merged:
+                            merged[func].merge(sketch)
+                        else:
+                            merged[func] = sketch
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    rows = []
+    for segment, _, _ in segments(names):
+        for row in summary_rows(sketch_stats(sketches.get(segment, {}), settings['percentiles']), settings['percentiles']):
+            rows.append(dict({'segment': segment}, **row))
+    write_summary_tables(os.path.join(settings['out_dir'], 'join_summary'), rows)
+    stats['output'] = output
+    return stats
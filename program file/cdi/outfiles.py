@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# 按键拆分的输出文件（如每个 func 一个 requests_func_<func>.txt）：各键的行先攒在缓冲区，
+# 攒够一批再一次 writelines 写出；同时打开的文件数不超过 max_open，超出时关闭最久未用的，
+# 再次写入时以追加方式重新打开，func 很多时也不会耗尽文件句柄
+# 所有逐笔输出都经 TextChunkWriter 按大块拼接、整块编码（gb2312）后写出，可选 gzip/zstd 压缩
+import gzip
+import os
+from collections import OrderedDict
+
+# 同时打开的文件数上限
+DEFAULT_MAX_OPEN = 64
+# 每个键攒够多少行写出一次
+DEFAULT_BUFFER_LINES = 4096
+# 压缩方式 -> 文件扩展名；zstd 需要安装 zstandard
+COMPRESSIONS = {'': '', 'gzip': '.gz', 'zstd': '.zst'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+# 实际写出的文件路径（压缩时加扩展名）
+def output_path(path: str, compress: str = '') -> str:
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compress}，可选 gzip, zstd")
+    return path + COMPRESSIONS[compress]
+
+
+# 以二进制方式打开输出文件；追加模式下压缩文件追加一个新的 gzip 成员/zstd 帧，解压时与整体压缩相同
+def _open_binary(path: str, mode: str, compress: str):
+    if not compress:
+        return open(path, mode + 'b')
+    if compress == 'gzip':
+        return gzip.open(path, mode + 'b', compresslevel=GZIP_LEVEL)
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd 压缩需要安装 zstandard: pip install zstandard") from e
+    return zstandard.open(path, mode + 'b', cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL))
+
+
+class TextChunkWriter:
+    # 文本行攒够 chunk_lines 行后拼接成一块，整块编码后写出；path 为压缩前的文件名
+    # 与文本模式打开的文件一样，'\n' 按平台换行符写出
+    def __init__(self, path: str, mode: str = 'w', encoding: str = 'gb2312', compress: str = '',
+                 chunk_lines: int = DEFAULT_BUFFER_LINES):
+        self.path = output_path(path, compress)
+        self.encoding = encoding
+        self.chunk_lines = max(chunk_lines, 1)
+        self._buffer = []
+        self._file = _open_binary(self.path, mode, compress)
+
+    def write(self, line: str):
+        self._buffer.append(line)
+        if len(self._buffer) >= self.chunk_lines:
+            self.flush()
+
+    # 直接写出一批行（先写出已缓冲的行）
+    def writelines(self, lines):
+        self.flush()
+        self._write(''.join(lines))
+
+    def flush(self):
+        if self._buffer:
+            self._write(''.join(self._buffer))
+            self._buffer.clear()
+
+    def _write(self, text: str):
+        if os.linesep != '\n':
+            text = text.replace('\n', os.linesep)
+        self._file.write(text.encode(self.encoding))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartitionedWriter:
+    # path_of(key) 给出键对应的文件路径；mode 为 'w' 时每个文件第一次打开先清空，为 'a' 时追加
+    # compress 为压缩方式（见 COMPRESSIONS），文件名另加对应扩展名
+    def __init__(self, path_of, mode: str = 'w', encoding: str = 'gb2312', max_open: int = DEFAULT_MAX_OPEN,
+                 buffer_lines: int = DEFAULT_BUFFER_LINES, compress: str = ''):
+        self.path_of = path_of
+        self.mode = mode
+        self.encoding = encoding
+        self.compress = compress
+        self.max_open = max(max_open, 1)
+        self.buffer_lines = max(buffer_lines, 1)
+        self._buffers = {}
+        self._files = OrderedDict()
+        self._opened = set()
+        self.reopened = 0
+
+    def write(self, key, line: str):
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = []
+        buffer.append(line)
+        if len(buffer) >= self.buffer_lines:
+            self._flush(key, buffer)
+
+    def _file(self, key):
+        f = self._files.get(key)
+        if f is not None:
+            self._files.move_to_end(key)
+            return f
+        if len(self._files) >= self.max_open:
+            self._files.popitem(last=False)[1].close()
+        if key in self._opened:
+            self.reopened += 1
+            mode = 'a'
+        else:
+            self._opened.add(key)
+            mode = self.mode
+        f = self._files[key] = TextChunkWriter(self.path_of(key), mode, self.encoding, self.compress)
+        return f
+
+    def _flush(self, key, buffer):
+        self._file(key).writelines(buffer)
+        buffer.clear()
+
+    # 写出全部缓冲的行并关闭文件
+    def close(self):
+        try:
+            for key, buffer in self._buffers.items():
+                if buffer:
+                    self._flush(key, buffer)
+        finally:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            self._buffers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
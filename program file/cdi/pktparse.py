@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# KSvrComm WritePacket 日志行的字节级快速解析，log_collect.py / logassay.py / log_asy.py 共用
+#
+# 行格式:
+#   20240927 13:00:00.123456 [WritePacket]KSvrComm AfterGet[pktid(123)], func: 456, ...
+# 先用字面量 MARKER 做预过滤，命中后按固定偏移取时间戳/操作/pktid/func，
+# 时间戳直接转成整数微秒（以 1970-01-01 00:00:00 为零点的本地时间），不调用 strptime
+from datetime import datetime, timedelta
+
+MARKER = b'[WritePacket]KSvrComm '
+TS_LEN = 24  # 'YYYYMMDD HH:MM:SS.ffffff'
+
+# 操作类型编码
+OP_AFTERGET = 0
+OP_PUT = 1
+OP_REPLYNULL = 2
+OP_NAMES = ('AfterGet', 'Put', 'ReplyNull')
+
+US_PER_SEC = 1000000
+US_PER_DAY = 86400 * US_PER_SEC
+
+_EPOCH = datetime(1970, 1, 1)
+_MARKER_LEN = len(MARKER)
+_PKTID_OPEN = b'[pktid('
+_FUNC_SEP = b')], func:'
+_OP_PREFIXES = (
+    (b'AfterGet' + _PKTID_OPEN, OP_AFTERGET),
+    (b'Put' + _PKTID_OPEN, OP_PUT),
+    (b'ReplyNull' + _PKTID_OPEN, OP_REPLYNULL),
+)
+
+# 'YYYYMMDD HH:MM:SS' -> 该秒起点的微秒数；日志按时间顺序写入，命中率极高
+_second_cache = {}
+_SECOND_CACHE_MAX = 4 * 86400
+
+
+def _second_to_us(prefix: bytes):
+    try:
+        return _second_cache[prefix]
+    except KeyError:
+        pass
+    if (prefix[8] != 32 or prefix[11] != 58 or prefix[14] != 58
+            or not (prefix[:8] + prefix[9:11] + prefix[12:14] + prefix[15:17]).isdigit()):
+        return None
+    try:
+        dt = datetime(int(prefix[:4]), int(prefix[4:6]), int(prefix[6:8]),
+                      int(prefix[9:11]), int(prefix[12:14]), int(prefix[15:17]))
+    except ValueError:
+        return None
+    if len(_second_cache) >= _SECOND_CACHE_MAX:
+        _second_cache.clear()
+    us = (dt - _EPOCH) // timedelta(microseconds=1)
+    _second_cache[prefix] = us
+    return us
+
+
+# 解析时间戳 'YYYYMMDD HH:MM:SS.ffffff'（bytes 或 str），返回整数微秒，格式不符返回 None
+def parse_ts(ts) -> int:
+    if isinstance(ts, str):
+        ts = ts.encode('ascii', 'replace')
+    if len(ts) != TS_LEN or ts[17] != 46 or not ts[18:].isdigit():
+        return None
+    base = _second_to_us(ts[:17])
+    if base is None:
+        return None
+    return base + int(ts[18:])
+
+
+def _parse_at(line: bytes, pos: int):
+    ts_start = pos - TS_LEN - 1
+    if ts_start < 0 or line[pos - 1] != 32:
+        return None
+    ts_us = parse_ts(line[ts_start:pos - 1])
+    if ts_us is None:
+        return None
+
+    p = pos + _MARKER_LEN
+    for prefix, op in _OP_PREFIXES:
+        if line.startswith(prefix, p):
+            p += len(prefix)
+            break
+    else:
+        return None
+
+    close = line.find(b')', p)
+    pktid_b = line[p:close]
+    if close < 0 or not pktid_b.isdigit() or not line.startswith(_FUNC_SEP, close):
+        return None
+    q = close + len(_FUNC_SEP)
+    if line[q:q + 1] == b' ':
+        q += 1
+    comma = line.find(b',', q)
+    func_b = line[q:comma]
+    if comma < 0 or not func_b.isdigit():
+        return None
+
+    return ts_us, op, int(pktid_b), int(func_b), comma + 1
+
+
+# 解析一行日志（bytes），返回 (ts_us, op, pktid, func, info_offset)，不匹配返回 None
+# info_offset 为 func 后逗号之后的偏移，需要 info 文本时再按需解码 line[info_offset:]
+def parse_packet_line(line: bytes):
+    pos = line.find(MARKER)
+    while pos >= 0:
+        event = _parse_at(line, pos)
+        if event is not None:
+            return event
+        pos = line.find(MARKER, pos + 1)
+    return None
+
+
+# 逐行遍历二进制文件对象，产出 (ts_us, op, pktid, func)
+def iter_packet_events(lines):
+    find = bytes.find
+    for line in lines:
+        if find(line, MARKER) < 0:
+            continue
+        event = parse_packet_line(line)
+        if event is not None:
+            yield event[:4]
+
+
+# 'HH:MM:SS[.ffffff]' 形式的时间转成当天的微秒偏移，空值返回 None
+def time_of_day_us(t) -> int:
+    if t is None:
+        return None
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * US_PER_SEC + t.microsecond
+
+
+# 微秒转回 datetime
+def to_datetime(ts_us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=ts_us)
+
+
+# 按秒缓存格式化结果，输出与原日志一致的 'YYYYMMDD HH:MM:SS.ffffff'
+_format_cache = {}
+
+
+def format_ts(ts_us: int) -> str:
+    sec, us = divmod(ts_us, US_PER_SEC)
+    prefix = _format_cache.get(sec)
+    if prefix is None:
+        if len(_format_cache) >= _SECOND_CACHE_MAX:
+            _format_cache.clear()
+        prefix = (_EPOCH + timedelta(seconds=sec)).strftime('%Y%m%d %H:%M:%S.')
+        _format_cache[sec] = prefix
+    return f"{prefix}{us:06d}"
+
+
+# 毫秒精度的 'YYYY-MM-DD HH:MM:SS.mmm'（截断，与 strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] 一致），同样按秒缓存
+_format_ms_cache = {}
+
+
+def format_ts_ms(ts_us: int) -> str:
+    sec, us = divmod(ts_us, US_PER_SEC)
+    prefix = _format_ms_cache.get(sec)
+    if prefix is None:
+        if len(_format_ms_cache) >= _SECOND_CACHE_MAX:
+            _format_ms_cache.clear()
+        prefix = (_EPOCH + timedelta(seconds=sec)).strftime('%Y-%m-%d %H:%M:%S.')
+        _format_ms_cache[sec] = prefix
+    return f"{prefix}{us // 1000:03d}"
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# 运行剖析：按阶段记录墙钟/CPU 时间、阶段结束时的峰值 RSS，以及行数、匹配行数、在途 pktid 峰值等计数，
+# 运行结束后写出 JSON 报告（放在 summary.txt 旁）。只在阶段边界取样，不做逐行计时；
+# 输入行数由解析阶段自己累加到 lines 计数，各阶段的每秒行数只按该阶段内累加的行数计算，读行之外的阶段不给出；
+# 未启用时 stage() 返回同一个空上下文，计数调用直接返回，对分析本身没有额外开销
+# capture 可选 cprofile（整个运行的 cProfile，另存 .prof 和按累计耗时排序的文本）或 tracemalloc（各阶段的 Python 内存分配峰值），
+# 两者都会明显拖慢运行，只用于定位问题
+import contextlib
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不记录峰值 RSS
+    resource = None
+
+CAPTURES = ('', 'cprofile', 'tracemalloc')
+# cProfile 文本报告列出的函数数
+PROFILE_TOP = 40
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+# 本进程和已结束子进程的峰值 RSS（MB）
+def peak_rss_mb() -> tuple:
+    if resource is None:
+        return None, None
+    scale = 2 ** 20 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+class RunProfile:
+    # enabled 为 False 时所有方法都不做任何事；capture 见 CAPTURES
+    def __init__(self, enabled: bool = False, capture: str = ''):
+        if capture not in CAPTURES:
+            raise ValueError(f"不支持的剖析方式: {capture}，可选 cprofile, tracemalloc")
+        self.enabled = enabled
+        self.capture = capture if enabled else ''
+        self.stages = []
+        self.counters = {}
+        self._profiler = None
+        self._started = None
+
+    # 开始整个运行的计时（及 cProfile/tracemalloc）
+    def start(self):
+        if not self.enabled:
+            return
+        self._started = (time.perf_counter(), time.process_time())
+        if self.capture == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.capture == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start()
+
+    # 用法: with profile.stage('write_requests'): ...
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name: str):
+        if self.capture == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        lines = self.counters.get('lines', 0)
+        try:
+            yield
+        finally:
+            entry = {'stage': name, 'wall_s': time.perf_counter() - wall, 'cpu_s': time.process_time() - cpu}
+            lines = self.counters.get('lines', 0) - lines
+            if lines:
+                entry['lines'] = lines
+            entry['peak_rss_mb'], entry['children_peak_rss_mb'] = peak_rss_mb()
+            if self.capture == 'tracemalloc':
+                entry['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            self.stages.append(entry)
+
+    # 累加计数
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # 记录最大值（如在途 pktid 峰值）
+    def high_water(self, name: str, value):
+        if self.enabled and value > self.counters.get(name, value - 1):
+            self.counters[name] = value
+
+    # 累加到计数 name 的回调，未启用时为 None（供解析函数读完输入后报告行数）
+    def counter(self, name: str):
+        if not self.enabled:
+            return None
+        return lambda value: self.count(name, value)
+
+    # 启用时包装事件流（或行流）以统计条数，未启用时原样返回
+    def count_events(self, events, name: str = 'matched_lines'):
+        if not self.enabled:
+            return events
+        return self._count_events(events, name)
+
+    def _count_events(self, events, name):
+        count = 0
+        try:
+            for event in events:
+                count += 1
+                yield event
+        finally:
+            self.count(name, count)
+
+    # 结束运行并生成报告；解析阶段记录了输入行数时另外计算跳过的行数
+    def report(self) -> dict:
+        wall, cpu = time.perf_counter() - self._started[0], time.process_time() - self._started[1]
+        counters = dict(self.counters)
+        lines = counters.get('lines')
+        if lines is not None and 'matched_lines' in counters:
+            counters['skipped_lines'] = lines - counters['matched_lines']
+        stages = [dict(stage, lines_per_s=stage['lines'] / stage['wall_s'] if stage.get('lines') and stage['wall_s']
+                       else None) for stage in self.stages]
+        rss, children_rss = peak_rss_mb()
+        return {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'wall_s': wall, 'cpu_s': cpu,
+                'lines_per_s': lines / wall if lines and wall else None,
+                'peak_rss_mb': rss, 'children_peak_rss_mb': children_rss, 'capture': self.capture,
+                'counters': counters, 'stages': stages}
+
+    # 写出 JSON 报告（cprofile 模式另写 <报告名>.prof 和 <报告名>.profile.txt），返回报告
+    def write(self, path: str) -> dict:
+        if not self.enabled:
+            return None
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self.capture == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.stop()
+        report = self.report()
+        base = os.path.splitext(path)[0]
+        if self._profiler is not None:
+            import pstats
+            self._profiler.dump_stats(base + '.prof')
+            with open(base + '.profile.txt', 'w', encoding='utf-8') as f:
+                pstats.Stats(self._profiler, stream=f).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            report['profile'] = base + '.prof'
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        return report
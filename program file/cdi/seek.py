@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 按时间段定位日志的字节区间：日志按时间顺序写入，对行首时间戳按字节偏移二分查找，
+# 只读取时间段内以及其后一小段（等待迟到的回复）的内容，代价与时间段大小相关而不是文件大小
+import mmap
+import os
+
+from pktparse import parse_ts, TS_LEN, US_PER_SEC, US_PER_DAY
+
+# 允许的行间时间乱序（秒），起点向前多留这么多
+DEFAULT_JITTER = 1.0
+# 时间段结束后继续读取的时长（秒），用于统计迟到的 Put/ReplyNull
+DEFAULT_LOOKAHEAD = 60.0
+
+
+# 从 pos 所在行的下一行（pos 本身是行首时即该行）开始，找第一条带时间戳的行，
+# 返回 (行首偏移, 时间戳微秒)；直到文件末尾都没有时返回 (size, None)
+def _probe(mm, pos: int, size: int) -> tuple:
+    if pos > 0 and mm[pos - 1] != 10:
+        nl = mm.find(b'\n', pos)
+        pos = size if nl < 0 else nl + 1
+    while pos < size:
+        ts = parse_ts(mm[pos:pos + TS_LEN])
+        if ts is not None:
+            return pos, ts
+        nl = mm.find(b'\n', pos)
+        pos = size if nl < 0 else nl + 1
+    return size, None
+
+
+# 第一条时间戳不早于 ts_us 的行的行首偏移，没有则返回文件大小
+def seek_time(mm, ts_us: int, size: int) -> int:
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line_start, ts = _probe(mm, mid, size)
+        if ts is None or ts >= ts_us:
+            hi = mid
+        else:
+            lo = line_start + 1
+    return _probe(mm, lo, size)[0]
+
+
+# 当天时间段 window=(start_us, end_us) 对应的字节区间 [start, end)，日期取文件中第一条带时间戳的行
+# 起点提前 jitter 秒，终点延后 lookahead + jitter 秒；无法定位（没有时间段、跨零点、文件为空）时返回 None
+def window_span(path: str, window, jitter: float = DEFAULT_JITTER, lookahead: float = DEFAULT_LOOKAHEAD):
+    if window is None or window[0] > window[1]:
+        return None
+    size = os.path.getsize(path)
+    if size == 0:
+        return None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first_ts = _probe(mm, 0, size)[1]
+        if first_ts is None:
+            return None
+        day = first_ts - first_ts % US_PER_DAY
+        start = seek_time(mm, day + window[0] - int(jitter * US_PER_SEC), size)
+        end = seek_time(mm, day + window[1] + int((lookahead + jitter) * US_PER_SEC) + 1, size)
+    return start, max(start, end)
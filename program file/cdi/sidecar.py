@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# 日志旁的持久化索引文件（<日志>.idx）：保存解析出的事件列 ts/pktid/func/op，以及稀疏的
+# 时间戳 -> 字节偏移/行号表（每 BLOCK_SIZE 字节一项）；读取时直接内存映射，不再解析文本
+# 日志的大小或修改时间变化后索引自动失效并重建
+#
+# 文件布局: MAGIC | 头部长度(uint32) | JSON 头部 | 各数组原始字节（均按 8 字节对齐）
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from chunked import iter_marked_lines, map_ranges, split_ranges
+from columnar import EventColumns
+from pktparse import iter_packet_events, US_PER_SEC, US_PER_DAY
+
+MAGIC = b'KSVRIDX1'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+# 稀疏表的粒度：每 1MB 日志记录一项
+BLOCK_SIZE = 1024 * 1024
+
+_ARRAYS = (('ts', '<i8'), ('pktid', '<u8'), ('func', '<i4'), ('op', 'u1'),
+           ('block_offset', '<i8'), ('block_ts', '<i8'), ('block_row', '<i8'))
+
+
+# 索引文件路径：index_dir 为空时放在日志旁边
+def index_path(log_path: str, index_dir: str = '') -> str:
+    if index_dir:
+        return os.path.join(index_dir, os.path.basename(log_path) + INDEX_SUFFIX)
+    return log_path + INDEX_SUFFIX
+
+
+# 解析一段日志，按 BLOCK_SIZE 记录每块首个事件的 (字节偏移, 时间戳, 段内行号)
+def _index_range(path: str, start: int, end: int):
+    cols = EventColumns()
+    blocks = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        count = max((end - start) // BLOCK_SIZE, 1)
+        for block_start, block_end in split_ranges(mm, end, count, start):
+            row = len(cols)
+            cols.extend(iter_packet_events(iter_marked_lines(mm, block_start, block_end)))
+            if len(cols) > row:
+                blocks.append((block_start, cols.ts[row], row))
+    return cols, blocks
+
+
+def _log_stat(log_path: str) -> dict:
+    st = os.stat(log_path)
+    return {'log_size': st.st_size, 'log_mtime_ns': st.st_mtime_ns}
+
+
+# 解析日志并写出索引，先写临时文件再替换
+def build_index(log_path: str, idx_path: str, workers: int = 1):
+    stat = _log_stat(log_path)
+    parts = map_ranges(log_path, workers, _index_range)
+    cols = EventColumns.concat(part[0] for part in parts)
+    blocks = []
+    row_base = 0
+    for part_cols, part_blocks in parts:
+        blocks.extend((offset, ts, row + row_base) for offset, ts, row in part_blocks)
+        row_base += len(part_cols)
+
+    arrays = cols.arrays()
+    arrays['block_offset'] = np.array([b[0] for b in blocks], dtype=np.int64)
+    arrays['block_ts'] = np.array([b[1] for b in blocks], dtype=np.int64)
+    arrays['block_row'] = np.array([b[2] for b in blocks], dtype=np.int64)
+
+    layout = []
+    offset = 0
+    for name, dtype in _ARRAYS:
+        nbytes = arrays[name].astype(dtype, copy=False).nbytes
+        layout.append([name, dtype, offset, len(arrays[name])])
+        offset += (nbytes + 7) // 8 * 8
+    header = json.dumps(dict(stat, version=INDEX_VERSION, block_size=BLOCK_SIZE, arrays=layout)).encode('utf-8')
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+    # index_dir 可能尚不存在
+    os.makedirs(os.path.dirname(os.path.abspath(idx_path)), exist_ok=True)
+    tmp_path = idx_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        for name, dtype in _ARRAYS:
+            data = arrays[name].astype(dtype, copy=False).tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, idx_path)
+
+
+class LogIndex:
+    # 内存映射打开索引；与日志的大小/修改时间不一致或格式不符时抛出 ValueError
+    def __init__(self, log_path: str, idx_path: str):
+        with open(idx_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是索引文件: {idx_path}")
+        header_len, = struct.unpack_from('<I', self._mm, len(MAGIC))
+        data_start = len(MAGIC) + 4 + header_len
+        header = json.loads(self._mm[len(MAGIC) + 4:data_start])
+        if header.get('version') != INDEX_VERSION:
+            raise ValueError(f"索引版本不符: {idx_path}")
+        if {key: header[key] for key in ('log_size', 'log_mtime_ns')} != _log_stat(log_path):
+            raise ValueError(f"日志已变化，索引失效: {idx_path}")
+        for name, dtype, offset, length in header['arrays']:
+            setattr(self, name, np.frombuffer(self._mm, dtype=dtype, count=length, offset=data_start + offset))
+
+    def __len__(self):
+        return len(self.ts)
+
+    # 与 EventColumns.arrays() 相同的列字典，rows 为 (起, 止) 行号区间
+    def arrays(self, rows=None) -> dict:
+        lo, hi = rows or (0, len(self))
+        return {'ts': self.ts[lo:hi], 'pktid': self.pktid[lo:hi], 'func': self.func[lo:hi], 'op': self.op[lo:hi]}
+
+    # 第一个时间戳不早于 ts_us 的事件行号：先在稀疏表中定位所在块，再在块内二分（日志按时间顺序写入）
+    def seek_row(self, ts_us: int) -> int:
+        j = int(np.searchsorted(self.block_ts, ts_us, side='left'))
+        if j == 0:
+            return 0
+        lo = int(self.block_row[j - 1])
+        hi = int(self.block_row[j]) if j < len(self.block_row) else len(self)
+        return lo + int(np.searchsorted(self.ts[lo:hi], ts_us, side='left'))
+
+    # 时间戳在 [start_us, end_us) 内的事件行号区间
+    def rows_between(self, start_us: int, end_us: int) -> tuple:
+        lo = self.seek_row(start_us)
+        return lo, max(lo, self.seek_row(end_us))
+
+    # 当天时间段 window=(start_us, end_us) 对应的行号区间，口径与 seek.window_span 相同：
+    # 起点提前 jitter 秒，终点延后 lookahead + jitter 秒；无法定位时返回 None
+    def window_rows(self, window, jitter: float, lookahead: float):
+        if window is None or window[0] > window[1] or not len(self):
+            return None
+        day = int(self.ts[0]) - int(self.ts[0]) % US_PER_DAY
+        return self.rows_between(day + window[0] - int(jitter * US_PER_SEC),
+                                 day + window[1] + int((lookahead + jitter) * US_PER_SEC) + 1)
+
+
+# 打开日志的索引，不存在或已失效时重新解析并写出
+def open_index(log_path: str, index_dir: str = '', workers: int = 1) -> LogIndex:
+    idx_path = index_path(log_path, index_dir)
+    if os.path.exists(idx_path):
+        try:
+            return LogIndex(log_path, idx_path)
+        except (ValueError, KeyError, struct.error):
+            pass
+    build_index(log_path, idx_path, workers)
+    return LogIndex(log_path, idx_path)
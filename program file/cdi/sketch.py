@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# 可合并的耗时草图（对数分桶直方图，DDSketch 思路）：每个分组只保存用到的连续桶区间（内存有上限），分位数相对误差有界，
+# 可序列化为 JSON 并在不同文件/服务器之间合并，无需重新解析原始日志
+#
+# 数量、最小、最大、均值、标准差为精确值（均值/方差按 Chan 并行公式合并），只有分位数是近似值：
+# 相对误差不超过 relative_accuracy（默认 1%），绝对值小于 MIN_VALUE 的值计入零桶
+#
+# 用法（合并多个草图文件并写出汇总表）:
+#   python sketch.py 输出前缀 a.sketch.json b.sketch.json ...
+import functools
+import json
+import math
+import sys
+
+import numpy as np
+
+from latency import summary_rows, write_summary_tables, parse_percentiles, DEFAULT_PERCENTILES
+
+DEFAULT_ACCURACY = 0.01
+# 可区分的最小值和最大值（秒）：1 微秒 ~ 约 115 天，超出上限的值计入最高的桶
+MIN_VALUE = 1e-6
+MAX_VALUE = 1e7
+SKETCH_VERSION = 1
+
+
+# 各精度的分桶参数 (log(gamma), 桶数, 各桶代表值)，同一精度的草图共用，代表值数组只读
+@functools.lru_cache(maxsize=None)
+def _layout(relative_accuracy: float) -> tuple:
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    log_gamma = math.log(gamma)
+    nbins = int(math.ceil(math.log(MAX_VALUE / MIN_VALUE) / log_gamma)) + 1
+    # 桶 i 覆盖 (MIN_VALUE * gamma^(i-1), MIN_VALUE * gamma^i]，代表值为区间内相对误差最小的点
+    reps = MIN_VALUE * 2 * np.power(gamma, np.arange(nbins)) / (gamma + 1)
+    reps.setflags(write=False)
+    return log_gamma, nbins, reps
+
+
+class LatencySketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy 必须在 0~1 之间: {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self._log_gamma, self._nbins, self._reps = _layout(relative_accuracy)
+        # 正值/负值的桶计数只保存用到的连续区间：数组第 0 个元素对应桶 offset，用到时才分配、按需扩展
+        self.pos = None
+        self.pos_offset = 0
+        self.neg = None
+        self.neg_offset = 0
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        # 附带的整数计数（请求量、应答量等），合并时相加
+        self.counters = {}
+
+    def _index(self, magnitude):
+        idx = np.ceil(np.log(np.asarray(magnitude) / MIN_VALUE) / self._log_gamma)
+        return np.clip(idx, 0, self._nbins - 1).astype(np.int64)
+
+    # 扩展正值或负值的桶区间到至少覆盖桶 [lo, hi]，返回 (计数数组, offset)；
+    # 每次扩展至少翻倍，逐个添加的值不会反复复制数组
+    def _cover(self, negative: bool, lo: int, hi: int) -> tuple:
+        bins, offset = (self.neg, self.neg_offset) if negative else (self.pos, self.pos_offset)
+        if bins is not None and offset <= lo and hi < offset + len(bins):
+            return bins, offset
+        if bins is None:
+            new_lo, new_hi = lo, hi
+        else:
+            end = offset + len(bins) - 1
+            new_lo = max(min(lo, offset - len(bins)), 0) if lo < offset else offset
+            new_hi = min(max(hi, end + len(bins)), self._nbins - 1) if hi > end else end
+        grown = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        if bins is not None:
+            grown[offset - new_lo:offset - new_lo + len(bins)] = bins
+        if negative:
+            self.neg, self.neg_offset = grown, new_lo
+        else:
+            self.pos, self.pos_offset = grown, new_lo
+        return grown, new_lo
+
+    # 桶编号 idx 中的每个编号在正值或负值的桶上计 1
+    def _add_bins(self, negative: bool, idx):
+        bins, offset = self._cover(negative, int(idx.min()), int(idx.max()))
+        added = np.bincount(idx - offset)
+        bins[:len(added)] += added
+
+    # 合并一组 (数量, 均值, M2, 最小, 最大) 到精确统计量
+    def _merge_moments(self, count: int, mean: float, m2: float, lo: float, hi: float):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = lo if self.min is None or lo < self.min else self.min
+        self.max = hi if self.max is None or hi > self.max else self.max
+
+    def add(self, value: float):
+        if value >= MIN_VALUE or value <= -MIN_VALUE:
+            negative = value < 0
+            i = min(max(int(math.ceil(math.log(abs(value) / MIN_VALUE) / self._log_gamma)), 0), self._nbins - 1)
+            bins, offset = self._cover(negative, i, i)
+            bins[i - offset] += 1
+        else:
+            self.zero += 1
+        self._merge_moments(1, value, 0.0, value, value)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        pos = values[values >= MIN_VALUE]
+        neg = values[values <= -MIN_VALUE]
+        if len(pos):
+            self._add_bins(False, self._index(pos))
+        if len(neg):
+            self._add_bins(True, self._index(-neg))
+        self.zero += len(values) - len(pos) - len(neg)
+        mean = float(values.mean())
+        dev = values - mean
+        self._merge_moments(len(values), mean, float(np.dot(dev, dev)), float(values.min()), float(values.max()))
+
+    def add_counters(self, **counts):
+        for name, value in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def merge(self, other: 'LatencySketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"草图精度不一致，无法合并: {self.relative_accuracy} != {other.relative_accuracy}")
+        for negative, bins, offset in ((False, other.pos, other.pos_offset), (True, other.neg, other.neg_offset)):
+            if bins is not None:
+                target, start = self._cover(negative, offset, offset + len(bins) - 1)
+                target[offset - start:offset - start + len(bins)] += bins
+        self.zero += other.zero
+        if other.count:
+            self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        self.add_counters(**other.counters)
+        return self
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    # 近似分位数（p 为 0~100），结果限制在精确的最小值和最大值之间
+    def percentiles(self, percentiles) -> list:
+        if not self.count:
+            return [0.0] * len(percentiles)
+        empty = np.zeros(0, dtype=np.int64)
+        neg = self.neg if self.neg is not None else empty
+        pos = self.pos if self.pos is not None else empty
+        counts = np.concatenate((neg[::-1], [self.zero], pos))
+        reps = np.concatenate((-self._reps[self.neg_offset:self.neg_offset + len(neg)][::-1], [0.0],
+                               self._reps[self.pos_offset:self.pos_offset + len(pos)]))
+        cum = np.cumsum(counts)
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (self.count - 1)
+        values = reps[np.searchsorted(cum, np.floor(ranks), side='right')]
+        return np.clip(values, self.min, self.max).tolist()
+
+    # 与 latency.summarize 每组结果同构的统计字典
+    def stats(self, percentiles=DEFAULT_PERCENTILES) -> dict:
+        entry = {'count': self.count, 'min': self.min or 0.0, 'max': self.max or 0.0, 'mean': self.mean,
+                 'std': self.std, 'percentiles': self.percentiles(percentiles)}
+        entry.update(self.counters)
+        return entry
+
+    def to_dict(self) -> dict:
+        return {'relative_accuracy': self.relative_accuracy, 'count': self.count, 'min': self.min,
+                'max': self.max, 'mean': self.mean, 'm2': self.m2, 'zero': self.zero,
+                'pos': _trim(self.pos, self.pos_offset), 'neg': _trim(self.neg, self.neg_offset),
+                'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencySketch':
+        sketch = cls(data['relative_accuracy'])
+        for name in ('count', 'min', 'max', 'mean', 'm2', 'zero'):
+            setattr(sketch, name, data[name])
+        for negative, name in ((False, 'pos'), (True, 'neg')):
+            if data[name]:
+                offset, counts = data[name]
+                bins, start = sketch._cover(negative, offset, offset + len(counts) - 1)
+                bins[offset - start:offset - start + len(counts)] = counts
+        sketch.counters = dict(data['counters'])
+        return sketch
+
+
+# 只序列化非零区间 [offset, counts]，offset 为 bins 第 0 个元素的桶编号
+def _trim(bins, offset: int = 0):
+    if bins is None:
+        return None
+    nonzero = np.flatnonzero(bins)
+    if not len(nonzero):
+        return None
+    return [offset + int(nonzero[0]), bins[nonzero[0]:nonzero[-1] + 1].tolist()]
+
+
+# 按 keys 分组把 values 并入 sketches（{key: LatencySketch}），参数含义与 latency.summarize 相同
+# mask 为 False 的行不计入耗时，但仍参与 sums 的计数
+def add_grouped(sketches: dict, keys, values, mask=None, sums=None, relative_accuracy=DEFAULT_ACCURACY) -> dict:
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=np.float64)
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    keep = np.ones(len(values), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+    order = np.argsort(inverse[keep], kind='stable')
+    grouped = values[keep][order]
+    bounds = np.searchsorted(inverse[keep][order], np.arange(len(uniq) + 1))
+    totals = {}
+    for name, column in (sums or {}).items():
+        total = np.zeros(len(uniq), dtype=np.int64)
+        np.add.at(total, inverse, np.asarray(column, dtype=np.int64))
+        totals[name] = total.tolist()
+
+    for i, key in enumerate(uniq.tolist()):
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = LatencySketch(relative_accuracy)
+        sketch.add_many(grouped[bounds[i]:bounds[i + 1]])
+        sketch.add_counters(**{name: total[i] for name, total in totals.items()})
+    return sketches
+
+
+# 各分组的统计字典，key 按升序排列
+def sketch_stats(sketches: dict, percentiles=DEFAULT_PERCENTILES) -> dict:
+    return {key: sketches[key].stats(percentiles) for key in sorted(sketches)}
+
+
+# 合并多组草图（{key: LatencySketch}），返回新的字典，不修改输入
+def merge_sketch_maps(maps) -> dict:
+    merged = {}
+    for sketches in maps:
+        for key, sketch in sketches.items():
+            target = merged.get(key)
+            if target is None:
+                target = merged[key] = LatencySketch(sketch.relative_accuracy)
+            target.merge(sketch)
+    return merged
+
+
+# 保存为 JSON；key 可以是整数（功能号）或字符串（时间段），按 [key, 草图] 列表保存以保留类型
+def save_sketches(path: str, sketches: dict):
+    data = {'version': SKETCH_VERSION,
+            'groups': [[key, sketches[key].to_dict()] for key in sorted(sketches)]}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def load_sketches(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != SKETCH_VERSION:
+        raise ValueError(f"不支持的草图文件版本: {path}")
+    return {key: LatencySketch.from_dict(sketch) for key, sketch in data['groups']}
+
+
+def main(argv):
+    if len(argv) < 3:
+        print("用法: python sketch.py 输出前缀 a.sketch.json b.sketch.json ... [--percentiles 50,90,99]")
+        return 1
+    percentiles = DEFAULT_PERCENTILES
+    if '--percentiles' in argv:
+        i = argv.index('--percentiles')
+        percentiles = parse_percentiles(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    out_base, paths = argv[1], argv[2:]
+    merged = merge_sketch_maps(load_sketches(path) for path in paths)
+    save_sketches(out_base + '.sketch.json', merged)
+    stats = sketch_stats(merged, percentiles)
+    counters = sorted({name for sketch in merged.values() for name in sketch.counters})
+    write_summary_tables(out_base, summary_rows(stats, percentiles, counters))
+    print(f"已合并 {len(paths)} 个草图文件，共 {len(merged)} 组，结果保存至 {out_base}.csv/.json")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# 流式请求关联：按日志时间的空闲超时（水位线）关闭请求并立即产出，
+# 内存占用只与在途请求数相关，而不是整个文件的请求总数
+#
+# 产出的记录与 chunked.scan_file 合并后的状态同构:
+#   (pktid, [func, AfterGet时间列表, 回复数, 第一个回复, 最后一个回复, 最大回复时间])
+# 超时足够大时，产出的记录及顺序与批量模式完全一致
+# with_seq 为 True 时每条记录另附首次出现的序号（即批量模式下该 pktid 在状态中的位置），供按其他键排序时稳定排序
+#
+# pair 模式下每个 AfterGet 是一笔独立的请求：同一 pktid 再次出现 AfterGet 时立即关闭上一笔，
+# 回复只配给它之前最近的一个 AfterGet，pktid 被复用时不会把早先的请求和很久以后的回复配在一起
+from collections import OrderedDict
+
+from pktparse import OP_AFTERGET, US_PER_DAY, US_PER_SEC
+
+_NOTHING = ()
+
+
+class StreamCorrelator:
+    # idle_timeout: 空闲超时秒数（日志时间），某 pktid 超过该时间没有新事件即关闭
+    # window: (start_us, end_us) 当天时间段，只统计落在其中的 AfterGet
+    # open_on_reply: 为 True 时回复也会建立条目（log_collect.py 的统计口径）
+    # pair: 为 True 时按 AfterGet 配对（见文件头），与 open_on_reply 互斥；idle_timeout 为 None 时只在文件结束或配对时关闭
+    # with_seq: 为 True 时产出 (pktid, 记录, 序号)
+    def __init__(self, idle_timeout, window=None, open_on_reply: bool = False, pair: bool = False,
+                 with_seq: bool = False):
+        if pair and open_on_reply:
+            raise ValueError("pair 与 open_on_reply 不能同时使用")
+        self.idle_timeout_us = int(idle_timeout * US_PER_SEC) if idle_timeout is not None else None
+        self.window = window
+        self.open_on_reply = open_on_reply
+        self.pair = pair
+        self.with_seq = with_seq
+        # pktid -> [seq, func, AfterGet列表, 回复数, 第一个, 最后一个, 最大值, 最近活动时间]，按最近活动排序
+        self.pending = OrderedDict()
+        self.watermark = None
+        self.seq = 0
+        self.orphan_replies = 0
+        self.closed_count = 0
+        self.timed_out = 0
+        self.peak_open = 0
+        # pair 模式下再次出现 AfterGet（复用）的次数
+        self.reused_pktids = 0
+
+    # 处理一个事件，返回因超时而关闭的记录（按首次出现顺序）
+    def feed(self, ts: int, op: int, pktid: int, func: int):
+        pending = self.pending
+        entry = pending.get(pktid)
+        if op == OP_AFTERGET and self.pair:
+            return self._pair(ts, pktid, func, entry)
+        if op == OP_AFTERGET:
+            if self.window and not (self.window[0] <= ts % US_PER_DAY <= self.window[1]):
+                return _NOTHING
+            if entry is None:
+                pending[pktid] = [self.seq, func, [ts], 0, None, None, None, ts]
+                self.seq += 1
+            else:
+                entry[2].append(ts)
+                entry[7] = ts
+                pending.move_to_end(pktid)
+        elif entry is not None:
+            entry[3] += 1
+            if entry[4] is None:
+                entry[4] = ts
+            entry[5] = ts
+            if entry[6] is None or ts > entry[6]:
+                entry[6] = ts
+            entry[7] = ts
+            pending.move_to_end(pktid)
+        elif self.open_on_reply:
+            pending[pktid] = [self.seq, func, [], 1, ts, ts, ts, ts]
+            self.seq += 1
+        else:
+            self.orphan_replies += 1
+
+        return self._advance(ts)
+
+    # pair 模式的 AfterGet：关闭同一 pktid 上一笔请求并开始新的一笔；时间段外的 AfterGet 也要开始新的一笔
+    # （AfterGet 列表为空，关闭时不产出），它之后的回复属于这笔不统计的请求
+    def _pair(self, ts: int, pktid: int, func: int, entry):
+        closed = []
+        if entry is not None:
+            self.reused_pktids += 1
+            closed.append((pktid, self.pending.pop(pktid)))
+        afterget = [ts] if not self.window or self.window[0] <= ts % US_PER_DAY <= self.window[1] else []
+        self.pending[pktid] = [self.seq, func, afterget, 0, None, None, None, ts]
+        self.seq += 1
+        evicted = self._advance(ts)
+        if not closed:
+            return evicted
+        return self._emit(closed) + list(evicted)
+
+    def _advance(self, ts: int):
+        if len(self.pending) > self.peak_open:
+            self.peak_open = len(self.pending)
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+        if self.idle_timeout_us is None:
+            return _NOTHING
+        return self._evict(self.watermark - self.idle_timeout_us)
+
+    # 没有新事件时推进水位线（如实时采集时以其他来源的最新日志时间为准），返回因此超时关闭的记录
+    def advance(self, ts: int):
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+        return self._evict(self.watermark - self.idle_timeout_us)
+
+    def _evict(self, limit: int):
+        pending = self.pending
+        if not pending or next(iter(pending.values()))[7] >= limit:
+            return _NOTHING
+        closed = []
+        while pending and next(iter(pending.values()))[7] < limit:
+            closed.append(pending.popitem(last=False))
+            if not closed[-1][1][3] and closed[-1][1][2]:
+                self.timed_out += 1
+        return self._emit(closed)
+
+    def _emit(self, closed: list) -> list:
+        if self.pair:
+            closed = [item for item in closed if item[1][2]]
+        closed.sort(key=lambda item: item[1][0])
+        self.closed_count += len(closed)
+        if self.with_seq:
+            return [(pktid, entry[1:7], entry[0]) for pktid, entry in closed]
+        return [(pktid, entry[1:7]) for pktid, entry in closed]
+
+    # 文件结束，关闭所有在途请求
+    def flush(self) -> list:
+        closed = list(self.pending.items())
+        self.pending.clear()
+        return self._emit(closed)
+
+
+# 将事件流 (ts_us, op, pktid, func) 转为关闭记录流
+def iter_closed(events, correlator: StreamCorrelator):
+    feed = correlator.feed
+    for ts, op, pktid, func in events:
+        closed = feed(ts, op, pktid, func)
+        if closed:
+            yield from closed
+    yield from correlator.flush()
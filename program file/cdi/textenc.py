@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# 日志编码识别：解析所需字段（时间戳、pktid、func、动作）都是 ASCII，编码兼容 ASCII 时直接在字节上匹配，
+# 编码只决定能否走字节快速路径，以及输出 Info 时如何解码。识别只读取文件中几个分散区域的样本，
+# 结果按文件和服务器保存在 JSON 缓存中，下次运行（或同一服务器的其他文件）直接复用
+import codecs
+import json
+import os
+
+# 样本区域数（文件头、尾及中间均匀分布的位置）和每个区域读取的字节数
+SAMPLE_REGIONS = 5
+SAMPLE_SIZE = 64 * 1024
+# 样本全是 ASCII 时无法区分，按本系统日志常用的 GBK 系编码处理（gb18030 兼容 gb2312/GBK）
+DEFAULT_ENCODING = 'gb18030'
+CACHE_VERSION = 1
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+         (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+
+# 判断编码是否兼容 ASCII，兼容时可直接在原始字节上匹配
+def is_ascii_compatible(encoding):
+    try:
+        return codecs.lookup(encoding or 'ascii').encode('[WritePacket]\n')[0] == b'[WritePacket]\n'
+    except LookupError:
+        return False
+
+
+# 按行产出原始字节；非 ASCII 兼容编码（如 UTF-16）先解码再转成 UTF-8 字节
+def iter_raw_lines(file_path, encoding):
+    if is_ascii_compatible(encoding):
+        with open(file_path, 'rb') as file:
+            yield from file
+    else:
+        with open(file_path, 'r', encoding=encoding, errors='replace') as file:
+            for line in file:
+                yield line.encode('utf-8')
+
+
+# 读取 regions 个区域的样本，除文件头外都去掉首尾不完整的行，避免把多字节字符截断
+def sample_regions(path: str, regions: int = SAMPLE_REGIONS, sample: int = SAMPLE_SIZE) -> list:
+    size = os.path.getsize(path)
+    samples = []
+    with open(path, 'rb') as f:
+        if size <= regions * sample:
+            return [f.read()]
+        for i in range(regions):
+            offset = (size - sample) * i // max(regions - 1, 1)
+            f.seek(offset)
+            data = f.read(sample)
+            start = data.find(b'\n') + 1 if offset else 0
+            end = data.rfind(b'\n') + 1 if offset + sample < size else len(data)
+            samples.append(data[start:end] if end > start else b'')
+    return samples
+
+
+def _decodes(samples, encoding: str) -> bool:
+    try:
+        for data in samples:
+            data.decode(encoding)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+# 识别文件编码：先看 BOM；文件头有 NUL 字节时按其位置判断 UTF-16 字节序；样本全是 ASCII 时取 DEFAULT_ENCODING；
+# 否则依次尝试 UTF-8、GB18030 严格解码全部样本，都不行时才用 chardet 猜测
+def detect_encoding(path: str, regions: int = SAMPLE_REGIONS, sample: int = SAMPLE_SIZE) -> str:
+    samples = sample_regions(path, regions, sample)
+    for bom, encoding in _BOMS:
+        if samples[0].startswith(bom):
+            return encoding
+    head = samples[0]
+    if b'\0' in head:
+        # 只用文件头判断，其他样本的起点按 '\n' 对齐，奇偶位置不可靠
+        return 'utf-16-be' if head[0::2].count(0) > head[1::2].count(0) else 'utf-16-le'
+    data = b''.join(samples)
+    if data.isascii():
+        return DEFAULT_ENCODING
+    for encoding in ('utf-8', 'gb18030'):
+        if _decodes(samples, encoding):
+            return encoding
+    import chardet
+    return chardet.detect(data)['encoding'] or DEFAULT_ENCODING
+
+
+# 缓存的编码与文件头是否相符：有 BOM 或 NUL 字节（UTF-16/32）时必须是非 ASCII 兼容编码，反之亦然
+def head_agrees(path: str, encoding: str) -> bool:
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    wide = b'\0' in head or any(head.startswith(bom) for bom, name in _BOMS if name != 'utf-8-sig')
+    return wide != is_ascii_compatible(encoding)
+
+
+class EncodingCache:
+    # 编码缓存文件：{'version', 'files': {绝对路径: 编码}, 'servers': {服务器: 编码}}；path 为空时只在内存中缓存
+    def __init__(self, path: str = ''):
+        self.path = path
+        self.files = {}
+        self.servers = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.files, self.servers = data['files'], data['servers']
+            except (ValueError, KeyError, OSError):
+                pass
+
+    # 文件的编码：依次查文件缓存、同一服务器的缓存（server 为文件名中的服务器编号，None 表示不按服务器复用），
+    # 都没有或与文件头不符时识别并记录
+    def resolve(self, log_path: str, server: str = None) -> str:
+        key = os.path.abspath(log_path)
+        encoding = self.files.get(key)
+        if encoding is None and server is not None:
+            encoding = self.servers.get(server)
+        if encoding is not None and not head_agrees(log_path, encoding):
+            encoding = None
+        if encoding is None:
+            encoding = detect_encoding(log_path)
+        if self.files.get(key) != encoding:
+            self.files[key] = encoding
+            self._dirty = True
+        if server is not None and server not in self.servers:
+            self.servers[server] = encoding
+            self._dirty = True
+        return encoding
+
+    # 有新记录时写回缓存文件，先写临时文件再替换
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'files': self.files, 'servers': self.servers}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
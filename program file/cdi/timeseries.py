@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# 按时间段汇总请求：接收时间（Unix 微秒）向下对齐到任意秒数的时间段，一次向量化分组得到
+# 每段的请求量、回复量、QPS 和耗时统计（均值/最大/分位数）；同一批数据可同时按多个粒度汇总
+from datetime import time
+
+import numpy as np
+
+from pktparse import US_PER_SEC, US_PER_DAY, time_of_day_us, format_ts
+from latency import summarize, percentile_label, DEFAULT_PERCENTILES
+
+
+# 解析时间段粒度：主粒度 interval 在前，resolutions 为逗号分隔的其他粒度（秒），去重后保持顺序
+def parse_widths(interval: int, resolutions: str = '') -> tuple:
+    widths = [interval] + [int(w) for w in (resolutions or '').replace('，', ',').split(',') if w.strip()]
+    for width in widths:
+        if width <= 0:
+            raise ValueError(f"时间段粒度必须大于 0 秒: {width}")
+    return tuple(dict.fromkeys(widths))
+
+
+# 由 'HH:MM:SS' 形式的开始/结束时间构造当天时间段 (start_us, end_us)，任一为空时不限制
+def parse_window(start_time: str, end_time: str):
+    if not start_time or not end_time:
+        return None
+    return time_of_day_us(time.fromisoformat(start_time)), time_of_day_us(time.fromisoformat(end_time))
+
+
+# 时间戳是否落在当天时间段内（含两端）；开始晚于结束时视为跨零点
+def in_window(ts_us, window):
+    tod = np.asarray(ts_us) % US_PER_DAY
+    start, end = window
+    if start <= end:
+        return (tod >= start) & (tod <= end)
+    return (tod >= start) | (tod <= end)
+
+
+# 时间段起点（Unix 微秒）
+def bucket_start(ts_us, width: int):
+    return ts_us - ts_us % (width * US_PER_SEC)
+
+
+# 按 width 秒的时间段汇总，返回 {起点微秒: latency.summarize 的统计 + req_count/reply_count/qps/reply_qps}
+def bucket_stats(recv_us, proc_time, reply_count, width: int, percentiles=DEFAULT_PERCENTILES, window=None) -> dict:
+    recv_us = np.asarray(recv_us, dtype=np.int64)
+    proc_time = np.asarray(proc_time, dtype=np.float64)
+    reply_count = np.asarray(reply_count, dtype=np.int64)
+    if window is not None:
+        keep = in_window(recv_us, window)
+        recv_us, proc_time, reply_count = recv_us[keep], proc_time[keep], reply_count[keep]
+    stats = summarize(bucket_start(recv_us, width), proc_time, percentiles,
+                      sums={'req_count': np.ones(len(recv_us), dtype=np.int64), 'reply_count': reply_count})
+    for entry in stats.values():
+        add_rates(entry, width)
+    return stats
+
+
+# 每段的请求/回复 QPS
+def add_rates(entry: dict, width: int) -> dict:
+    entry['qps'] = entry['req_count'] / width
+    entry['reply_qps'] = entry['reply_count'] / width
+    return entry
+
+
+# 时间段统计的输出行
+def format_interval(start_us: int, entry: dict, percentiles=DEFAULT_PERCENTILES) -> str:
+    tail = ''.join(f", {percentile_label(p)}: {value * 1000:.3f}ms" for p, value in zip(percentiles, entry['percentiles']))
+    return (f"interval: {format_ts(start_us)[:17]}, req_count: {entry['req_count']}, "
+            f"reply_count: {entry['reply_count']}, avg_proc_time: {entry['mean'] * 1000:.3f}ms, "
+            f"qps: {entry['qps']:.3f}, reply_qps: {entry['reply_qps']:.3f}, "
+            f"max_proc_time: {entry['max'] * 1000:.3f}ms{tail}\n")
+
+
+# 时间段统计的机器可读版本，耗时单位为秒
+def interval_rows(stats: dict, percentiles=DEFAULT_PERCENTILES) -> list:
+    rows = []
+    for start_us, entry in stats.items():
+        row = {'interval': format_ts(start_us)[:17], 'start_us': start_us, 'req_count': entry['req_count'],
+               'reply_count': entry['reply_count'], 'qps': entry['qps'], 'reply_qps': entry['reply_qps']}
+        for name in ('min', 'max', 'mean', 'std'):
+            row[f"{name}_s"] = entry[name]
+        for p, value in zip(percentiles, entry['percentiles']):
+            row[f"{percentile_label(p)}_s"] = value
+        rows.append(row)
+    return rows
+
+
+# 主粒度写入 intervals.txt，其他粒度写入 intervals_<秒数>s.txt
+def interval_file_base(width: int, main_width: int) -> str:
+    return 'intervals' if width == main_width else f'intervals_{width}s'
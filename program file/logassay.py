@@ -1,10 +1,37 @@
-# -*- coding: gb2312 -*-
-import re
-from datetime import datetime, time
+# -*- coding: utf-8 -*-
+import os
+import sys
+from array import array
+from datetime import time
 import configparser
 
-# 读取配置文件
-def read_config(config_path: str) -> tuple:
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cdi'))
+from pktparse import time_of_day_us, format_ts_ms, iter_packet_events, US_PER_SEC, US_PER_DAY
+from chunked import iter_file_events
+from columnar import EventColumns, load_columns, pair_requests, group_by_first_seen, NO_TS
+from latency import (summarize, summary_rows, write_summary_tables, parse_percentiles,
+                     percentile_label, DEFAULT_PERCENTILES)
+from streaming import StreamCorrelator, iter_closed
+from sketch import add_grouped, sketch_stats, save_sketches, DEFAULT_ACCURACY
+from batch import expand_sources, group_by_server, server_id, server_of, run_pool, SERVER_PATTERN
+from seek import window_span, DEFAULT_JITTER, DEFAULT_LOOKAHEAD
+from sidecar import open_index
+from export import EXPORT_FORMATS
+from outfiles import TextChunkWriter, COMPRESSIONS
+from textenc import EncodingCache, is_ascii_compatible, iter_raw_lines
+from anomaly import AnomalyDetector
+
+# 逐笔输出每批格式化的行数，也是送入慢请求检测的每批行数
+OUTPUT_BATCH = 65536
+# 逐笔输出的顺序
+OUTPUT_ORDERS = ('duration', 'time', 'none')
+# 慢请求检测需要的列
+ANOMALY_COLUMNS = ('pktid', 'func', 'afterget', 'last_put', 'put_count')
+
+# 读取并校验配置文件，返回设置字典（键名见函数末尾），时间段已换算为当天微秒 start_us/end_us（不限制时为 None）
+def read_config(config_path: str) -> dict:
     config = configparser.ConfigParser()
     try:
         config.read(config_path)
@@ -13,161 +40,457 @@ def read_config(config_path: str) -> tuple:
         summary_file = config.get('Paths', 'summary_file')
         start_time_str = config.get('TimeRange', 'start_time', fallback=None)
         end_time_str = config.get('TimeRange', 'end_time', fallback=None)
+        # 按时间段二分定位读取区间：(允许乱序秒数, 结束后继续读取的秒数)，不启用时为 None
+        seek = None
+        if config.getboolean('TimeRange', 'seek', fallback=False):
+            seek = (config.getfloat('TimeRange', 'jitter', fallback=DEFAULT_JITTER),
+                    config.getfloat('TimeRange', 'lookahead', fallback=DEFAULT_LOOKAHEAD))
+        workers = config.getint('Parallel', 'workers', fallback=1)
+        idle_timeout = config.getfloat('Stream', 'idle_timeout', fallback=0)
+        percentiles = parse_percentiles(config.get('Summary', 'percentiles', fallback=''))
+        backend = config.get('Summary', 'backend', fallback='exact')
+        relative_accuracy = config.getfloat('Summary', 'relative_accuracy', fallback=DEFAULT_ACCURACY)
+        batch_sources = config.get('Batch', 'sources', fallback='')
+        server_pattern = config.get('Batch', 'server_pattern', fallback='') or SERVER_PATTERN
+        # 索引目录：启用索引时为字符串（空串表示放在日志旁边），不启用时为 None
+        index_dir = None
+        if config.getboolean('Index', 'enabled', fallback=False):
+            index_dir = config.get('Index', 'index_dir', fallback='')
+        # 逐笔导出：(格式, 导出目录, 读取来源)，格式为空时不导出，读取来源不为空时从导出文件分析
+        export = (config.get('Export', 'format', fallback=''), config.get('Export', 'dir', fallback=''),
+                  config.get('Export', 'source', fallback=''))
+        # 逐笔输出的压缩方式：空为不压缩，gzip 或 zstd
+        compress = config.get('Output', 'compress', fallback='')
+        # 逐笔输出的顺序：duration 按耗时排序，time 按 AfterGet 时间（不排序），none 不写逐笔输出
+        order = config.get('Output', 'order', fallback='') or 'duration'
+        # 编码缓存文件：自动识别编码时为路径（空串表示放在 output_file 所在目录），不识别（按 gb2312 处理）时为 None
+        encoding_cache = None
+        if config.getboolean('Encoding', 'auto_detect', fallback=False):
+            encoding_cache = config.get('Encoding', 'cache_file', fallback='')
+        # 慢请求检测：启用时为 AnomalyDetector 的参数，不启用时为 None
+        anomaly = None
+        if config.getboolean('Anomaly', 'enabled', fallback=False):
+            anomaly = {'top_k': config.getint('Anomaly', 'top_k', fallback=100),
+                       'func_top_k': config.getint('Anomaly', 'func_top_k', fallback=20),
+                       'factor': config.getfloat('Anomaly', 'factor', fallback=3.0),
+                       'interval': config.getfloat('Anomaly', 'interval', fallback=60),
+                       'baseline_intervals': config.getint('Anomaly', 'baseline_intervals', fallback=5),
+                       'min_samples': config.getint('Anomaly', 'min_samples', fallback=50),
+                       'quantile': config.getfloat('Anomaly', 'quantile', fallback=99),
+                       'burst_window': config.getfloat('Anomaly', 'burst_window', fallback=10),
+                       'burst_min': config.getint('Anomaly', 'burst_min', fallback=20),
+                       'burst_ratio': config.getfloat('Anomaly', 'burst_ratio', fallback=0.5),
+                       'relative_accuracy': relative_accuracy}
     except (configparser.NoSectionError, configparser.NoOptionError) as e:
         print(f"配置文件错误: {e}")
         raise
+    if backend not in ('exact', 'sketch'):
+        raise ValueError(f"不支持的汇总方式: {backend}")
+    if export[0] and export[0] not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export[0]}")
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compress}")
+    if order not in OUTPUT_ORDERS:
+        raise ValueError(f"不支持的逐笔输出顺序: {order}，可选 {', '.join(OUTPUT_ORDERS)}")
+    if anomaly is not None:
+        # 参数不合法时在读取配置时报错
+        AnomalyDetector(**anomaly)
 
-    return log_file, output_file, summary_file, start_time_str, end_time_str
+    # 草图模式下的相对误差，精确模式为 None
+    sketch_accuracy = relative_accuracy if backend == 'sketch' else None
+
+    return {'log_file': log_file, 'output_file': output_file, 'summary_file': summary_file,
+            # 时间格式不合法时在读取配置时报错
+            'start_us': time_of_day_us(parse_time(start_time_str)), 'end_us': time_of_day_us(parse_time(end_time_str)),
+            'workers': workers, 'idle_timeout': idle_timeout, 'percentiles': percentiles,
+            'sketch_accuracy': sketch_accuracy, 'batch_sources': batch_sources, 'server_pattern': server_pattern,
+            'seek': seek, 'index_dir': index_dir, 'export': export, 'compress': compress,
+            'encoding_cache': encoding_cache, 'anomaly': anomaly, 'order': order}
 
 def parse_time(time_str: str) -> time:
     return time.fromisoformat(time_str) if time_str else None
 
-# 根据日志文件进行相关格式化筛选处理
-def process_log_line(line: str, pktid_times: dict, start_time: time, end_time: time):
-    match = re.search(
-        r'(\d{8} \d{2}:\d{2}:\d{2}\.\d{6}) \[WritePacket\]KSvrComm (AfterGet|Put|ReplyNull)\[pktid\((\d+)\)\], func: ?(\d+),.*',
-        line)
-    if not match:
-        return
+def make_window(start_us: int, end_us: int):
+    return (start_us, end_us) if start_us is not None and end_us is not None else None
 
-    timestamp_str, operation, pktid_str, func_str = match.groups()
-    timestamp = datetime.strptime(timestamp_str, '%Y%m%d %H:%M:%S.%f')
-    pktid = int(pktid_str)
-    func = func_str
-
-    if operation == 'AfterGet':
-        current_time = timestamp.time()
-        if start_time and end_time and not (start_time <= current_time <= end_time):
-            return  # 如果不在指定时间段内，跳过此记录
-
-        # 只有在指定时间段内的 AfterGet 才会被记录
-        if pktid not in pktid_times:
-            pktid_times[pktid] = {'func': func, 'AfterGet': [], 'Put': []}
-
-        pktid_times[pktid]['AfterGet'].append(timestamp)
-
-    # 对于 Put 或 ReplyNull，只记录那些已经在 pktid_times 中的 pktid
-    elif operation in ['Put', 'ReplyNull'] and pktid in pktid_times:
-        pktid_times[pktid]['Put'].append(timestamp)
-
-# 计算时间差，保存在列表中
-def calculate_time_diffs(pktid_times: dict) -> list:
-    time_diffs = []
-
-    for pktid, entries in pktid_times.items():
-        afterget_timestamps = entries['AfterGet']
-        put_timestamps = entries['Put']
-        func = entries['func']
-
-        if put_timestamps:
-            last_put_time = max(put_timestamps)
-            for afterget_time in afterget_timestamps:
-                duration = (last_put_time - afterget_time).total_seconds()
-                time_diffs.append({
-                    'pktid': pktid,
-                    'afterget_time': afterget_time,
-                    'last_put_time': last_put_time,
-                    'duration': duration,
-                    'status': '成功',
-                    'func': func
-                })
-        else:
-            for afterget_time in afterget_timestamps:
-                time_diffs.append({
-                    'pktid': pktid,
-                    'afterget_time': afterget_time,
-                    'last_put_time': None,
-                    'duration': None,
-                    'status': '统计失败',
-                    'func': func
-                })
-
-    return time_diffs
-
-# 将逐笔分析结果写入输出文件
-def write_output(output_file: str, time_diffs_sorted: list):
-    with open(output_file, 'w', encoding='gb2312') as cus:
-        for diff in time_diffs_sorted:
-            if diff['status'] == '成功':
-                cus.write(
-                    f"func: {diff['func']}, pktid: {diff['pktid']}, AfterGet: {diff['afterget_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, "
-                    f"Last Put: {diff['last_put_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, Duration: {diff['duration']} seconds, 状态: {diff['status']}\n")
-            else:
-                cus.write(
-                    f"func: {diff['func']}, pktid: {diff['pktid']}, AfterGet: {diff['afterget_time'].strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}, "
-                    f"Last Put: 无, Duration: 无, 状态: {diff['status']}\n")
+# 启用 seek 时只读取时间段对应的字节区间（见 cdi/seek.py），返回 None 表示读取整个文件
+# 时间段结束 lookahead 秒之后才到达的回复不再统计
+def seek_span(log_file: str, start_us: int, end_us: int, seek=None):
+    if seek is None:
+        return None
+    span = window_span(log_file, make_window(start_us, end_us), *seek)
+    if span is not None:
+        size = os.path.getsize(log_file)
+        print(f"时间段定位: 读取 {log_file} 的 [{span[0]}, {span[1]}) 字节，"
+              f"共 {(span[1] - span[0]) / 2 ** 20:.1f}MB / {size / 2 ** 20:.1f}MB")
+    return span
 
-# 计算功能统计信息，并保存在字典中
-def calculate_func_stats(pktid_times: dict) -> dict:
-    func_stats = {}
+# 从索引读取事件列，启用 seek 时只取时间段对应的行
+def load_indexed_events(log_file: str, start_us: int, end_us: int, workers: int = 1, seek=None, index_dir: str = ''):
+    log_index = open_index(log_file, index_dir, workers)
+    rows = log_index.window_rows(make_window(start_us, end_us), *seek) if seek is not None else None
+    return log_index.arrays(rows)
+
+# 识别日志文件的编码（见 cdi/textenc.py），cache_path 为 None 时不识别，按兼容 ASCII 的 gb2312 处理
+def resolve_encodings(paths, output_file: str, cache_path=None, pattern: str = SERVER_PATTERN) -> dict:
+    if cache_path is None:
+        return {path: 'gb2312' for path in paths}
+    cache = EncodingCache(cache_path or os.path.join(os.path.dirname(os.path.abspath(output_file)), 'encoding_cache.json'))
+    encodings = {path: cache.resolve(path, server_id(path, pattern)) for path in paths}
+    cache.save()
+    return encodings
+
+# 编码不兼容 ASCII（如 UTF-16）时逐行转码为 UTF-8 后解析，不能内存映射分块，也不使用索引和时间段定位
+def load_text_events(log_file: str, encoding: str) -> dict:
+    cols = EventColumns()
+    cols.extend(iter_packet_events(iter_raw_lines(log_file, encoding)))
+    return cols.arrays()
+
+# 解析日志文件并向量化配对：每个 AfterGet 与其后、同一 pktid 下一个 AfterGet 之前的 Put/ReplyNull 配成一笔请求，
+# 只记录指定时间段内的 AfterGet；pktid 被复用时早先的请求不会配上很久以后的应答
+# 返回 (pktids, requests) 两组列：每笔请求一行的 func/put_count（配对后每笔请求单独计算应答数），
+# 以及每个 AfterGet 一行的 pktid/func/afterget/first_put/last_put/put_count；时间均为整数微秒
+# workers > 1 时内存映射分块多进程解析，结果与单进程一致
+# index_dir 不为 None 时使用日志旁的 .idx 索引（见 cdi/sidecar.py），索引有效时完全跳过文本解析
+# detector 不为 None 时配对结果（按 AfterGet 顺序）分批送入慢请求检测
+def load_request_columns(log_file: str, start_us: int, end_us: int, workers: int = 1, seek=None,
+                         index_dir=None, encoding: str = 'gb2312', detector=None) -> tuple:
+    if not is_ascii_compatible(encoding):
+        events = load_text_events(log_file, encoding)
+    elif index_dir is not None:
+        events = load_indexed_events(log_file, start_us, end_us, workers, seek, index_dir)
+    else:
+        events = load_columns(log_file, workers, seek_span(log_file, start_us, end_us, seek)).arrays()
+    pktids, requests = paired_columns(pair_requests(events, make_window(start_us, end_us)))
+    if detector is not None:
+        for chunk in iter_merged_runs(requests, [0, len(requests['pktid'])]):
+            detector.add(chunk)
+    return pktids, requests
 
-    for entries in pktid_times.values():
-        afterget_timestamps = entries['AfterGet']
-        put_timestamps = entries['Put']
-        func = entries['func']
+# columnar.pair_requests 的结果转为 (pktids, requests) 两组列，并输出 pktid 复用和孤立应答数
+def paired_columns(pairs: dict) -> tuple:
+    print(f"请求配对: {len(pairs['pktid'])} 笔请求，pktid 复用 {pairs['reused_pktids']} 次，"
+          f"孤立应答 {pairs['orphan_replies']} 个")
+    requests = {
+        'pktid': pairs['pktid'],
+        'func': pairs['func'],
+        'afterget': pairs['afterget'],
+        'first_put': pairs['first_reply'],
+        'last_put': pairs['max_reply'],
+        'put_count': pairs['reply_count'],
+    }
+    return {'func': requests['func'], 'put_count': requests['put_count']}, requests
 
-        if func not in func_stats:
-            func_stats[func] = {
-                'durations': [],
-                'request_count': 0,
-                'response_count': 0
-            }
+# 流式解析：配对口径与 load_request_columns 相同，同一 pktid 的下一个 AfterGet 到来时上一笔请求立即关闭，
+# pktid 空闲超过 idle_timeout 秒（日志时间）也会关闭；每个事件的处理都是常数时间，
+# 内存只与在途请求数和每笔请求 41 字节的列相关；detector 不为 None 时关闭的请求每攒够 OUTPUT_BATCH 笔送入慢请求检测一次
+def stream_request_columns(log_file: str, start_us: int, end_us: int, idle_timeout: float, seek=None,
+                           index_dir=None, encoding: str = 'gb2312', detector=None) -> tuple:
+    rq_pktid, rq_func, rq_afterget, rq_count = array('Q'), array('i'), array('q'), array('q')
+    rq_first_put, rq_last_put = array('q'), array('q')
+    correlator = StreamCorrelator(idle_timeout, make_window(start_us, end_us), pair=True)
+    if not is_ascii_compatible(encoding):
+        events = iter_packet_events(iter_raw_lines(log_file, encoding))
+    elif index_dir is not None:
+        cols = load_indexed_events(log_file, start_us, end_us, 1, seek, index_dir)
+        events = zip(*(cols[name].tolist() for name in ('ts', 'op', 'pktid', 'func')))
+    else:
+        events = iter_file_events(log_file, seek_span(log_file, start_us, end_us, seek))
+    columns = (('pktid', rq_pktid, np.uint64), ('func', rq_func, np.int32), ('afterget', rq_afterget, np.int64),
+               ('last_put', rq_last_put, np.int64), ('put_count', rq_count, np.int64))
+    fed = 0
+    for pktid, (func, (afterget_time,), put_count, first_put, _, last_put) in iter_closed(events, correlator):
+        rq_pktid.append(pktid)
+        rq_func.append(func)
+        rq_afterget.append(afterget_time)
+        rq_first_put.append(first_put if put_count else NO_TS)
+        rq_last_put.append(last_put if put_count else NO_TS)
+        rq_count.append(put_count)
+        if detector is not None and len(rq_pktid) - fed >= OUTPUT_BATCH:
+            # 切片是新的 array，不会锁住仍在追加的列
+            detector.add({name: np.frombuffer(column[fed:], dtype=dtype) for name, column, dtype in columns})
+            fed = len(rq_pktid)
+    if detector is not None and len(rq_pktid) > fed:
+        detector.add({name: np.frombuffer(column[fed:], dtype=dtype) for name, column, dtype in columns})
+    print(f"流式配对: 关闭请求 {correlator.closed_count} 个，其中超时无应答 {correlator.timed_out} 个，"
+          f"在途 pktid 峰值 {correlator.peak_open}，pktid 复用 {correlator.reused_pktids} 次，"
+          f"孤立应答 {correlator.orphan_replies} 个")
+    requests = {
+        'pktid': np.frombuffer(rq_pktid, dtype=np.uint64),
+        'func': np.frombuffer(rq_func, dtype=np.int32),
+        'afterget': np.frombuffer(rq_afterget, dtype=np.int64),
+        'first_put': np.frombuffer(rq_first_put, dtype=np.int64),
+        'last_put': np.frombuffer(rq_last_put, dtype=np.int64),
+        'put_count': np.frombuffer(rq_count, dtype=np.int64),
+    }
+    # 请求按关闭顺序产出，按 AfterGet 时间稳定排序后与批量模式的文件顺序一致
+    order = np.argsort(requests['afterget'], kind='stable')
+    requests = {name: column[order] for name, column in requests.items()}
+    return {'func': requests['func'], 'put_count': requests['put_count']}, requests
 
-        func_stats[func]['request_count'] += len(afterget_timestamps)
-        func_stats[func]['response_count'] += len(put_timestamps)
+# 按照状态是否为“成功”进行排序，如果是“成功”，则按时间差从大到小排序（稳定排序，与原逐笔排序一致）
+def sort_requests(requests: dict):
+    failed = requests['put_count'] == 0
+    duration_us = np.where(failed, 0, requests['last_put'] - requests['afterget'])
+    return np.lexsort((-duration_us, failed))
 
-        if put_timestamps:
-            last_put_time = max(put_timestamps)
-            func_stats[func]['durations'].extend(
-                (last_put_time - t).total_seconds() for t in afterget_timestamps
-            )
+# 将逐笔分析结果按 order 的顺序写入输出文件：每次取一批行的列转成列表，时间戳由整数微秒按秒缓存格式化，
+# 整批拼接、编码后写出；compress 为 gzip/zstd 时写出 output_file.gz/.zst
+def write_output(output_file: str, requests: dict, order, compress: str = '', batch: int = OUTPUT_BATCH):
+    with TextChunkWriter(output_file, compress=compress) as cus:
+        for start in range(0, len(order), batch):
+            rows = order[start:start + batch]
+            columns = [requests[name][rows].tolist() for name in ('pktid', 'func', 'afterget', 'last_put', 'put_count')]
+            lines = []
+            for pktid, func, afterget_time, last_put_time, put_count in zip(*columns):
+                if put_count:
+                    lines.append(f"func: {func}, pktid: {pktid}, AfterGet: {format_ts_ms(afterget_time)}, "
+                                 f"Last Put: {format_ts_ms(last_put_time)}, "
+                                 f"Duration: {(last_put_time - afterget_time) / US_PER_SEC} seconds, 状态: 成功\n")
+                else:
+                    lines.append(f"func: {func}, pktid: {pktid}, AfterGet: {format_ts_ms(afterget_time)}, "
+                                 f"Last Put: 无, Duration: 无, 状态: 统计失败\n")
+            cus.writelines(lines)
 
+# 按 order（duration/time/none）写出逐笔结果；只有 duration 需要对全部请求排序
+def write_requests(output_file: str, requests: dict, order: str = 'duration', compress: str = ''):
+    if order == 'none':
+        return
+    rows = sort_requests(requests) if order == 'duration' else np.arange(len(requests['pktid']))
+    write_output(output_file, requests, rows, compress)
+
+# 归并若干段各自按 AfterGet 时间排列的请求（如批量模式中各文件的结果），按时间顺序每次产出一批慢请求检测所需的列；
+# bounds 为各段的起点，末尾为总行数。每轮以各段下一批末行时间中最早的为界，各段取出不晚于它的行，
+# 只对这一轮取出的行排序（只有一段时不排序），不对全部请求排序
+def iter_merged_runs(requests: dict, bounds, batch: int = OUTPUT_BATCH):
+    afterget = requests['afterget']
+    pos, ends = [int(b) for b in bounds[:-1]], [int(b) for b in bounds[1:]]
+    while True:
+        live = [i for i in range(len(pos)) if pos[i] < ends[i]]
+        if not live:
+            return
+        limits = {i: min(pos[i] + batch, ends[i]) for i in live}
+        first = min(live, key=lambda i: afterget[limits[i] - 1])
+        cutoff = afterget[limits[first] - 1]
+        pieces = []
+        for i in live:
+            if i == first:
+                stop = limits[i]
+            else:
+                stop = pos[i] + int(np.searchsorted(afterget[pos[i]:limits[i]], cutoff, side='right'))
+            if stop > pos[i]:
+                pieces.append(np.arange(pos[i], stop))
+                pos[i] = stop
+        if len(pieces) == 1:
+            rows = slice(int(pieces[0][0]), int(pieces[0][-1]) + 1)
+        else:
+            rows = np.concatenate(pieces)
+            rows = rows[np.argsort(afterget[rows], kind='stable')]
+        yield {name: requests[name][rows] for name in ANOMALY_COLUMNS}
+
+# 写出慢请求检测结果到 output_file 所在目录的 slow_requests.txt/.json，返回 .txt 的路径
+def write_anomalies(output_file: str, detector: AnomalyDetector) -> str:
+    base = os.path.join(os.path.dirname(output_file), 'slow_requests')
+    detector.write(base)
+    return base + '.txt'
+
+# 计算功能统计信息，并保存在字典中；功能按首次出现的顺序排列
+# 耗时统计（最大/最小/平均/标准差/分位数）由 latency.summarize 按功能分组向量化计算；
+# sketch_accuracy 不为 None 时改用可合并的耗时草图，分位数为近似值，草图放在 'sketch' 中
+def calculate_func_stats(pktids: dict, requests: dict, percentiles=DEFAULT_PERCENTILES, sketch_accuracy=None) -> dict:
+    funcs, pk_group = group_by_first_seen(pktids['func'])
+    response_counts = np.zeros(len(funcs), dtype=np.int64)
+    np.add.at(response_counts, pk_group, pktids['put_count'])
+
+    ok = requests['put_count'] > 0
+    durations = (requests['last_put'] - requests['afterget']) / US_PER_SEC
+    sums = {'request_count': np.ones(len(durations), dtype=np.int64)}
+    if sketch_accuracy is None:
+        sketches = None
+        latency = summarize(requests['func'], durations, percentiles, mask=ok, sums=sums)
+    else:
+        sketches = add_grouped({}, requests['func'], durations, mask=ok, sums=sums, relative_accuracy=sketch_accuracy)
+        latency = sketch_stats(sketches, percentiles)
+
+    func_stats = {}
+    for func, response_count in zip(funcs.tolist(), response_counts.tolist()):
+        func_stats[func] = {
+            'latency': latency[func],
+            'request_count': latency[func]['request_count'],
+            'response_count': response_count
+        }
+        if sketches is not None:
+            sketches[func].add_counters(response_count=response_count)
+            func_stats[func]['sketch'] = sketches[func]
     return func_stats
 
-# 将功能统计信息写入汇总文件
-def write_summary(summary_file: str, func_stats: dict):
+# 将功能统计信息写入汇总文件，并在旁边写出同名 .csv/.json 供程序读取；
+# 草图模式下另存同名 .sketch.json，可用 cdi/sketch.py 跨文件合并
+def write_summary(summary_file: str, func_stats: dict, percentiles=DEFAULT_PERCENTILES):
     with open(summary_file, 'w', encoding='gb2312') as f:
         for func, stats in func_stats.items():
-            durations = stats['durations']
+            latency = stats['latency']
             request_count = stats['request_count']
             response_count = stats['response_count']
-            max_duration = max(durations, default=0)
-            min_duration = min(durations, default=0)
-            avg_duration = sum(durations) / len(durations) if durations else 0
-            f.write(f"功能: {func}, 最大耗时: {max_duration:.6f}s, 最小耗时: {min_duration:.6f}s, 平均耗时: {avg_duration:.6f}s, 请求量: {request_count}, 应答量: {response_count}\n")
-
-# 读取配置文件
-config_path = 'LogAssay.ini'
-try:
-    log_file, output_file, summary_file, start_time_str, end_time_str = read_config(config_path)
-    start_time = parse_time(start_time_str)
-    end_time = parse_time(end_time_str)
-except Exception as e:
-    print(f"无法读取配置文件: {e}")
-    exit(1)
-
-# 创建一个字典来存储每个 pktid 的所有时间戳
-pktid_times = {}
-
-# 读取日志文件，并使用检测到的编码
-with open(log_file, 'r', encoding='gb2312', errors='replace') as file:
-    for line in file:
-        process_log_line(line, pktid_times, start_time, end_time)
-
-# 计算时间差
-time_diffs = calculate_time_diffs(pktid_times)
-
-# 按照状态是否为“成功”进行排序，如果是“成功”，则按时间差从大到小排序
-time_diffs_sorted = sorted(time_diffs, key=lambda x: (x['status'] == '统计失败', -(x['duration'] or 0)))
-
-# 将结果写入输出文件
-write_output(output_file, time_diffs_sorted)
-
-# 统计每种功能的信息
-func_stats = calculate_func_stats(pktid_times)
-
-# 写入汇总结果
-write_summary(summary_file, func_stats)
-
-print(f"日志分析【逐笔请求】结果已保存至 {output_file}")
-print(f"日志分析【汇总结果】已保存至 {summary_file}")
+            tail = ''.join(f", {percentile_label(p)}: {value:.6f}s" for p, value in zip(percentiles, latency['percentiles']))
+            f.write(f"功能: {func}, 最大耗时: {latency['max']:.6f}s, 最小耗时: {latency['min']:.6f}s, 平均耗时: {latency['mean']:.6f}s, "
+                    f"请求量: {request_count}, 应答量: {response_count}, 标准差: {latency['std']:.6f}s{tail}\n")
+
+    rows = summary_rows({func: dict(stats['latency'], response_count=stats['response_count'])
+                         for func, stats in func_stats.items()},
+                        percentiles, ('request_count', 'response_count'))
+    write_summary_tables(os.path.splitext(summary_file)[0], rows)
+    sketches = {func: stats['sketch'] for func, stats in func_stats.items() if 'sketch' in stats}
+    if sketches:
+        save_sketches(os.path.splitext(summary_file)[0] + '.sketch.json', sketches)
+
+# 按文件顺序拼接多个文件的 (pktids, requests) 列，各文件的请求关联互不影响
+def concat_columns(parts: list) -> tuple:
+    pktids = {name: np.concatenate([part[0][name] for part in parts]) for name in ('func', 'put_count')}
+    requests = {name: np.concatenate([part[1][name] for part in parts])
+                for name in ('pktid', 'func', 'afterget', 'first_put', 'last_put', 'put_count')}
+    return pktids, requests
+
+# 把一个日志文件的逐笔请求（每个 AfterGet 一行）导出为列式文件，按 日期/服务器/功能 分区（见 cdi/export.py）
+# export 为 (格式, 目录)，目录为空时写在 output_file 所在目录的 export/ 下
+def export_requests(requests: dict, log_file: str, output_file: str, export: tuple, pattern: str = SERVER_PATTERN):
+    from export import write_requests
+    fmt, directory = export[:2]
+    directory = directory or os.path.join(os.path.dirname(os.path.abspath(output_file)), 'export')
+    write_requests({'pktid': requests['pktid'], 'func': requests['func'], 'recv_time': requests['afterget'],
+                    'first_reply': requests['first_put'], 'last_reply': requests['last_put'],
+                    'reply_count': requests['put_count']}, directory, server_of(log_file, pattern), log_file, fmt)
+    print(f"已导出 {log_file} 的 {len(requests['pktid'])} 笔请求至 {directory}")
+
+# 从导出的列式文件读回 (pktids, requests) 两组列，不再解析日志；导出的每一行就是一笔配对好的请求，
+# 行按 来源文件、AfterGet 时间排列，与直接解析日志时的顺序一致
+def load_exported_columns(source: str, fmt: str, start_us: int, end_us: int) -> tuple:
+    from export import read_requests
+    data = read_requests(source, fmt or 'parquet')
+    window = make_window(start_us, end_us)
+    if window is not None:
+        tod = data['recv_time'] % US_PER_DAY
+        keep = (tod >= window[0]) & (tod <= window[1])
+        data = {name: column[keep] for name, column in data.items()}
+
+    sources, source_code = np.unique(data['source'], return_inverse=True)
+    order = np.lexsort((data['recv_time'], source_code.reshape(-1)))
+    data = {name: column[order] for name, column in data.items()}
+    requests = {'pktid': data['pktid'], 'func': data['func'], 'afterget': data['recv_time'],
+                'first_put': data['first_reply'], 'last_put': data['last_reply'], 'put_count': data['reply_count']}
+    print(f"已从 {source} 读取 {len(sources)} 个日志文件的 {len(requests['pktid'])} 笔请求")
+    return {'func': requests['func'], 'put_count': requests['put_count']}, requests
+
+# 批量模式的单个文件（在工作进程中单进程解析），encodings 为 {路径: 编码}
+def load_file_columns(log_file: str, encodings: dict, start_us: int, end_us: int, seek=None, index_dir=None) -> tuple:
+    return load_request_columns(log_file, start_us, end_us, 1, seek, index_dir, encodings[log_file])
+
+# 批量分析：每个文件在进程池中独立解析和关联，按服务器写出逐笔结果和汇总到
+# 输出文件所在目录下的 <服务器>/ 子目录，全部服务器合并后写到配置的 output_file/summary_file
+def run_batch(sources: str, output_file: str, summary_file: str, start_us: int, end_us: int, workers: int,
+              percentiles=DEFAULT_PERCENTILES, sketch_accuracy=None, pattern: str = SERVER_PATTERN, seek=None,
+              index_dir=None, export=None, compress='', encoding_cache=None, anomaly=None, order='duration'):
+    paths = expand_sources(sources)
+    if not paths:
+        print(f"未找到日志文件: {sources}")
+        return
+    print(f"批量分析 {len(paths)} 个文件，进程数 {workers}")
+    # 编码在主进程中统一识别，缓存文件只由主进程写
+    encodings = resolve_encodings(paths, output_file, encoding_cache, pattern)
+    results = dict(run_pool(load_file_columns, paths, workers, encodings, start_us, end_us, seek, index_dir))
+    if export is not None and export[0]:
+        for path in paths:
+            export_requests(results[path][1], path, output_file, export, pattern)
+
+    servers = group_by_server(paths, pattern)
+    for server, server_paths in list(servers.items()) + [(None, paths)]:
+        pktids, requests = concat_columns([results[path] for path in server_paths])
+        if server is None:
+            server_output, server_summary = output_file, summary_file
+        else:
+            server_output = os.path.join(os.path.dirname(output_file), server, os.path.basename(output_file))
+            server_summary = os.path.join(os.path.dirname(summary_file), server, os.path.basename(summary_file))
+            os.makedirs(os.path.dirname(server_output), exist_ok=True)
+            os.makedirs(os.path.dirname(server_summary), exist_ok=True)
+        write_requests(server_output, requests, order, compress)
+        write_summary(server_summary, calculate_func_stats(pktids, requests, percentiles, sketch_accuracy), percentiles)
+        if anomaly is not None:
+            # 各文件的请求已按 AfterGet 时间排列，归并后送入检测
+            detector = AnomalyDetector(**anomaly)
+            bounds = np.cumsum([0] + [len(results[path][1]['pktid']) for path in server_paths])
+            for chunk in iter_merged_runs(requests, bounds):
+                detector.add(chunk)
+            write_anomalies(server_output, detector)
+    print(f"已写出 {len(servers)} 个服务器的分析结果及合并结果")
+
+# config_path 默认为当前目录下的 LogAssay.ini；返回退出码
+def main(config_path: str = 'LogAssay.ini') -> int:
+    # 读取配置文件
+    try:
+        settings = read_config(config_path)
+    except Exception as e:
+        print(f"无法读取配置文件: {e}")
+        return 1
+    return run(settings)
+
+# 按 read_config 返回的设置运行分析（cli.py 在入口读取、校验配置后直接调用，不再重复读取）；返回退出码
+def run(settings: dict) -> int:
+    log_file, output_file, summary_file = settings['log_file'], settings['output_file'], settings['summary_file']
+    start_us, end_us = settings['start_us'], settings['end_us']
+    seek, index_dir, export = settings['seek'], settings['index_dir'], settings['export']
+    encoding_cache, server_pattern = settings['encoding_cache'], settings['server_pattern']
+    percentiles, sketch_accuracy = settings['percentiles'], settings['sketch_accuracy']
+    anomaly, order = settings['anomaly'], settings['order']
+
+    if settings['batch_sources'].strip():
+        # 多文件/多服务器批量分析
+        run_batch(settings['batch_sources'], output_file, summary_file, start_us, end_us, settings['workers'],
+                  percentiles, sketch_accuracy, server_pattern, seek, index_dir, export, settings['compress'],
+                  encoding_cache, anomaly, order)
+        return 0
+
+    # 慢请求检测在构造请求列时分批进行
+    detector = AnomalyDetector(**anomaly) if anomaly is not None else None
+
+    if export[2]:
+        # 从已导出的列式文件分析，不解析日志
+        pktids, requests = load_exported_columns(export[2], export[0], start_us, end_us)
+        if detector is not None:
+            # 导出的请求按 来源文件、AfterGet 时间排列，时间回退处即下一个文件的开始
+            afterget = requests['afterget']
+            bounds = np.concatenate(([0], np.flatnonzero(afterget[1:] < afterget[:-1]) + 1, [len(afterget)]))
+            for chunk in iter_merged_runs(requests, bounds):
+                detector.add(chunk)
+    elif settings['idle_timeout'] > 0:
+        # 流式关联：pktid 关闭后只保留紧凑的请求列
+        encoding = resolve_encodings([log_file], output_file, encoding_cache, server_pattern)[log_file]
+        pktids, requests = stream_request_columns(log_file, start_us, end_us, settings['idle_timeout'], seek,
+                                                  index_dir, encoding, detector)
+    else:
+        # 编码兼容 ASCII 时以二进制方式读取日志文件，所需字段均为 ASCII，无需逐行解码
+        encoding = resolve_encodings([log_file], output_file, encoding_cache, server_pattern)[log_file]
+        pktids, requests = load_request_columns(log_file, start_us, end_us, settings['workers'], seek, index_dir,
+                                                encoding, detector)
+    if export[0] and not export[2]:
+        export_requests(requests, log_file, output_file, export, server_pattern)
+
+    # 按 [Output] order 将结果写入输出文件（默认按耗时排序）
+    write_requests(output_file, requests, order, settings['compress'])
+
+    # 统计每种功能的信息
+    func_stats = calculate_func_stats(pktids, requests, percentiles, sketch_accuracy)
+
+    # 写入汇总结果
+    write_summary(summary_file, func_stats, percentiles)
+
+    if order != 'none':
+        print(f"日志分析【逐笔请求】结果已保存至 {output_file}")
+    print(f"日志分析【汇总结果】已保存至 {summary_file}")
+
+    if detector is not None:
+        print(f"日志分析【慢请求检测】已保存至 {write_anomalies(output_file, detector)}")
+    return 0
+
+# 多进程解析时子进程会重新导入本模块，入口必须放在 __main__ 判断之下
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else 'LogAssay.ini'))